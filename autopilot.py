@@ -0,0 +1,391 @@
+import sys
+import random
+from collections import deque
+import pygame
+from settings import *
+from boss import Cowboy
+from shop import UPGRADE_COSTS
+from controls import InputProvider, KEY_BITS
+
+
+# A bot that plays the whole game hands-free, in place of the keyboard, for long sessions of realistic load
+# It only looks at what a player could see: the sprites in the level's groups, the shop, and the game data
+#
+# Each tick it:
+#  - shoots at the nearest enemy (in whichever of the 8 directions is closest), using a stored powerup when crowded
+#  - picks a goal: the next upgrade it can afford when in a shop, the exit once the level is completed (and there's
+#    nothing left to buy), otherwise the nearest drop that's safe to get to, or the middle of the map. Once no more
+#    enemies are coming, any left (e.g. a spikeball deployed behind a fence) are hunted down from a tile they can be
+#    shot from, in a straight line with nothing in the way
+#  - moves in whichever of the 8 directions (or standing still) best trades getting closer to the goal (by walking
+#    distance around obstacles) against getting closer to enemies & their bullets, so it kites enemies that get close
+# Drops are pulled in once a player is within their `magnet_radius`, so a drop's goal is reached from that far away
+# The boss is behind a fence across a river, so on boss levels it lines up with where the boss will be by the time a
+# bullet fired straight down gets there, and fires at that
+
+# The tiles along the bottom of the map that become the exit once a level is completed
+EXIT_TILES = [(7, TILES_HIGH - 1), (8, TILES_HIGH - 1), (9, TILES_HIGH - 1)]
+EXIT_COLUMNS = {x for x, _ in EXIT_TILES}
+TILE_PIXELS = TILE_SIZE * ZOOM_FACTOR
+BULLET_SPEED = 150 * ZOOM_FACTOR  # As in sprites.Bullet
+
+MOVES = [(0, 0), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+MOVE_KEYS = {(0, -1): pygame.K_w, (0, 1): pygame.K_s, (-1, 0): pygame.K_a, (1, 0): pygame.K_d}
+FIRE_KEYS = {(0, -1): pygame.K_UP, (0, 1): pygame.K_DOWN, (-1, 0): pygame.K_LEFT, (1, 0): pygame.K_RIGHT}
+
+
+def direction_mask(direction, keys):
+    # The keys to press to go (or fire) in one of the 8 directions
+
+    mask = 0
+    for axis in [(direction[0], 0), (0, direction[1])]:
+        if axis != (0, 0):
+            mask |= KEY_BITS[keys[axis]]
+    return mask
+
+
+def nearest_direction(vector):
+    # Which of the 8 directions is closest to the vector's
+
+    if vector.length_squared() == 0:
+        return 0, 0
+    angle = pygame.math.Vector2(1, 0).angle_to(vector)
+    return MOVES[1 + round((angle + 90) / 45) % 8]
+
+
+def tile_of(pos):
+
+    return int(pos[0] // TILE_PIXELS), int(pos[1] // TILE_PIXELS)
+
+
+def tiles_covered(sprites):
+
+    tiles = set()
+    for sprite in sprites:
+        left, top = tile_of(sprite.rect.topleft)
+        right, bottom = tile_of((sprite.rect.right - 1, sprite.rect.bottom - 1))
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                tiles.add((x, y))
+    return tiles
+
+
+class Autopilot(InputProvider):
+
+    DANGER_RADIUS = 60 * ZOOM_FACTOR         # Enemies closer than this push us away
+    BULLET_DANGER_RADIUS = 25 * ZOOM_FACTOR  # As do enemy bullets
+    POWERUP_RADIUS = 30 * ZOOM_FACTOR        # Use the stored powerup once an enemy is this close
+    POWERUP_CROWD = 8                        # or there are this many enemies on the map
+    DROP_SAFE_RADIUS = 40 * ZOOM_FACTOR      # Don't go for drops with an enemy this close to them
+    LOOK_AHEAD = TILE_PIXELS / 2             # How far along each move we judge it by
+    STUCK_TICKS = TICKS_PER_SECOND           # Wander randomly for a bit if we haven't moved in this long
+    FIRING_RANGE = 3                         # Tiles to stay away from an enemy we're hunting down
+
+    def __init__(self, seed=None):
+
+        super().__init__()
+        self.random = random.Random(seed)
+        self.level = None
+
+        self.blocked = None         # Set of tiles the player can't walk on
+        self.bullet_blocked = None  # Set of tiles bullets can't go through
+        self.blocked_count = None   # How many player & bullet collision sprites there were when they were worked out
+        self.distances = {}         # Goal tile -> {tile: walking distance in tiles to the goal}
+
+        self.last_pos = None
+        self.still_ticks = 0
+        self.wander_ticks = 0
+        self.wander_move = (0, 0)
+        self.hunted = None  # The enemy we're hunting down, sticking with it until it's dead
+
+    def attach(self, level):
+        # Called with each level as it's built, before it's played
+
+        self.level = level
+        self.blocked = None
+        self.last_pos = None
+        self.still_ticks = 0
+        self.wander_ticks = 0
+        self.hunted = None
+
+    def poll(self):
+
+        level = self.level
+        if level is None or level.game_over:
+            self.keys.mask = 0
+            return
+
+        player = level.player
+        player_pos = pygame.math.Vector2(player.hitbox.center)
+        enemies = level.enemy_sprites.sprites()
+
+        self.update_blocked()
+        mask = self.fire_mask(player_pos, enemies)
+
+        # Buying in the shop (when stood on an upgrade we can afford)
+        upgrade_rect = self.affordable_upgrade_rect()
+        if upgrade_rect is not None and upgrade_rect.collidepoint(player.rect.center):
+            mask |= KEY_BITS[pygame.K_RETURN]
+
+        mask |= direction_mask(self.choose_move(player_pos, enemies, upgrade_rect), MOVE_KEYS)
+        self.keys.mask = mask
+
+    def fire_mask(self, player_pos, enemies):
+
+        if self.hunted is not None and self.hunted.alive():
+            target = self.hunted
+        else:
+            target = min(enemies, key=lambda enemy: player_pos.distance_squared_to(enemy.rect.center), default=None)
+        if target is None:
+            return 0
+
+        to_enemy = self.aim_point(target, player_pos) - player_pos
+        mask = direction_mask(nearest_direction(to_enemy), FIRE_KEYS)
+        if self.level.game_data.stored_powerup is not None and \
+                (to_enemy.length() < self.POWERUP_RADIUS or len(enemies) >= self.POWERUP_CROWD):
+            mask |= KEY_BITS[pygame.K_SPACE]
+        return mask
+
+    @staticmethod
+    def aim_point(enemy, player_pos):
+        # Where to shoot at the enemy. The boss is led by how far it moves while a bullet gets to it
+
+        enemy_pos = pygame.math.Vector2(enemy.rect.center)
+        if isinstance(enemy, Cowboy):
+            enemy_pos += enemy.direction * enemy.speed * abs(enemy_pos.y - player_pos.y) / BULLET_SPEED
+        return enemy_pos
+
+    def affordable_upgrade_rect(self):
+        # Where to stand in the shop to buy the cheapest next upgrade we can afford, if there's one
+
+        shop = self.level.shop_group.sprite
+        if shop is None:
+            return None
+
+        game_data = self.level.game_data
+        best = None
+        for upgrade_type, costs in UPGRADE_COSTS.items():
+            cost = costs.get(game_data.upgrades[upgrade_type] + 1)
+            if cost is not None and cost <= game_data.coins and (best is None or cost < best[0]):
+                best = cost, shop.upgrade_rects['game'][upgrade_type]
+        return best[1] if best is not None else None
+
+    def choose_move(self, player_pos, enemies, upgrade_rect):
+        # Returns one of MOVES
+
+        goal, goal_radius = self.choose_goal(player_pos, enemies, upgrade_rect)
+
+        # Getting stuck against something (e.g. the corner of an obstacle) is sorted out by wandering off for a bit
+        if self.last_pos is not None and player_pos.distance_to(self.last_pos) < 0.5 and \
+                player_pos.distance_to(goal) > goal_radius:
+            self.still_ticks += 1
+        else:
+            self.still_ticks = 0
+        self.last_pos = player_pos
+
+        if self.still_ticks >= self.STUCK_TICKS:
+            self.still_ticks = 0
+            self.wander_ticks = self.random.randint(TICKS_PER_SECOND // 4, TICKS_PER_SECOND)
+            self.wander_move = self.random.choice(MOVES[1:])
+        if self.wander_ticks > 0:
+            self.wander_ticks -= 1
+            return self.wander_move
+
+        threats = [(pygame.math.Vector2(enemy.rect.center), self.DANGER_RADIUS) for enemy in enemies]
+        for bullet in self.level.bullet_sprites:
+            if bullet.enemy_sprites is not self.level.enemy_sprites:
+                threats.append((pygame.math.Vector2(bullet.rect.center), self.BULLET_DANGER_RADIUS))
+
+        # If the goal can't be walked to from here (e.g. across a river), just head straight for it
+        distances = self.distances_to(tile_of(goal))
+        reachable = tile_of(player_pos) in distances
+        best_move, best_score = (0, 0), None
+
+        for move in MOVES:
+            pos = player_pos + pygame.math.Vector2(move) * self.LOOK_AHEAD
+            tile = tile_of(pos)
+            if move != (0, 0) and (tile not in distances if reachable else tile in self.blocked):
+                continue
+
+            # Closer to the goal is better, in walking distance, and then in a straight line within the goal's tile
+            if player_pos.distance_to(goal) <= goal_radius:
+                score = 0
+            else:
+                score = -pos.distance_to(goal) / TILE_PIXELS
+                if reachable:
+                    score -= distances[tile]
+
+            # Closer to a threat is worse, increasingly so the closer it is
+            for threat_pos, radius in threats:
+                distance = pos.distance_to(threat_pos)
+                if distance < radius:
+                    score -= 10 * ((radius - distance) / radius) ** 2
+
+            if best_score is None or score > best_score:
+                best_move, best_score = move, score
+
+        return best_move
+
+    def choose_goal(self, player_pos, enemies, upgrade_rect):
+        # Returns (position, how close we need to get to it)
+
+        if upgrade_rect is not None:
+            return pygame.math.Vector2(upgrade_rect.center), min(upgrade_rect.size) / 4
+
+        if self.level.level_completed:
+            # Walk off the bottom of the map, through whichever exit tile is nearest
+            exit_tile = min(EXIT_TILES, key=lambda tile: self.distances_to(tile).get(tile_of(player_pos), TILES_WIDE * TILES_HIGH))
+            return pygame.math.Vector2(exit_tile[0] + 0.5, TILES_HIGH + 1) * TILE_PIXELS, 0
+
+        boss = next((enemy for enemy in enemies if isinstance(enemy, Cowboy)), None)
+        if boss is not None:
+            return pygame.math.Vector2(self.aim_point(boss, player_pos).x, player_pos.y), TILE_PIXELS / 8
+
+        safe_drops = [
+            drop for drop in self.level.coin_sprites.sprites() + self.level.powerup_sprites.sprites()
+            if all(pygame.math.Vector2(drop.rect.center).distance_to(enemy.rect.center) > self.DROP_SAFE_RADIUS for enemy in enemies)
+        ]
+        if safe_drops:
+            drop = min(safe_drops, key=lambda drop: player_pos.distance_squared_to(drop.rect.center))
+            return pygame.math.Vector2(drop.rect.center), drop.magnet_radius / 2
+
+        level_timer = self.level.level_timer_group.sprite
+        if enemies and level_timer is not None and level_timer.is_level_timer_finished():
+            if self.hunted is None or not self.hunted.alive():
+                self.hunted = min(enemies, key=lambda enemy: player_pos.distance_squared_to(enemy.rect.center))
+            spot = self.firing_spot(player_pos, self.hunted)
+            if spot is not None:
+                return (pygame.math.Vector2(spot) + (0.5, 0.5)) * TILE_PIXELS, TILE_PIXELS / 8
+
+        return pygame.math.Vector2(GAME_WIDTH / 2, GAME_HEIGHT / 2), 2 * TILE_PIXELS
+
+    def firing_spot(self, player_pos, enemy):
+        # The tile nearest to us (in walking distance) that the enemy's tile can be shot from, in one of the 8 directions
+        # with nothing bullets can't go through in the way, or None if there isn't one
+
+        distances = self.distances_to(tile_of(player_pos))
+        best = None
+        for dx, dy in MOVES[1:]:
+            x, y = tile_of(enemy.rect.center)
+            for steps in range(1, max(TILES_WIDE, TILES_HIGH)):
+                # Going diagonally, bullets clip the corners of the tiles either side too
+                x, y = x + dx, y + dy
+                if {(x, y), (x - dx, y), (x, y - dy)} & self.bullet_blocked:
+                    break
+                if steps >= self.FIRING_RANGE and (x, y) in distances and (best is None or distances[(x, y)] < distances[best]):
+                    best = x, y
+        return best
+
+    def update_blocked(self):
+        # The tiles the player can't walk on change when e.g. the rocks blocking the exit are removed
+
+        collision_sprites = self.level.player_collision_sprites
+        bullet_colliding_sprites = self.level.bullet_colliding_sprites
+        blocked_count = len(collision_sprites), len(bullet_colliding_sprites)
+        if self.blocked is not None and blocked_count == self.blocked_count:
+            return
+
+        self.blocked = tiles_covered(collision_sprites)
+        self.bullet_blocked = tiles_covered(bullet_colliding_sprites)
+        self.blocked_count = blocked_count
+        self.distances = {}
+
+    def distances_to(self, goal):
+        # Walking distance (in tiles) to the goal tile, from every tile it can be walked to from, by breadth first search
+        # The two rows below the map count as walkable under the exit (and only there, so the search stays on the map),
+        # so the exit can be walked off
+
+        if goal not in self.distances:
+
+            def walkable(tile):
+                x, y = tile
+                if 0 <= x < TILES_WIDE and 0 <= y < TILES_HIGH:
+                    return tile not in self.blocked
+                return x in EXIT_COLUMNS and TILES_HIGH <= y <= TILES_HIGH + 1
+
+            distances = {goal: 0}
+            queue = deque([goal])
+            while queue:
+                x, y = queue.popleft()
+                for neighbour in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]:
+                    if neighbour not in distances and walkable(neighbour):
+                        distances[neighbour] = distances[(x, y)] + 1
+                        queue.append(neighbour)
+            self.distances[goal] = distances
+
+        return self.distances[goal]
+
+
+def complete_level(level):
+    # Finish a normal or boss level straight away, as if it had been cleared, opening the exit
+
+    from boss_level import BossLevel
+
+    for enemy in level.enemy_sprites.sprites():
+        enemy.kill()
+    level.level_completed = True
+    for obstruct in level.next_level_obstructable_sprites.sprites():
+        obstruct.kill()
+    if isinstance(level, BossLevel):
+        level.spawn_bridge()
+
+
+def check_exits(seed=0, coins=0, max_seconds=60, file=sys.stdout):
+    # Has the autopilot walk off the bottom of every level, once completed (shop levels are from the start, after
+    # buying what it can afford with `coins`). Returns the levels it didn't leave within `max_seconds` of game time
+
+    from util import RandomStreams
+    from game_data import GameData, LEVEL_DATA
+    from simulate import build_level
+
+    stuck = []
+    for level_index in sorted(LEVEL_DATA):
+
+        game_data = GameData(old_easy_mode=True, old_volume=0, random_streams=RandomStreams(seed + level_index))
+        game_data.lives = 99
+        game_data.coins = coins
+        game_data.current_level = level_index
+
+        left = []
+        autopilot = Autopilot(seed + level_index)
+        level = build_level(level_index, {}, game_data, autopilot, transition_to_next_level=lambda: left.append(True))
+        autopilot.attach(level)
+        if not level.level_completed:
+            complete_level(level)
+
+        for tick in range(int(max_seconds * TICKS_PER_SECOND)):
+            autopilot.poll()
+            level.step(1 / TICKS_PER_SECOND)
+            if left:
+                break
+
+        level_type = type(level).__name__
+        if left:
+            print('level %d (%s): left after %.1f s' % (level_index, level_type, (tick + 1) / TICKS_PER_SECOND), file=file)
+        else:
+            print('level %d (%s): still there after %g s' % (level_index, level_type, max_seconds), file=file)
+            stuck.append(level_index)
+
+    return stuck
+
+
+if __name__ == '__main__':
+
+    import os
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the autopilot walks out of every level once it\'s completed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--coins', type=int, default=0, help='coins to start each level with, to spend in the shops')
+    parser.add_argument('--max-seconds', type=float, default=60, help='game seconds to leave each level in')
+    args = parser.parse_args()
+
+    # Levels are played headless
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+    stuck = check_exits(args.seed, args.coins, args.max_seconds)
+    if stuck:
+        print('FAIL: the autopilot didn\'t leave level%s %s' % ('s' if len(stuck) > 1 else '', ', '.join(map(str, stuck))))
+        sys.exit(1)
+    print('OK: the autopilot left every level')
@@ -1,45 +1,57 @@
 import sys
+import marshal
 import pygame
-import random
 from ui import UI
-import numpy as np
-from util import Timer
 from settings import *
+from util import Timer, GameClock
 from boss import Cowboy
 from player import Player
 from cameras import Camera
 from shop import ShopKeeper
+from tracing import span
+from frametimes import note_event
+from gameplay_events import log_event, log_level_start, SPAWN, KILL, DROP_CREATED, DROP_COLLECTED, PLAYER_DEATH, \
+    ENEMY_TYPE_INDEXES, SIDE_INDEXES, KILL_CAUSE_INDEXES, DROP_NAME_INDEXES
 from particles import ParticleEffect
-from pathfinding.core.grid import Grid
-from pytmx.util_pygame import load_pygame
 from sprites import Bullet, Coin, Powerup
 from tiles import StaticTile, AnimatedTile
-from pathfinding.finder.a_star import AStarFinder
-from enemies import Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
+from enemies import Enemy, Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
 
 
 class BaseLevel:
 
-    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart):
+    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface=None, clock=None, partner_input_provider=None):
+        # `display_surface` is the surface to draw the level onto, the display by default
+        # `clock` is the game clock the level runs on, the active one by default. The level activates it whenever it's
+        # built, updated, drawn, reset or restored, so levels with their own clocks can be run side by side
+        # `partner_input_provider` adds a second player (for co-op) taking inputs from it. Both players share the game
+        # data (lives, coins, the stored powerup & upgrades), and enemies chase whichever is nearest
 
         # General setup
+        self.level_data = level_data
         self.game_data = game_data
         self.audio = audio
         self.assets = assets
         self.transition_to_next_level = transition_to_next_level
         self.transition_to_restart = transition_to_restart
+        self.input_provider = input_provider
+        self.partner_input_provider = partner_input_provider
+        self.display_surface = display_surface if display_surface is not None else pygame.display.get_surface()
+        self.clock = clock if clock is not None else GameClock.active
+        self.clock.activate()
 
         # UI
-        self.ui = UI(font, self.game_data, self.assets['powerup_drops'])
+        self.ui = UI(font, self.game_data, self.assets['powerup_drops'], self.display_surface)
 
         # Sprite groups
         # Not all may be used in concrete subclasses of levels
-        self.all_sprites = Camera(level_data['bg'], assets)
+        self.all_sprites = Camera(level_data['bg'], assets, self.display_surface)
         self.player_collision_sprites = pygame.sprite.Group()
         self.enemy_collision_sprites = pygame.sprite.Group()
         self.flying_enemy_collision_sprites = pygame.sprite.Group()  # Always kept empty
         self.bullet_colliding_sprites = pygame.sprite.Group()
         self.enemy_sprites = pygame.sprite.Group()
+        self.bullet_sprites = pygame.sprite.Group()
         self.coin_sprites = pygame.sprite.Group()
         self.powerup_sprites = pygame.sprite.Group()
         self.particle_sprites = pygame.sprite.Group()
@@ -61,47 +73,76 @@ class BaseLevel:
         self.matrix = [[1 for x in range(TILES_WIDE)] for y in range(TILES_HIGH)]
         self.spikeball_positions = [(x, y) for x in range(TILES_WIDE) for y in range(TILES_HIGH)]
 
+        # Sprites that are only created for certain levels
+        self.boss_position = None  # Set in setup() if the level has a boss
+        self.bridge = None         # Set in spawn_bridge()
+
         # Create sprites for groups
-        self.setup(level_data)
+        note_event('level build')
+        log_level_start(self.game_data.current_level)
+        with span('setup', 'load', tmx=level_data['tmx']):
+            self.setup(level_data)
+
+        # Keep what's needed to put the level back to how it started in reset(), without having to re-run setup()
+        self.initial_spikeball_positions = list(self.spikeball_positions)
+        self.next_level_obstructables = [(obstruct, obstruct.groups()) for obstruct in self.next_level_obstructable_sprites.sprites()]
+        self.build_order = {sprite: index for index, sprite in enumerate(self.all_sprites.sprites())}
 
         # Setup grid object for pathfinding now matrix complete
-        self.grid = Grid(matrix=self.matrix)
+        # Only spikeballs use pathfinding, so we don't build the grid (or import the library) for other levels
+        self.grid = None
+        if any(enemy_to_spawn['type'] == Spikeball for enemy_to_spawn in level_data['enemies']):
+            from pathfinding.core.grid import Grid
+            self.grid = Grid(matrix=self.matrix)
 
         # Timers that need to be paused on lightening effect
         # Sub-classes may extend this list, e.g. Normal Level will add the level & delay timers
-        self.pause_able_timers = [
-            self.smoke_bomb_timer, self.player.bullet_cooldown, self.player.coffee_timer, self.player.sheriff_timer,
-            self.player.machine_gun_timer, self.player.shotgun_timer, self.player.wagon_wheel_timer
-        ]
-        if self.boss_group.sprite is not None:
-            self.pause_able_timers.append(self.boss_group.sprite.idle_timer)
-            self.pause_able_timers.append(self.boss_group.sprite.bullet_cooldown_timer)
-
-        # Enemy timer events, one for each enemy type specified in level config
-        # Each enemy spawn event can have extra attributes with it, so we store as a dictionary
+        # The timers of sprites that come and go (the boss, drops, particles) are added in `get_pause_able_timers`
+        self.pause_able_timers = [self.smoke_bomb_timer]
+        for player in self.players:
+            self.pause_able_timers += [
+                player.bullet_cooldown, player.coffee_timer, player.sheriff_timer, player.machine_gun_timer,
+                player.shotgun_timer, player.wagon_wheel_timer
+            ]
+
+        # Enemy spawn timers, one for each enemy type specified in level config
+        # These are repeating timers on the game clock (rather than pygame timer events) so spawns are reproducible
+        # Each enemy spawn timer can have extra attributes with it, so we store as a dictionary
         # E.g. for orcs, we have a probability distribution, that can vary with levels,
-        # which specifies how likely we are to spawn 1-3 orcs on each event trigger
+        # which specifies how likely we are to spawn 1-3 orcs each time the timer triggers
         self.enemy_timers = []
         for enemy_to_spawn in level_data['enemies']:
-            event = pygame.event.custom_type()
-            pygame.time.set_timer(event, enemy_to_spawn['spawn_rate'])
-            list_entry = {'type': enemy_to_spawn['type'], 'event': event}
+            list_entry = {'type': enemy_to_spawn['type']}
+            list_entry['timer'] = Timer(enemy_to_spawn['spawn_rate'], auto_start=True, func=lambda entry=list_entry: self.spawn_enemy(entry), repeat=True)
             if list_entry['type'] in [Orc, Mummy]:
                 list_entry['p'] = enemy_to_spawn['p']
             self.enemy_timers.append(list_entry)
 
+        # How many bullets the players have fired, e.g. to see when a key press has had an effect (see latency.py)
+        self.player_bullets_created = 0
+
         # Game over variable
         # Set to True if we die in this level and are in process of restarting transition
         # Just used so we don't draw the UI while transition is taking place (e.g. so we don't see -1 lives )
         self.game_over = False
 
+        # Enemy types & the frames particle effects can be created with, by name, so snapshots can refer to them
+        self.enemy_types = {enemy_type.__name__: enemy_type for enemy_type in self.assets['enemies']}
+        self.particle_frames = {'player_death': self.assets['player_death'], 'nuke_smoke': self.assets['nuke_smoke']}
+        for enemy_type, frames in self.assets['enemies'].items():
+            self.particle_frames[enemy_type.__name__] = frames['ashes']
+        self.particle_frame_names = {id(frames): name for name, frames in self.particle_frames.items()}
+
     def create_bullet(self, pos, direction, damage, fired_by_player=True):
         # Passing in a unit vector, and position for where to start bullet
         # Pass in damage bullet has, as they have different surfaces for different damage bullets
         # If the player fires the bullet, it should be looking for collisions with enemies & bosses
         # Otherwise if a boss/enemy fires a bullet, we are looking for collisions with the player
 
-        Bullet(
+        if fired_by_player:
+            self.player_bullets_created += 1
+
+        return Bullet(
             pos=pos,
             direction=direction,
             damage=damage,
@@ -109,42 +150,50 @@ class BaseLevel:
             colliding_sprites=self.bullet_colliding_sprites,
             enemy_sprites=self.enemy_sprites if fired_by_player else self.player_group,
             monster_hit_sound=self.audio['monster_hit'],
-            groups=self.all_sprites
+            groups=[self.all_sprites, self.bullet_sprites]
         )
 
     def create_random_drop(self, pos, prob_distribution):
         # Called when an enemy dies (bullet kills it, or collide with it in zombie mode)
         # Randomly creates a drop (coin or powerup) on floor, with probability distribution for specific enemy passed in
 
+        random = self.game_data.random_streams['drops']
         random_drop = random.choices(list(prob_distribution.keys()), weights=list(prob_distribution.values()))[0]
         if random_drop != 'none':
+            self.create_drop(pos, random_drop)
 
-            if random_drop == 'one' or random_drop == 'five':
-                # Coin
-                Coin(
-                    pos=pos,
-                    surf=self.assets['coin_drops'][random_drop],
-                    value=1 if random_drop == 'one' else 5,
-                    player=self.player,
-                    groups=[self.all_sprites, self.coin_sprites]
-                )
+    def create_drop(self, pos, drop_name):
+        # `drop_name` is either a coin ('one' or 'five'), or the name of a powerup
 
-            else:
-                # powerup
-                Powerup(
-                    pos=pos,
-                    surf=self.assets['powerup_drops'][random_drop],
-                    powerup_name=random_drop,
-                    player=self.player,
-                    groups=[self.all_sprites, self.powerup_sprites]
-                )
+        log_event(DROP_CREATED, DROP_NAME_INDEXES[drop_name], pos=pos)
+
+        if drop_name == 'one' or drop_name == 'five':
+            # Coin
+            return Coin(
+                pos=pos,
+                surf=self.assets['coin_drops'][drop_name],
+                value=1 if drop_name == 'one' else 5,
+                players=self.players,
+                groups=[self.all_sprites, self.coin_sprites]
+            )
+
+        else:
+            # powerup
+            return Powerup(
+                pos=pos,
+                surf=self.assets['powerup_drops'][drop_name],
+                powerup_name=drop_name,
+                players=self.players,
+                groups=[self.all_sprites, self.powerup_sprites]
+            )
 
     def create_particle_effect(self, pos, frames, death_duration=None):
         # Creates a particle sprite at specified position, that runs through its frames then kills itself
         # Option `death_duration` keeps particle sprite around for specified time on last time
         # (e.g. when an orc dies we keep green moss on floor for a while)
 
-        ParticleEffect(
+        note_event('particles')
+        return ParticleEffect(
             pos=pos,
             frames=frames,
             groups=[self.all_sprites, self.particle_sprites],
@@ -153,7 +202,7 @@ class BaseLevel:
 
     def spawn_bridge(self):
 
-        StaticTile(
+        self.bridge = StaticTile(
             pos=(8 * TILE_SIZE * ZOOM_FACTOR, 8 * TILE_SIZE * ZOOM_FACTOR),
             surf=self.assets['bridge_surf'],
             groups=self.all_sprites
@@ -161,8 +210,12 @@ class BaseLevel:
 
     def setup(self, level_data):
         # Use tmx data to create all the sprites in the groups
+        # pytmx is imported here rather than at the top, as it's slow to import and not needed until a level is built
 
-        tmx_data = load_pygame(level_data['tmx'])
+        from pytmx.util_pygame import load_pygame
+
+        with span('load tmx', 'load'):
+            tmx_data = load_pygame(level_data['tmx'])
 
         if 'Obstructables' in tmx_data.layernames:
             # The tiles that go around where enemies spawn into map. Players can collide with them, but not enemies
@@ -256,21 +309,15 @@ class BaseLevel:
             # Create player
 
             if obj.name == 'Player':
+                # The partner (if any) starts a tile to the right
                 self.start_position = (obj.x * ZOOM_FACTOR, obj.y * ZOOM_FACTOR)
-                self.player = Player(
-                    pos=(obj.x * ZOOM_FACTOR, obj.y * ZOOM_FACTOR),
-                    collision_sprites=self.player_collision_sprites,
-                    create_bullet=self.create_bullet,
-                    game_data=self.game_data,
-                    apply_nuke=self.apply_nuke,
-                    apply_smoke_bomb=self.apply_smoke_bomb,
-                    tombstone_timer=self.tombstone_timer,
-                    apply_tombstone=self.apply_tombstone,
-                    lightening_timer=self.lightening_timer,
-                    audio=self.audio,
-                    destroy_player=self.destroy_player,
-                    groups=[self.all_sprites, self.player_group]
-                )
+                self.start_positions = [self.start_position]
+                self.player = self.create_player(self.start_position, self.input_provider)
+                self.players = [self.player]
+
+                if self.partner_input_provider is not None:
+                    self.start_positions.append((self.start_position[0] + TILE_SIZE * ZOOM_FACTOR, self.start_position[1]))
+                    self.players.append(self.create_player(self.start_positions[1], self.partner_input_provider))
 
             if obj.name == 'Shop Keeper':
                 self.shop_keeper = ShopKeeper(
@@ -281,33 +328,281 @@ class BaseLevel:
                 )
 
             if obj.name == 'Boss':
-                Cowboy(
-                    pos=(obj.x * ZOOM_FACTOR, obj.y * ZOOM_FACTOR),
-                    surfs=self.assets['boss']['cowboy'],
-                    player=self.player,
-                    health=level_data['boss_health'],
-                    bullet_cooldown=level_data['bullet_cooldown'],
-                    create_random_drop=self.create_random_drop,
-                    create_bullet=self.create_bullet,
-                    firing_strategy=level_data['firing_strategy'],
-                    audio=self.audio,
-                    groups=[self.all_sprites, self.enemy_sprites, self.boss_group]
-                )
+                self.boss_position = (obj.x * ZOOM_FACTOR, obj.y * ZOOM_FACTOR)
+                self.create_boss()
+
+    def create_player(self, pos, input_provider):
+
+        return Player(
+            pos=pos,
+            collision_sprites=self.player_collision_sprites,
+            create_bullet=self.create_bullet,
+            game_data=self.game_data,
+            apply_nuke=self.apply_nuke,
+            apply_smoke_bomb=self.apply_smoke_bomb,
+            tombstone_timer=self.tombstone_timer,
+            apply_tombstone=self.apply_tombstone,
+            lightening_timer=self.lightening_timer,
+            audio=self.audio,
+            destroy_player=self.destroy_player,
+            input_provider=input_provider,
+            groups=[self.all_sprites, self.player_group]
+        )
+
+    def create_boss(self):
+
+        Cowboy(
+            pos=self.boss_position,
+            surfs=self.assets['boss']['cowboy'],
+            players=self.players,
+            health=self.level_data['boss_health'],
+            bullet_cooldown=self.level_data['bullet_cooldown'],
+            create_random_drop=self.create_random_drop,
+            create_bullet=self.create_bullet,
+            firing_strategy=self.level_data['firing_strategy'],
+            audio=self.audio,
+            random_stream=self.game_data.random_streams['boss'],
+            groups=[self.all_sprites, self.enemy_sprites, self.boss_group]
+        )
 
-    def destroy_player(self):
+    def reset(self):
+        # Put the level back into the state it was in when first built, but without re-loading the tmx data,
+        # re-creating the tiles, etc. Much cheaper than creating a new level object, e.g. to retry a level
+        # Sub-classes extend this to reset their own state (e.g. the level timer)
+
+        self.clock.activate()
+
+        # Remove everything created while playing (including the boss, which we re-create below)
+        dynamic_sprites = self.enemy_sprites.sprites() + self.bullet_sprites.sprites() + self.coin_sprites.sprites() + \
+            self.powerup_sprites.sprites() + self.particle_sprites.sprites()
+        for sprite in dynamic_sprites:
+            sprite.kill()
+
+        if self.bridge is not None:
+            self.bridge.kill()
+            self.bridge = None
+
+        # Put back the obstructables we removed when the level was completed
+        self.set_obstructables_alive([True] * len(self.next_level_obstructables))
+
+        self.spikeball_positions = list(self.initial_spikeball_positions)
+
+        # Animated tiles start from their first frame, as in a freshly built level
+        for sprite in self.all_sprites.sprites():
+            if isinstance(sprite, AnimatedTile):
+                sprite.reset()
+
+        # Timers
+        self.paused_timers = []
+        self.smoke_bomb_timer.reset()
+        self.tombstone_timer.reset()
+        self.lightening_timer.reset()
+
+        # Players
+        for player, start_position in zip(self.players, self.start_positions):
+            player.reset_to_start(start_position)
+
+        # Boss
+        if self.boss_position is not None:
+            self.create_boss()
+
+        # Re-start the enemy spawn timers
+        for enemy_timer in self.enemy_timers:
+            enemy_timer['timer'].reset()
+            enemy_timer['timer'].activate()
+
+        self.game_over = False
+
+    def get_state(self):
+        # Everything about the level that changes while playing, as plain values that `marshal` can serialize
+        # Sprites created while playing are listed in the order they are updated & drawn in, as that order matters
+        # (e.g. for which enemy a bullet hits first), and they'll be re-created in the same order
+
+        dynamic_sprites = []
+        animated_tile_frames = []
+        for sprite in self.all_sprites.sprites():
+
+            # Most sprites are tiles, so are skipped first (this is called every tick when rolling back netplay)
+            sprite_type = type(sprite)
+            if sprite_type is StaticTile:
+                continue
+
+            elif sprite_type is AnimatedTile:
+                animated_tile_frames.append(sprite.frame_index)
+
+            elif isinstance(sprite, Spikeball):
+                dynamic_sprites.append(('spikeball', sprite.deploy_position, sprite.get_state()))
+
+            elif isinstance(sprite, Enemy):
+                dynamic_sprites.append(('enemy', type(sprite).__name__, sprite.get_state()))
+
+            elif isinstance(sprite, Bullet):
+                fired_by_player = sprite.enemy_sprites is self.enemy_sprites
+                dynamic_sprites.append(('bullet', tuple(sprite.direction), sprite.damage, fired_by_player, sprite.get_state()))
+
+            elif isinstance(sprite, Coin):
+                dynamic_sprites.append(('drop', 'one' if sprite.value == 1 else 'five', sprite.get_state()))
+
+            elif isinstance(sprite, Powerup):
+                dynamic_sprites.append(('drop', sprite.powerup_name, sprite.get_state()))
+
+            elif isinstance(sprite, ParticleEffect):
+                frames_name = self.particle_frame_names[id(sprite.source_frames)]
+                death_duration = None if sprite.death_timer is None else sprite.death_timer.duration
+                delay = None if sprite.delay_timer is None else sprite.delay_timer.duration
+                dynamic_sprites.append(('particle', frames_name, death_duration, delay, sprite.get_state()))
+
+        return (
+            self.clock.get_state(),
+            self.game_data.get_state(),
+            [player.get_state() for player in self.players],
+            None if self.boss_group.sprite is None else self.boss_group.sprite.get_state(),
+            dynamic_sprites,
+            None if self.level_timer_group.sprite is None else self.level_timer_group.sprite.get_state(),
+            None if self.shop_group.sprite is None else self.shop_group.sprite.get_state(),
+            (self.smoke_bomb_timer.get_state(), self.tombstone_timer.get_state(), self.lightening_timer.get_state()),
+            [enemy_timer['timer'].get_state() for enemy_timer in self.enemy_timers],
+            list(self.spikeball_positions),
+            [obstruct.alive() for obstruct, _ in self.next_level_obstructables],
+            self.bridge is not None,
+            self.level_completed,
+            self.game_over,
+            animated_tile_frames
+        )
+
+    def set_state(self, state):
+        # Put the level into a state previously returned by `get_state`
+
+        clock, game_data, players, boss, dynamic_sprites, level_timer, shop, timers, enemy_timers, spikeball_positions, \
+            obstructables_alive, bridge, self.level_completed, self.game_over, animated_tile_frames = state
+
+        self.clock.activate()
+        self.clock.set_state(clock)
+        self.game_data.set_state(game_data)
+        for player, player_state in zip(self.players, players):
+            player.set_state(player_state)
+
+        # Remove all the sprites created while playing, then re-create the ones in the state
+        # The boss is re-created first (if it had died), so it's before all the others like when the level is built
+        for sprite in self.enemy_sprites.sprites() + self.bullet_sprites.sprites() + self.coin_sprites.sprites() + \
+                self.powerup_sprites.sprites() + self.particle_sprites.sprites():
+            if not isinstance(sprite, Cowboy):
+                sprite.kill()
+
+        if boss is None:
+            if self.boss_group.sprite is not None:
+                self.boss_group.sprite.kill()
+        else:
+            if self.boss_group.sprite is None:
+                self.create_boss()
+            self.boss_group.sprite.set_state(boss)
+
+        for sprite_state in dynamic_sprites:
+
+            if sprite_state[0] == 'spikeball':
+                _, deploy_position, spikeball_state = sprite_state
+                self.create_spikeball((0, 0), [], tuple(deploy_position)).set_state(spikeball_state, self.grid)
+
+            elif sprite_state[0] == 'enemy':
+                _, type_name, enemy_state = sprite_state
+                enemy_type = self.enemy_types[type_name]
+                collision_sprites = self.flying_enemy_collision_sprites if enemy_type in [Butterfly, Imp] else self.enemy_collision_sprites
+                self.create_enemy(enemy_type, (0, 0), pygame.math.Vector2(), collision_sprites).set_state(enemy_state)
+
+            elif sprite_state[0] == 'bullet':
+                _, direction, damage, fired_by_player, bullet_state = sprite_state
+                self.create_bullet((0, 0), pygame.math.Vector2(direction), damage, fired_by_player).set_state(bullet_state)
+
+            elif sprite_state[0] == 'drop':
+                _, drop_name, drop_state = sprite_state
+                self.create_drop((0, 0), drop_name).set_state(drop_state)
+
+            elif sprite_state[0] == 'particle':
+                _, frames_name, death_duration, delay, particle_state = sprite_state
+                ParticleEffect(
+                    pos=(0, 0),
+                    frames=self.particle_frames[frames_name],
+                    groups=[self.all_sprites, self.particle_sprites],
+                    death_duration=death_duration,
+                    delay=delay
+                ).set_state(particle_state)
+
+        # Level, shop & other timers
+        if level_timer is not None:
+            self.level_timer_group.sprite.set_state(level_timer)
+        if shop is not None:
+            self.shop_group.sprite.set_state(shop)
+
+        smoke_bomb_timer, tombstone_timer, lightening_timer = timers
+        self.smoke_bomb_timer.set_state(smoke_bomb_timer)
+        self.tombstone_timer.set_state(tombstone_timer)
+        self.lightening_timer.set_state(lightening_timer)
+
+        for enemy_timer, enemy_timer_state in zip(self.enemy_timers, enemy_timers):
+            enemy_timer['timer'].set_state(enemy_timer_state)
+
+        # If we're in the lightening effect, these are the timers to un-pause once it's over
+        self.paused_timers = [timer for timer in self.get_pause_able_timers() if timer.paused_time is not None]
+
+        # Map
+        self.spikeball_positions = [tuple(position) for position in spikeball_positions]
+
+        self.set_obstructables_alive(obstructables_alive)
+
+        if bridge and self.bridge is None:
+            self.spawn_bridge()
+        elif not bridge and self.bridge is not None:
+            self.bridge.kill()
+            self.bridge = None
+
+        animated_tiles = [sprite for sprite in self.all_sprites.sprites() if isinstance(sprite, AnimatedTile)]
+        for tile, frame_index in zip(animated_tiles, animated_tile_frames):
+            tile.frame_index = frame_index
+            tile.image = tile.frames[int(frame_index)]
+
+    def set_obstructables_alive(self, obstructables_alive):
+        # Put back or remove each of the sprites blocking the way to the next level
+        # A sprite put back goes to the end of its groups, so we then sort those groups back into the order the level
+        # was built in, as it's the order e.g. collisions are checked in (sprites created since stay last, in order)
+
+        re_added_groups = set()
+        for (obstruct, groups), alive in zip(self.next_level_obstructables, obstructables_alive):
+            if alive and not obstruct.alive():
+                obstruct.add(groups)
+                re_added_groups.update(groups)
+            elif not alive and obstruct.alive():
+                obstruct.kill()
+
+        for group in re_added_groups:
+            sprites = sorted(group.sprites(), key=lambda sprite: self.build_order.get(sprite, len(self.build_order)))
+            group.empty()
+            group.add(sprites)
+
+    def snapshot(self):
+        # The level's full state, serialized as a compact binary blob
+
+        return marshal.dumps(self.get_state())
+
+    def restore(self, snapshot):
+
+        self.set_state(marshal.loads(snapshot))
+
+    def destroy_player(self, player):
 
         # Check game over state
+        self.game_data.deaths += 1
         self.game_data.lives -= 1
         if self.game_data.lives == -1:
             self.audio['dead'].play()
             self.transition_to_restart()
             self.game_over = True
+        log_event(PLAYER_DEATH, self.game_over, self.players.index(player), player.rect.center)
 
         # Explosion particle effect
-        self.create_particle_effect(self.player.rect.center, self.assets['player_death'])
+        self.create_particle_effect(player.rect.center, self.assets['player_death'])
 
         # Put player back in start position
-        self.player.reset_player(self.start_position)
+        player.reset_player(self.start_positions[self.players.index(player)])
 
         # De-activate all active upgrades
         self.smoke_bomb_timer.deactivate()
@@ -328,53 +623,61 @@ class BaseLevel:
             powerup.kill()
 
     def check_player_enemy_collisions(self):
-        # If player collides with any enemies, either kill the player if in normal mode, or the enemy if in zombie mode
+        # If a player collides with any enemies, either kill the player if in normal mode, or the enemy if in zombie mode
 
-        # Collision between enemies & player use their hit boxes
-        collided_enemies = []
-        for enemy in self.enemy_sprites.sprites():
-            if enemy.hitbox.colliderect(self.player.hitbox):
-                collided_enemies.append(enemy)
+        for player in self.players:
 
-        if len(collided_enemies) > 0:
-            # Colliding with an enemy, see if we are in zombie mode to know how to response (kill player or enemy)
+            # Collision between enemies & player use their hit boxes
+            collided_enemies = []
+            for enemy in self.enemy_sprites.sprites():
+                if enemy.hitbox.colliderect(player.hitbox):
+                    collided_enemies.append(enemy)
 
-            if self.tombstone_timer.active:
-                # Destroy enemy
-                # By 'destroy' we mean: kill it, spawn a particle effect, and potentially create a drop
-                for enemy in collided_enemies:
-                    enemy.die()
+            if len(collided_enemies) > 0:
+                # Colliding with an enemy, see if we are in zombie mode to know how to response (kill player or enemy)
 
-            else:
-                # Destroy the player
-                self.destroy_player()
+                if self.tombstone_timer.active:
+                    # Destroy enemy
+                    # By 'destroy' we mean: kill it, spawn a particle effect, and potentially create a drop
+                    for enemy in collided_enemies:
+                        log_event(KILL, ENEMY_TYPE_INDEXES[type(enemy).__name__], KILL_CAUSE_INDEXES['zombie'], enemy.rect.center)
+                        enemy.die()
+
+                else:
+                    # Destroy the player
+                    self.destroy_player(player)
+
+    def get_pause_able_timers(self):
+        # All the timers to pause during the lightening effect, including those of the sprites that come and go
+
+        timers = list(self.pause_able_timers)
+
+        if self.boss_group.sprite is not None:
+            timers.append(self.boss_group.sprite.idle_timer)
+            timers.append(self.boss_group.sprite.bullet_cooldown_timer)
+
+        for drop in (self.coin_sprites.sprites() + self.powerup_sprites.sprites()):
+            timers.append(drop.collectable_timer)
+            timers.append(drop.destruct_timer)
+
+        for particle in self.particle_sprites.sprites():
+            if particle.death_timer is not None:
+                timers.append(particle.death_timer)
+            if particle.delay_timer is not None:
+                timers.append(particle.delay_timer)
+
+        return timers
 
     def pause_all_active_timers(self):
         # Pause all relevant timers when we go into lightening active mode
 
         self.paused_timers = []
 
-        for timer in self.pause_able_timers:
+        for timer in self.get_pause_able_timers():
             if timer.active:
                 timer.pause()
                 self.paused_timers.append(timer)
 
-        for drop in (self.coin_sprites.sprites() + self.powerup_sprites.sprites()):
-            if drop.collectable_timer.active:
-                drop.collectable_timer.pause()
-                self.paused_timers.append(drop.collectable_timer)
-            if drop.destruct_timer.active:
-                drop.destruct_timer.pause()
-                self.paused_timers.append(drop.destruct_timer)
-
-        for particle in self.particle_sprites.sprites():
-            if particle.death_timer is not None and particle.death_timer.active:
-                particle.death_timer.pause()
-                self.paused_timers.append(particle.death_timer)
-            if particle.delay_timer is not None and particle.delay_timer.active:
-                particle.delay_timer.pause()
-                self.paused_timers.append(particle.delay_timer)
-
     def un_pause_all_active_timers(self):
         # When we finish the lightening animation mode, unpause all the timers we paused before
 
@@ -399,15 +702,16 @@ class BaseLevel:
         self.lightening_timer.activate()
         self.pause_all_active_timers()
 
-    def apply_smoke_bomb(self):
+    def apply_smoke_bomb(self, player):
 
-        # Teleport player to random spot
-        self.player.random_teleport(self.enemy_sprites)
+        # Teleport the player who used it to a random spot
+        player.random_teleport(self.enemy_sprites)
 
         # Flicker the player
-        self.player.flash_timer.activate()
+        player.flash_timer.activate()
 
         # Smoke effects across the game map
+        random = self.game_data.random_streams['effects']
         for smoke in range(10):
             ParticleEffect(
                 pos=(random.randint(0, GAME_WIDTH), random.randint(0, GAME_HEIGHT)),
@@ -422,36 +726,43 @@ class BaseLevel:
 
     def apply_nuke(self):
 
-        # Play sound effect
-        self.audio['nuke'].play()
-
-        # Kill all the enemies
-        for spikeball in self.spikeball_sprites.sprites():
-            self.add_position_to_spikeball_positions(spikeball.deploy_position)
-        for enemy in filter(lambda s: not isinstance(s, Cowboy), self.enemy_sprites.sprites()):
-            enemy.kill()
-
-        # Create smoke effects across the game map, that all start at different random timers (`delay`)
-        for smoke in range(25):
-            ParticleEffect(
-                pos=(random.randint(0, GAME_WIDTH), random.randint(0, GAME_HEIGHT)),
-                frames=self.assets['nuke_smoke'],
-                groups=[self.all_sprites, self.particle_sprites],
-                delay=random.randint(0, 750)
-            )
+        note_event('nuke')
+        with span('apply_nuke', 'load'):
+
+            # Play sound effect
+            self.audio['nuke'].play()
+
+            # Kill all the enemies
+            for spikeball in self.spikeball_sprites.sprites():
+                self.add_position_to_spikeball_positions(spikeball.deploy_position)
+            for enemy in filter(lambda s: not isinstance(s, Cowboy), self.enemy_sprites.sprites()):
+                log_event(KILL, ENEMY_TYPE_INDEXES[type(enemy).__name__], KILL_CAUSE_INDEXES['nuke'], enemy.rect.center)
+                enemy.kill()
+
+            # Create smoke effects across the game map, that all start at different random timers (`delay`)
+            random = self.game_data.random_streams['effects']
+            for smoke in range(25):
+                ParticleEffect(
+                    pos=(random.randint(0, GAME_WIDTH), random.randint(0, GAME_HEIGHT)),
+                    frames=self.assets['nuke_smoke'],
+                    groups=[self.all_sprites, self.particle_sprites],
+                    delay=random.randint(0, 750)
+                )
 
     def check_coin_collision(self):
-        # We pick up a coin drop by checking collision between the player's hit-box and the coins rect
+        # We pick up a coin drop by checking collision between a player's hit-box and the coins rect
         # Coins can only be picked up (attribute `collectable`) after a certain delay from when they were created
 
         for coin in filter(lambda s: s.collectable, self.coin_sprites.sprites()):
-            if coin.rect.colliderect(self.player.hitbox):
+            collided_player = coin.rect.collidelist([player.hitbox for player in self.players])
+            if collided_player != -1:
 
                 coin.kill()
                 self.game_data.coins += coin.value
+                log_event(DROP_COLLECTED, DROP_NAME_INDEXES['one' if coin.value == 1 else 'five'], collided_player, coin.rect.center)
 
     def check_powerup_collision(self):
-        # We pick up a powerup by checking collision between the player's hit-box and its rect
+        # We pick up a powerup by checking collision between a player's hit-box and its rect
         # Powerups can only be picked up (attribute `collectable`) after a certain delay from when they were created
 
         for powerup in filter(lambda s: s.collectable, self.powerup_sprites.sprites()):
@@ -461,9 +772,11 @@ class BaseLevel:
             # we need to check on each iteration of the for loop
             if not self.lightening_timer.active:
 
-                if powerup.rect.colliderect(self.player.hitbox):
+                collided_player = powerup.rect.collidelist([player.hitbox for player in self.players])
+                if collided_player != -1:
 
                     powerup.kill()
+                    log_event(DROP_COLLECTED, DROP_NAME_INDEXES[powerup.powerup_name], collided_player, powerup.rect.center)
 
                     if powerup.powerup_name == 'extra_life':
                         self.game_data.lives += 1
@@ -475,15 +788,15 @@ class BaseLevel:
                             self.game_data.stored_powerup = powerup.powerup_name
                             self.audio['powerup'].play()
                         else:
-                            self.player.apply_powerup(powerup.powerup_name)
+                            self.players[collided_player].apply_powerup(powerup.powerup_name)
                             if powerup.powerup_name not in ['machine_gun', 'nuke']:
                                 self.audio['powerup'].play()
 
     def check_next_level(self):
         # We can move to the next level, once the level has been completed, which removes the rocks and allows
-        # the player to move out of the screen to the bottom
+        # the players to move out of the screen to the bottom (either player leaving takes both to the next level)
 
-        if self.player.hitbox.top >= GAME_HEIGHT:
+        if any(player.hitbox.top >= GAME_HEIGHT for player in self.players):
             self.transition_to_next_level()
 
     def update_timers(self):
@@ -493,6 +806,11 @@ class BaseLevel:
         self.tombstone_timer.update()
         self.level_timer_group.update()
 
+        # Enemies are spawned (and spikeballs path found) from these timers
+        with span('spawn timers'):
+            for enemy_timer in self.enemy_timers:
+                enemy_timer['timer'].update()
+
     def add_position_to_spikeball_positions(self, position):
         # When a spikeball is spawned and we randomly pick a position to deploy it at,
         # we remove that position from the list of possible deploy positions so future ones cannot spawn there
@@ -502,7 +820,8 @@ class BaseLevel:
 
         self.spikeball_positions.append(position)
 
-    def spawn_enemy(self, event):
+    def spawn_enemy(self, enemy_timer):
+        # Called when an enemy type's spawn timer triggers
 
         if self.lightening_timer.active:
             return
@@ -510,152 +829,163 @@ class BaseLevel:
         if self.level_timer_group.sprite is None or not self.level_timer_group.sprite.is_level_timer_active():
             return
 
-        for enemy_timer in self.enemy_timers:
+        note_event('spawn')
+        random = self.game_data.random_streams['spawns']
 
-            if event.type == enemy_timer['event']:
+        # Based on enemy type we use a certain spawn strategy
 
-                # Based on enemy type we use a certain spawn strategy
+        if enemy_timer['type'] == Spikeball:
 
-                if enemy_timer['type'] == Spikeball:
+            from pathfinding.finder.a_star import AStarFinder
 
-                    # Pick where we're spawning at
-                    random_tile = random.choice(['1', '2', '3'])
-                    side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
+            # Pick where we're spawning at
+            random_tile = random.choice(['1', '2', '3'])
+            side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
 
-                    # Randomly pick the position we're going to deploy at, and create the AStar Finder object
-                    random_deploy_position = random.choice(self.spikeball_positions)
-                    end = self.grid.node(*random_deploy_position)
-                    finder = AStarFinder()
+            # Randomly pick the position we're going to deploy at, and create the AStar Finder object
+            random_deploy_position = random.choice(self.spikeball_positions)
+            end = self.grid.node(*random_deploy_position)
+            finder = AStarFinder()
 
-                    # Remove this randomly picked position from possible list, so future spikeballs don't get there too
-                    # When it dies, we will add it back to the list
-                    self.spikeball_positions.remove(random_deploy_position)
+            # Remove this randomly picked position from possible list, so future spikeballs don't get there too
+            # When it dies, we will add it back to the list
+            self.spikeball_positions.remove(random_deploy_position)
 
-                    # Get the grid position for where we're spawning at
-                    # and the start node for the path algorithm,
+            # Get the grid position for where we're spawning at
+            # and the start node for the path algorithm,
 
-                    if side_to_spawn in ['top', 'bottom']:
+            if side_to_spawn in ['top', 'bottom']:
 
-                        x = 6 + int(random_tile)
-                        y = -1 if side_to_spawn == 'top' else 16
-                        start = self.grid.node(x, 0 if side_to_spawn == 'top' else 15)
+                x = 6 + int(random_tile)
+                y = -1 if side_to_spawn == 'top' else 16
+                start = self.grid.node(x, 0 if side_to_spawn == 'top' else 15)
 
-                    else:
+            else:
 
-                        x = -1 if side_to_spawn == 'left' else 16
-                        y = 6 + int(random_tile)
-                        start = self.grid.node(0 if side_to_spawn == 'left' else 15, y)
-
-                    pos = pygame.math.Vector2(x, y) * TILE_SIZE * ZOOM_FACTOR
-                    path_to_deploy, _ = finder.find_path(start, end, self.grid)
-                    self.grid.cleanup()
-
-                    Spikeball(
-                        frames=self.assets['enemies'][Spikeball],
-                        pos=pos,              # pixel start position (off the grid)
-                        path=path_to_deploy,  # path in terms of grid positions
-                        deploy_position=random_deploy_position,
-                        create_particle_effect=self.create_particle_effect,
-                        create_random_drop=self.create_random_drop,
-                        smoke_bomb_timer=self.smoke_bomb_timer,
-                        add_position_to_spikeball_positions=self.add_position_to_spikeball_positions,
-                        groups=[self.all_sprites, self.enemy_sprites, self.spikeball_sprites]
-                    )
+                x = -1 if side_to_spawn == 'left' else 16
+                y = 6 + int(random_tile)
+                start = self.grid.node(0 if side_to_spawn == 'left' else 15, y)
 
-                else:
+            pos = pygame.math.Vector2(x, y) * TILE_SIZE * ZOOM_FACTOR
+            with span('spikeball A*', 'load'):
+                path_to_deploy, _ = finder.find_path(start, end, self.grid)
+                self.grid.cleanup()
 
-                    enemies_to_spawn = []  # list of (top-left positions, initial direction) for enemies
+            self.create_spikeball(pos, path_to_deploy, random_deploy_position)
+            log_event(SPAWN, ENEMY_TYPE_INDEXES['Spikeball'], SIDE_INDEXES[side_to_spawn], pos)
 
-                    if enemy_timer['type'] in [Orc, Mummy]:
-                        # At a random side, generate 1-3 orcs, in a random orientation
-                        # Orientation (1, 2, 3) is L-to-R for top & bottom, and T-to-B for left & right
+        else:
 
-                        number_to_spawn = random.choices([1, 2, 3], weights=enemy_timer['p'], k=1)[0]
-                        orientations = np.random.choice(('1', '2', '3'), number_to_spawn, replace=False)
-                        side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
-                        collision_sprites = self.enemy_collision_sprites
+            enemies_to_spawn = []  # list of (top-left positions, initial direction) for enemies
 
-                        if side_to_spawn in ['top', 'bottom']:
+            if enemy_timer['type'] in [Orc, Mummy]:
+                # At a random side, generate 1-3 orcs, in a random orientation
+                # Orientation (1, 2, 3) is L-to-R for top & bottom, and T-to-B for left & right
 
-                            for orientation in orientations:
+                number_to_spawn = random.choices([1, 2, 3], weights=enemy_timer['p'], k=1)[0]
+                orientations = random.sample(['1', '2', '3'], number_to_spawn)
+                side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
+                collision_sprites = self.enemy_collision_sprites
 
-                                x = (6 + int(orientation)) * TILE_SIZE * ZOOM_FACTOR
-                                y = (-1 if side_to_spawn == 'top' else 16) * TILE_SIZE * ZOOM_FACTOR
-                                init_direction = pygame.math.Vector2(0, 1 if side_to_spawn == 'top' else -1)
-                                enemies_to_spawn.append(((x, y), init_direction))
+                if side_to_spawn in ['top', 'bottom']:
 
-                        else:
+                    for orientation in orientations:
+
+                        x = (6 + int(orientation)) * TILE_SIZE * ZOOM_FACTOR
+                        y = (-1 if side_to_spawn == 'top' else 16) * TILE_SIZE * ZOOM_FACTOR
+                        init_direction = pygame.math.Vector2(0, 1 if side_to_spawn == 'top' else -1)
+                        enemies_to_spawn.append(((x, y), init_direction))
 
-                            for orientation in orientations:
+                else:
 
-                                x = (-1 if side_to_spawn == 'left' else 16) * TILE_SIZE * ZOOM_FACTOR
-                                y = (6 + int(orientation)) * TILE_SIZE * ZOOM_FACTOR
-                                init_direction = pygame.math.Vector2(1 if side_to_spawn == 'left' else -1, 0)
-                                enemies_to_spawn.append(((x, y), init_direction))
+                    for orientation in orientations:
 
-                    elif enemy_timer['type'] in [Ogre, Mushroom]:
+                        x = (-1 if side_to_spawn == 'left' else 16) * TILE_SIZE * ZOOM_FACTOR
+                        y = (6 + int(orientation)) * TILE_SIZE * ZOOM_FACTOR
+                        init_direction = pygame.math.Vector2(1 if side_to_spawn == 'left' else -1, 0)
+                        enemies_to_spawn.append(((x, y), init_direction))
 
-                        random_tile = random.choice(['1', '2', '3'])
-                        side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
-                        collision_sprites = self.enemy_collision_sprites
+            elif enemy_timer['type'] in [Ogre, Mushroom]:
 
-                        if side_to_spawn in ['top', 'bottom']:
+                random_tile = random.choice(['1', '2', '3'])
+                side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
+                collision_sprites = self.enemy_collision_sprites
 
-                            x = (6 + int(random_tile)) * TILE_SIZE * ZOOM_FACTOR
-                            y = (-1 if side_to_spawn == 'top' else 16) * TILE_SIZE * ZOOM_FACTOR
-                            init_direction = pygame.math.Vector2(0, 1 if side_to_spawn == 'top' else -1)
-                            enemies_to_spawn.append(((x, y), init_direction))
+                if side_to_spawn in ['top', 'bottom']:
 
-                        else:
+                    x = (6 + int(random_tile)) * TILE_SIZE * ZOOM_FACTOR
+                    y = (-1 if side_to_spawn == 'top' else 16) * TILE_SIZE * ZOOM_FACTOR
+                    init_direction = pygame.math.Vector2(0, 1 if side_to_spawn == 'top' else -1)
+                    enemies_to_spawn.append(((x, y), init_direction))
 
-                            x = (-1 if side_to_spawn == 'left' else 16) * TILE_SIZE * ZOOM_FACTOR
-                            y = (6 + int(random_tile)) * TILE_SIZE * ZOOM_FACTOR
-                            init_direction = pygame.math.Vector2(1 if side_to_spawn == 'left' else -1, 0)
-                            enemies_to_spawn.append(((x, y), init_direction))
+                else:
 
-                    elif enemy_timer['type'] in [Butterfly, Imp]:
-                        # Unique things about the butterfly are:
-                        # - Can spawn anywhere on the sides, not constrained to the 3 tiles on each side for land enemies
-                        # - Can fly over obstacles, so their collision sprites need to be different
+                    x = (-1 if side_to_spawn == 'left' else 16) * TILE_SIZE * ZOOM_FACTOR
+                    y = (6 + int(random_tile)) * TILE_SIZE * ZOOM_FACTOR
+                    init_direction = pygame.math.Vector2(1 if side_to_spawn == 'left' else -1, 0)
+                    enemies_to_spawn.append(((x, y), init_direction))
 
-                        collision_sprites = self.flying_enemy_collision_sprites  # empty group
-                        side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
+            elif enemy_timer['type'] in [Butterfly, Imp]:
+                # Unique things about the butterfly are:
+                # - Can spawn anywhere on the sides, not constrained to the 3 tiles on each side for land enemies
+                # - Can fly over obstacles, so their collision sprites need to be different
 
-                        # Based on the random side we picked, place in the middle 80% of the game width/height
-                        # The initial direction vector is then into the center of the map
-                        # The vector to the center is calculated wrt. (x, y) which is technically the top-left
-                        # not the center, but in reality isn't going to make much difference
-                        if side_to_spawn in ['top', 'bottom']:
+                collision_sprites = self.flying_enemy_collision_sprites  # empty group
+                side_to_spawn = random.choice(['top', 'left', 'bottom', 'right'])
 
-                            x = random.randint(int(0.1 * GAME_WIDTH), int(0.9 * GAME_WIDTH))
-                            y = (-1 if side_to_spawn == 'top' else 16) * TILE_SIZE * ZOOM_FACTOR
+                # Based on the random side we picked, place in the middle 80% of the game width/height
+                # The initial direction vector is then into the center of the map
+                # The vector to the center is calculated wrt. (x, y) which is technically the top-left
+                # not the center, but in reality isn't going to make much difference
+                if side_to_spawn in ['top', 'bottom']:
 
-                        else:
+                    x = random.randint(int(0.1 * GAME_WIDTH), int(0.9 * GAME_WIDTH))
+                    y = (-1 if side_to_spawn == 'top' else 16) * TILE_SIZE * ZOOM_FACTOR
 
-                            x = (-1 if side_to_spawn == 'left' else 16) * TILE_SIZE * ZOOM_FACTOR
-                            y = random.randint(int(0.1 * GAME_HEIGHT), int(0.9 * GAME_HEIGHT))
+                else:
+
+                    x = (-1 if side_to_spawn == 'left' else 16) * TILE_SIZE * ZOOM_FACTOR
+                    y = random.randint(int(0.1 * GAME_HEIGHT), int(0.9 * GAME_HEIGHT))
 
-                        unit_vector_to_center = (pygame.math.Vector2(GAME_WIDTH / 2, GAME_HEIGHT / 2) - pygame.math.Vector2(x, y)).normalize()
-                        enemies_to_spawn.append(((x, y), unit_vector_to_center))
+                unit_vector_to_center = (pygame.math.Vector2(GAME_WIDTH / 2, GAME_HEIGHT / 2) - pygame.math.Vector2(x, y)).normalize()
+                enemies_to_spawn.append(((x, y), unit_vector_to_center))
 
-                    groups = [self.all_sprites, self.enemy_sprites]
-                    if enemy_timer['type'] == Ogre:
-                        groups.append(self.ogre_sprites)
+            for new_enemy in enemies_to_spawn:
+                self.create_enemy(enemy_timer['type'], new_enemy[0], new_enemy[1], collision_sprites)
+                log_event(SPAWN, ENEMY_TYPE_INDEXES[enemy_timer['type'].__name__], SIDE_INDEXES[side_to_spawn], new_enemy[0])
 
-                    for new_enemy in enemies_to_spawn:
+    def create_enemy(self, enemy_type, pos, initial_direction, collision_sprites):
 
-                        enemy_timer['type'](
-                            frames=self.assets['enemies'][enemy_timer['type']],
-                            pos=new_enemy[0],
-                            initial_direction=new_enemy[1],
-                            collision_sprites=collision_sprites,
-                            player=self.player,
-                            create_particle_effect=self.create_particle_effect,
-                            create_random_drop=self.create_random_drop,
-                            smoke_bomb_timer=self.smoke_bomb_timer,
-                            tombstone_timer=self.tombstone_timer,
-                            groups=groups
-                        )
+        groups = [self.all_sprites, self.enemy_sprites]
+        if enemy_type == Ogre:
+            groups.append(self.ogre_sprites)
+
+        return enemy_type(
+            frames=self.assets['enemies'][enemy_type],
+            pos=pos,
+            initial_direction=initial_direction,
+            collision_sprites=collision_sprites,
+            players=self.players,
+            create_particle_effect=self.create_particle_effect,
+            create_random_drop=self.create_random_drop,
+            smoke_bomb_timer=self.smoke_bomb_timer,
+            tombstone_timer=self.tombstone_timer,
+            groups=groups
+        )
+
+    def create_spikeball(self, pos, path, deploy_position):
+
+        return Spikeball(
+            frames=self.assets['enemies'][Spikeball],
+            pos=pos,              # pixel start position (off the grid)
+            path=path,            # path in terms of grid positions
+            deploy_position=deploy_position,
+            create_particle_effect=self.create_particle_effect,
+            create_random_drop=self.create_random_drop,
+            smoke_bomb_timer=self.smoke_bomb_timer,
+            add_position_to_spikeball_positions=self.add_position_to_spikeball_positions,
+            groups=[self.all_sprites, self.enemy_sprites, self.spikeball_sprites]
+        )
 
     def check_ogre_spikeball_collisions(self):
 
@@ -672,21 +1002,21 @@ class BaseLevel:
             if collides_with_ogre:
                 spikeball.die()
 
-    def run(self, dt):
+    def step(self, dt):
+        # Advance the level's clock and update by `dt` seconds, for when the level is run outside of a game
 
-        # Update timers
-
-        self.update_timers()
+        self.clock.advance(dt)
+        self.update(dt)
 
-        # Event loop
+    def update(self, dt):
+        # Update the level by `dt` seconds (once its clock has been advanced), without drawing anything
 
-        for event in pygame.event.get():
+        self.clock.activate()
 
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+        # Update timers
 
-            self.spawn_enemy(event)
+        with span('timers'):
+            self.update_timers()
 
         # Updates
         # We call all the functions, that might only be relevant to certain subclasses
@@ -695,25 +1025,49 @@ class BaseLevel:
         # Similarly, we update the shop group single, but if we're not on shop mode, group will be empty and do nothing
 
         if not self.lightening_timer.active:
-            self.all_sprites.update(dt)
+            with span('sprites'):
+                self.all_sprites.update(dt)
 
         if not self.lightening_timer.active:
-            self.check_coin_collision()
-            self.check_powerup_collision()
+            with span('collisions'):
+                self.check_coin_collision()
+                self.check_powerup_collision()
 
         if not self.lightening_timer.active:
 
             self.shop_group.update()
-            self.check_ogre_spikeball_collisions()
-            self.check_player_enemy_collisions()
+            with span('collisions'):
+                self.check_ogre_spikeball_collisions()
+                self.check_player_enemy_collisions()
             self.check_level_completed()
             self.check_next_level()
 
         if self.lightening_timer.active:
-            self.player.update(dt)
+            for player in self.players:
+                player.update(dt)
 
-        # Drawing
+    def draw(self):
 
-        self.all_sprites.custom_draw(self.lightening_timer.active, self.smoke_bomb_timer.active, self.player, self.level_completed, self.shop_group)
+        self.clock.activate()
+        with span('world'):
+            self.all_sprites.custom_draw(self.lightening_timer.active, self.smoke_bomb_timer.active, self.players, self.level_completed, self.shop_group)
         if not self.game_over:
-            self.ui.display(self.level_timer_group, self.boss_group)
+            with span('ui'):
+                self.ui.display(self.level_timer_group, self.boss_group)
+
+    def handle_events(self):
+
+        for event in pygame.event.get():
+
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+
+    def run(self, dt):
+
+        with span('events'):
+            self.handle_events()
+        with span('update'):
+            self.update(dt)
+        with span('draw'):
+            self.draw()
@@ -1,12 +1,11 @@
-import random
 import pygame
-from util import Timer
+from util import Timer, nearest_sprite
 from settings import *
 
 
 class Cowboy(pygame.sprite.Sprite):
 
-    def __init__(self, pos, surfs, player, health, bullet_cooldown, create_random_drop, create_bullet, firing_strategy, audio, groups):
+    def __init__(self, pos, surfs, players, health, bullet_cooldown, create_random_drop, create_bullet, firing_strategy, audio, random_stream, groups):
 
         super().__init__(groups)
 
@@ -27,10 +26,11 @@ class Cowboy(pygame.sprite.Sprite):
         self.direction = pygame.math.Vector2()
 
         # Attributes
-        self.player = player
+        self.players = players  # Fires towards the nearest of them
         self.firing_strategy = firing_strategy
         self.create_random_drop = create_random_drop
         self.create_bullet = create_bullet
+        self.random = random_stream
 
         # Audio
         self.gun_shot_sound = audio['gunshot']
@@ -40,9 +40,27 @@ class Cowboy(pygame.sprite.Sprite):
         self.current_health = health
 
         # Behaviour
-        self.idle_timer = Timer(random.randint(3000, 5000), auto_start=True, func=self.start_firing)
+        self.idle_timer = Timer(self.random.randint(3000, 5000), auto_start=True, func=self.start_firing)
         self.bullet_cooldown_timer = Timer(bullet_cooldown)
 
+    def get_state(self):
+
+        return (
+            tuple(self.pos), self.rect.topleft, self.hitbox.topleft, tuple(self.direction), self.status,
+            self.frame_index, self.current_health, self.idle_timer.get_state(), self.bullet_cooldown_timer.get_state()
+        )
+
+    def set_state(self, state):
+
+        pos, self.rect.topleft, self.hitbox.topleft, direction, self.status, self.frame_index, self.current_health, \
+            idle_timer, bullet_cooldown_timer = state
+
+        self.pos = pygame.math.Vector2(pos)
+        self.direction = pygame.math.Vector2(direction)
+        self.idle_timer.set_state(idle_timer)
+        self.bullet_cooldown_timer.set_state(bullet_cooldown_timer)
+        self.image = self.frames[self.status][int(self.frame_index)]
+
     def percent_health_left(self):
 
         return self.current_health / self.full_health
@@ -71,7 +89,8 @@ class Cowboy(pygame.sprite.Sprite):
             if self.firing_strategy == 'upwards':
                 bullet_direction = pygame.math.Vector2(0, -1)
             elif self.firing_strategy == 'towards_player':
-                bullet_direction = (pygame.math.Vector2(self.player.rect.center) - pygame.math.Vector2(self.rect.center)).normalize()
+                player = nearest_sprite(self.rect.center, self.players)
+                bullet_direction = (pygame.math.Vector2(player.rect.center) - pygame.math.Vector2(self.rect.center)).normalize()
             self.create_bullet(
                 pos=pygame.math.Vector2(self.hitbox.midtop),
                 direction=bullet_direction,
@@ -84,7 +103,7 @@ class Cowboy(pygame.sprite.Sprite):
     def end_firing(self):
 
         self.status = 'idle'
-        self.idle_timer.duration = random.randint(3000, 5000)
+        self.idle_timer.duration = self.random.randint(3000, 5000)
         self.idle_timer.activate()
         self.direction = pygame.math.Vector2()
 
@@ -107,7 +126,7 @@ class Cowboy(pygame.sprite.Sprite):
         elif self.direction.x == 1 and (pygame.math.Vector2(self.rect.center) - self.start_pos).magnitude() < 5:
             # We're passing through the center
             # Small chance to stop firing. Remember this will be called many times as we pass through, so small chance
-            if random.randint(0, 20) == 0:
+            if self.random.randint(0, 20) == 0:
                 self.end_firing()
 
     def animate(self, dt):
@@ -3,9 +3,15 @@ from base_level import BaseLevel
 
 class BossLevel(BaseLevel):
 
-    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart):
+    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface=None, clock=None, partner_input_provider=None):
 
-        super().__init__(level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart)
+        super().__init__(level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface, clock, partner_input_provider)
+
+        self.level_completed = False
+
+    def reset(self):
+
+        super().reset()
 
         self.level_completed = False
 
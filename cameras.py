@@ -1,17 +1,18 @@
 import pygame
 import random
 from settings import *
+from capture import FrameCapture
 from enemies import Enemy, Spikeball
 from util import import_folder, import_image
 
 
 class Camera(pygame.sprite.Group):
 
-    def __init__(self, bg, assets):
+    def __init__(self, bg, assets, display_surface=None):
 
         super().__init__()
 
-        self.display_surface = pygame.display.get_surface()
+        self.display_surface = display_surface if display_surface is not None else pygame.display.get_surface()
         self.bg = import_image(bg)
 
         # We draw onto a separate surface that has the exact dimension of the game,
@@ -24,18 +25,20 @@ class Camera(pygame.sprite.Group):
         self.arrow_surf = assets['arrow']
         self.arrow_rect = self.arrow_surf.get_rect(midbottom=(GAME_WIDTH / 2, GAME_HEIGHT * 0.975))
 
-    def draw_lightening_active(self, player):
+    def draw_lightening_active(self, players):
         # If lightening is active, we don't draw the background or the other sprites
-        # We just draw the player and some lightening surfaces across the screen
+        # We just draw the players and some lightening surfaces across the screen above them
 
-        self.game_surface.blit(player.image, player.rect)
+        for player in players:
 
-        height_of_lightening = self.lightening_surfaces[0].get_height()
-        for lightening in range(int(player.rect.top / height_of_lightening) + 1):
-            self.game_surface.blit(
-                random.choice(self.lightening_surfaces),
-                (player.rect.left, player.rect.top - (height_of_lightening * (lightening + 1)))
-            )
+            self.game_surface.blit(player.image, player.rect)
+
+            height_of_lightening = self.lightening_surfaces[0].get_height()
+            for lightening in range(int(player.rect.top / height_of_lightening) + 1):
+                self.game_surface.blit(
+                    random.choice(self.lightening_surfaces),
+                    (player.rect.left, player.rect.top - (height_of_lightening * (lightening + 1)))
+                )
 
     def draw_sprites(self):
         # Regular for loop to iterate over all sprites, in order of z component,
@@ -46,7 +49,12 @@ class Camera(pygame.sprite.Group):
             for sprite in sorted(z_sprites, key=lambda s: (s.rect.centery, s.rect.centerx)):
                 self.game_surface.blit(sprite.image, sprite.rect)
 
-    def custom_draw(self, lightening_active, smoke_bomb_active, player, level_completed, shop):
+    def question_marked_sprites(self):
+        # The sprites a question mark is drawn above while the smoke bomb is active
+
+        return filter(lambda s: isinstance(s, Enemy) or isinstance(s, Spikeball), self.sprites())
+
+    def custom_draw(self, lightening_active, smoke_bomb_active, players, level_completed, shop):
 
         # Clear surface
         self.game_surface.fill('black')
@@ -65,7 +73,7 @@ class Camera(pygame.sprite.Group):
 
             # Question marks above enemies
             if smoke_bomb_active:
-                for enemy in filter(lambda s: isinstance(s, Enemy) or isinstance(s, Spikeball), self.sprites()):
+                for enemy in self.question_marked_sprites():
                     question_mark_rect = self.question_mark_surf.get_rect(midbottom=enemy.rect.midtop)
                     self.game_surface.blit(self.question_mark_surf, question_mark_rect)
 
@@ -74,7 +82,11 @@ class Camera(pygame.sprite.Group):
                 self.game_surface.blit(self.arrow_surf, self.arrow_rect)
 
         else:
-            self.draw_lightening_active(player)
+            self.draw_lightening_active(players)
+
+        # Hand the finished frame to anything capturing it
+        if FrameCapture.active is not None:
+            FrameCapture.active.capture('game', self.game_surface)
 
         # Draw surface on actual display surface
         self.display_surface.blit(self.game_surface, (0, 0))
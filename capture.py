@@ -0,0 +1,75 @@
+import pygame
+from settings import *
+
+
+# Hands each frame drawn to consumers (e.g. video recorders, agents that observe pixels), as views of the surface's
+# pixels rather than copies. The camera captures the game surface ('game') once the level is drawn, and the game
+# captures the display surface ('display') once everything, including the UI & transitions, is drawn
+#
+# A view is a (height, width, 3) uint8 NumPy array of the surface's RGB pixels, or of every ZOOM_FACTOR'th pixel
+# in each direction for the game's native resolution (256x256 for the game surface), which is still a view
+# Views are only valid during the callback: the surface is locked while any view of it exists, and can't be drawn
+# on again until they're gone. Consumers that need a frame for longer must copy it (e.g. with LatestFrame below)
+
+SOURCES = ['game', 'display']
+
+
+class FrameCapture:
+
+    active = None  # The capture the camera & game hand their frames to, if any
+
+    def __init__(self):
+
+        self.consumers = {source: [] for source in SOURCES}  # (callback, native resolution)
+
+    def activate(self):
+
+        FrameCapture.active = self
+
+    def deactivate(self):
+
+        if FrameCapture.active is self:
+            FrameCapture.active = None
+
+    def add_consumer(self, callback, source='game', native=False):
+        # `callback` is called with a view of every frame of `source`, at the game's native resolution if `native`
+
+        self.consumers[source].append((callback, native))
+
+    def remove_consumer(self, callback, source='game'):
+
+        self.consumers[source] = [consumer for consumer in self.consumers[source] if consumer[0] is not callback]
+
+    def capture(self, source, surface):
+
+        consumers = self.consumers[source]
+        if not consumers:
+            return
+
+        # pixels3d is indexed (x, y), so we transpose it to the (row, column) order images are usually in
+        frame = pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+        native_frame = frame[::ZOOM_FACTOR, ::ZOOM_FACTOR]
+
+        for callback, native in consumers:
+            callback(native_frame if native else frame)
+
+        # Dropping the views here unlocks the surface (unless a consumer kept hold of one)
+        del frame, native_frame
+
+
+class LatestFrame:
+    # A consumer that keeps a copy of the latest frame, in an array allocated once and then copied into every frame
+
+    def __init__(self):
+
+        self.frame = None
+        self.frame_count = 0
+
+    def __call__(self, view):
+
+        import numpy as np
+
+        if self.frame is None or self.frame.shape != view.shape:
+            self.frame = np.empty(view.shape, dtype=view.dtype)
+        np.copyto(self.frame, view)
+        self.frame_count += 1
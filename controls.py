@@ -0,0 +1,60 @@
+import pygame
+
+
+# The keys the game reads while playing. Their position in this list is their bit in an input bitmask,
+# so a tick's input can be stored as one small integer (e.g. in a recording)
+INPUT_KEYS = [
+    pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d,
+    pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT,
+    pygame.K_SPACE, pygame.K_RETURN
+]
+KEY_BITS = {key: 1 << bit for bit, key in enumerate(INPUT_KEYS)}
+
+
+def keys_to_mask(keys):
+    # `keys` is anything indexed by key constants, e.g. what pygame.key.get_pressed() returns
+
+    mask = 0
+    for key, bit in KEY_BITS.items():
+        if keys[key]:
+            mask |= bit
+    return mask
+
+
+class KeyState:
+    # Which keys are pressed, stored as an input bitmask
+    # Indexed by key constant like the result of pygame.key.get_pressed(), so the game code reads it the same way
+
+    def __init__(self, mask=0):
+
+        self.mask = mask
+
+    def __getitem__(self, key):
+
+        return bool(self.mask & KEY_BITS.get(key, 0))
+
+
+class InputProvider:
+    # Where the player's inputs come from. Polled once per tick (before the game is stepped),
+    # and then the game reads the same key state however many times it needs during that tick
+    # This base class never presses anything
+
+    def __init__(self):
+
+        self.keys = KeyState()
+
+    def poll(self):
+
+        pass
+
+    def get_pressed(self):
+
+        return self.keys
+
+
+class KeyboardInput(InputProvider):
+    # Inputs from the real keyboard
+
+    def poll(self):
+
+        self.keys.mask = keys_to_mask(pygame.key.get_pressed())
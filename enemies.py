@@ -1,11 +1,12 @@
 import math
 import pygame
 from settings import *
+from util import nearest_sprite
 
 
 class Enemy(pygame.sprite.Sprite):
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
         super().__init__(groups)
 
@@ -31,7 +32,7 @@ class Enemy(pygame.sprite.Sprite):
         self.initial_direction = initial_direction
 
         # Store attributes and function references
-        self.player = player
+        self.players = players  # Chases the nearest of them
         self.collision_sprites = collision_sprites
         self.create_particle_effect = create_particle_effect
         self.create_random_drop = create_random_drop
@@ -41,6 +42,22 @@ class Enemy(pygame.sprite.Sprite):
         # Health
         self.health = self.INITIAL_HEALTH
 
+    def get_state(self):
+
+        return (
+            tuple(self.pos), self.rect.topleft, self.hitbox.topleft, tuple(self.direction),
+            tuple(self.initial_direction), self.health, self.frame_index
+        )
+
+    def set_state(self, state):
+
+        pos, self.rect.topleft, self.hitbox.topleft, direction, initial_direction, self.health, self.frame_index = state
+
+        self.pos = pygame.math.Vector2(pos)
+        self.direction = pygame.math.Vector2(direction)
+        self.initial_direction = pygame.math.Vector2(initial_direction)
+        self.image = self.frames[int(self.frame_index)]
+
     def damage(self, damage):
         # Called when bullet collides with us, takes damage off enemies health. Different bullets have different damage
 
@@ -120,7 +137,8 @@ class Enemy(pygame.sprite.Sprite):
             # If zombie mode is active, we move in a direction vector the direct line away from player
             # Otherwise, we take our current direction vector and nudge it towards the player each frame
 
-            vector_to_player = pygame.math.Vector2(self.player.rect.center) - pygame.math.Vector2(self.rect.center)
+            player = nearest_sprite(self.rect.center, self.players)
+            vector_to_player = pygame.math.Vector2(player.rect.center) - pygame.math.Vector2(self.rect.center)
             unit_vector_to_player = vector_to_player.normalize()
 
             if self.tombstone_timer.active:
@@ -264,6 +282,26 @@ class Spikeball(pygame.sprite.Sprite):
         # Health
         self.health = self.HEALTH['initial']
 
+    def get_state(self):
+        # The path is stored as grid coordinates, and turned back into the grid's nodes when restored
+
+        return (
+            tuple(self.pos), self.rect.topleft, self.hitbox.topleft, [(node.x, node.y) for node in self.path],
+            self.next_grid, self.status, self.frame_index, self.health, self.z
+        )
+
+    def set_state(self, state, grid):
+
+        pos, self.rect.topleft, self.hitbox.topleft, path, self.next_grid, self.status, self.frame_index, self.health, self.z = state
+
+        self.pos = pygame.math.Vector2(pos)
+        self.path = [grid.node(x, y) for x, y in path]
+        if self.status == 'deployed':
+            self.image = self.frames['deployed'][0]
+        else:
+            current_animation = self.frames[self.status]
+            self.image = current_animation[min(int(self.frame_index), len(current_animation) - 1)]
+
     def damage(self, damage):
         # Called when bullet collides with us, takes damage off enemies health. Different bullets have different damage
 
@@ -366,9 +404,9 @@ class Ogre(Enemy):
         'none': 250
     }
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
-        super().__init__(frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
+        super().__init__(frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
 
 
 class Orc(Enemy):
@@ -395,9 +433,9 @@ class Orc(Enemy):
         'none': 250
     }
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
-        super().__init__(frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
+        super().__init__(frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
 
 
 class Mummy(Enemy):
@@ -424,9 +462,9 @@ class Mummy(Enemy):
         'none': 250
     }
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
-        super().__init__(frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
+        super().__init__(frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
 
 
 class Mushroom(Enemy):
@@ -453,9 +491,9 @@ class Mushroom(Enemy):
         'none': 250
     }
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
-        super().__init__(frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
+        super().__init__(frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
 
 
 class Butterfly(Enemy):
@@ -482,9 +520,9 @@ class Butterfly(Enemy):
         'none': 250
     }
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
-        super().__init__(frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
+        super().__init__(frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
 
 
 class Imp(Enemy):
@@ -511,6 +549,6 @@ class Imp(Enemy):
         'none': 250
     }
 
-    def __init__(self, frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
+    def __init__(self, frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups):
 
-        super().__init__(frames, pos, initial_direction, collision_sprites, player, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
+        super().__init__(frames, pos, initial_direction, collision_sprites, players, create_particle_effect, create_random_drop, smoke_bomb_timer, tombstone_timer, groups)
@@ -0,0 +1,292 @@
+import os
+import random
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pygame
+from settings import *
+from game_data import GameData
+from controls import InputProvider, KEY_BITS
+from util import GameClock, RandomStreams
+from simulate import build_level
+from observation import ObservationEncoder, OBSERVATION_SIZE
+
+
+# A level as a reset/step environment (in the style of Gymnasium, though it doesn't depend on it), for training agents
+# An action is 3 integers: the direction to move in and the direction to fire in (both indexes into DIRECTIONS,
+# where 0 is not moving/firing), and whether to use the stored powerup
+# The reward for each step comes from the coins picked up, enemies killed and times the player died in it
+
+DIRECTIONS = [(0, 0), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+ACTION_SIZES = (len(DIRECTIONS), len(DIRECTIONS), 2)
+
+REWARDS = {
+    'coins': 1.0,    # per coin (so a 5 coin drop is worth 5)
+    'kills': 0.1,    # per enemy killed
+    'deaths': -10.0  # per life lost
+}
+
+# Observations are the level's state encoded as a flat array (see observation.py)
+OBSERVATION_SHAPE = (OBSERVATION_SIZE,)
+
+
+def direction_mask(direction, left, right, up, down):
+
+    x, y = direction
+    mask = 0
+    if x != 0:
+        mask |= KEY_BITS[right] if x > 0 else KEY_BITS[left]
+    if y != 0:
+        mask |= KEY_BITS[down] if y > 0 else KEY_BITS[up]
+    return mask
+
+
+MOVE_MASKS = [direction_mask(direction, pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s) for direction in DIRECTIONS]
+FIRE_MASKS = [direction_mask(direction, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN) for direction in DIRECTIONS]
+
+
+class ActionInput(InputProvider):
+    # Presses the keys for an action, which stay pressed until the next action is set
+
+    def set_action(self, move, fire, use_powerup):
+
+        self.keys.mask = MOVE_MASKS[move] | FIRE_MASKS[fire] | (KEY_BITS[pygame.K_SPACE] if use_powerup else 0)
+
+
+class LevelEnvironment:
+    # One level, built once and then reset in place for each episode
+    # Each environment steps on its own game clock, so several can be run side by side in the same process
+    # Episodes end when the level is completed or the game is over, and are cut short after `max_seconds`
+    # Each step repeats the action for `frame_skip` ticks
+
+    def __init__(self, level_index=0, lives=2, easy_mode=True, max_seconds=180, frame_skip=4, rewards=None, observation=None):
+        # `observation` is an array to write observations into (e.g. a view of shared memory), instead of our own
+
+        self.lives = lives
+        self.max_ticks = int(max_seconds * TICKS_PER_SECOND)
+        self.frame_skip = frame_skip
+        self.rewards = dict(REWARDS, **(rewards or {}))
+        self.observation = observation if observation is not None else np.zeros(OBSERVATION_SHAPE, dtype=np.float32)
+
+        self.clock = GameClock()
+        self.input = ActionInput()
+        self.game_data = GameData(old_easy_mode=easy_mode, old_volume=0)
+        self.game_data.current_level = level_index
+        self.level = build_level(level_index, {}, self.game_data, self.input, self.clock)
+        self.encoder = ObservationEncoder(self.level, self.observation)
+
+        # Draws the seed for each episode's random streams, so a seeded environment gives the same episodes after it
+        self.seed_random = random.Random()
+
+        self.ticks = 0
+        self.enemies = set()
+
+    def reset(self, seed=None):
+
+        if seed is not None:
+            self.seed_random.seed(seed)
+
+        self.clock.activate()
+        self.clock.set_state((0, 0.0))
+
+        # Game data is changed in place, as the level & its sprites keep a reference to it
+        self.game_data.random_streams = RandomStreams(self.seed_random.randrange(2 ** 63))
+        self.game_data.lives = self.lives
+        self.game_data.coins = 0
+        self.game_data.deaths = 0
+        self.game_data.stored_powerup = None
+
+        self.level.reset()
+        self.input.keys.mask = 0
+
+        self.ticks = 0
+        self.enemies = set(self.level.enemy_sprites.sprites())
+
+        self.observe()
+        return self.observation, {}
+
+    def step(self, action):
+
+        move, fire, use_powerup = action
+        self.input.set_action(move, fire, use_powerup)
+
+        coins, deaths, kills = self.game_data.coins, self.game_data.deaths, 0
+        dt = 1 / TICKS_PER_SECOND
+
+        for _ in range(self.frame_skip):
+
+            deaths_before_tick = self.game_data.deaths
+            self.level.step(dt)
+            self.ticks += 1
+
+            # Enemies that have gone were killed, unless they were all removed because the player died
+            enemies = set(self.level.enemy_sprites.sprites())
+            if self.game_data.deaths == deaths_before_tick:
+                kills += len(self.enemies - enemies)
+            self.enemies = enemies
+
+            if self.level.level_completed or self.level.game_over:
+                break
+
+        info = {
+            'coins': self.game_data.coins - coins,
+            'kills': kills,
+            'deaths': self.game_data.deaths - deaths
+        }
+        reward = sum(self.rewards[name] * info[name] for name in self.rewards)
+        terminated = self.level.level_completed or self.level.game_over
+        truncated = not terminated and self.ticks >= self.max_ticks
+
+        self.observe()
+        return self.observation, reward, terminated, truncated, info
+
+    def observe(self):
+
+        self.encoder.encode()
+
+
+# Commands from the vector environment to its workers
+RESET, STEP, CLOSE = range(3)
+
+
+def array_layout(num_envs):
+    # The arrays the vector environment & its workers share, as name -> (shape, dtype)
+    # Each is backed by its own block of shared memory
+
+    return {
+        'command': ((1,), np.int64),
+        'seeds': ((num_envs,), np.int64),
+        'actions': ((num_envs, len(ACTION_SIZES)), np.int64),
+        'observations': ((num_envs,) + OBSERVATION_SHAPE, np.float32),
+        'rewards': ((num_envs,), np.float32),
+        'terminated': ((num_envs,), np.bool_),
+        'truncated': ((num_envs,), np.bool_)
+    }
+
+
+def shared_arrays(shared_memories, num_envs):
+
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=shared_memories[name].buf)
+        for name, (shape, dtype) in array_layout(num_envs).items()
+    }
+
+
+def run_worker(env_indices, memory_names, num_envs, barrier, env_kwargs):
+    # Steps its share of the environments whenever the vector environment tells it to
+    # Each command is started & finished by everyone waiting on the barrier, and nothing but the command is pickled
+
+    shared_memories = {name: shared_memory.SharedMemory(name=memory_name) for name, memory_name in memory_names.items()}
+    arrays = shared_arrays(shared_memories, num_envs)
+
+    try:
+        envs = {index: LevelEnvironment(observation=arrays['observations'][index], **env_kwargs) for index in env_indices}
+
+        while True:
+            barrier.wait()
+            command = arrays['command'][0]
+            if command == CLOSE:
+                break
+
+            for index, env in envs.items():
+                if command == RESET:
+                    env.reset(seed=None if arrays['seeds'][index] < 0 else int(arrays['seeds'][index]))
+                else:
+                    _, reward, terminated, truncated, _ = env.step(arrays['actions'][index])
+                    arrays['rewards'][index] = reward
+                    arrays['terminated'][index] = terminated
+                    arrays['truncated'][index] = truncated
+                    # Start the next episode straight away, so its first observation is the one returned
+                    if terminated or truncated:
+                        env.reset()
+
+            barrier.wait()
+
+    except BaseException:
+        # Let the vector environment know, rather than leaving it waiting on the barrier forever
+        barrier.abort()
+        raise
+
+    finally:
+        del arrays
+        for memory in shared_memories.values():
+            memory.close()
+
+
+class VectorEnvironment:
+    # Steps `num_envs` level environments, spread over worker processes, all at once
+    # Actions, observations, rewards & done flags are passed through shared memory, so there's no pickling per step
+    # The arrays returned are views of that memory, which the next step overwrites (copy them to keep them)
+    # Environments whose episode ended are reset straight away, so the observation returned is of the new episode
+
+    def __init__(self, num_envs, workers=None, **env_kwargs):
+
+        self.num_envs = num_envs
+        workers = min(num_envs, workers or os.cpu_count())
+
+        self.shared_memories = {
+            name: shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            for name, (shape, dtype) in array_layout(num_envs).items()
+        }
+        self.arrays = shared_arrays(self.shared_memories, num_envs)
+
+        context = multiprocessing.get_context('spawn')
+        self.barrier = context.Barrier(workers + 1)
+        memory_names = {name: memory.name for name, memory in self.shared_memories.items()}
+        self.processes = [
+            context.Process(
+                target=run_worker,
+                args=(list(range(worker, num_envs, workers)), memory_names, num_envs, self.barrier, env_kwargs),
+                daemon=True
+            )
+            for worker in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        self.closed = False
+
+    def run_command(self, command):
+
+        self.arrays['command'][0] = command
+        self.barrier.wait()  # Start
+        self.barrier.wait()  # Finish
+
+    def reset(self, seed=None):
+        # With a seed, environment i is seeded with seed + i
+
+        self.arrays['seeds'][:] = -1 if seed is None else seed + np.arange(self.num_envs)
+        self.run_command(RESET)
+        return self.arrays['observations'], {}
+
+    def step(self, actions):
+        # `actions` is an array of shape (num_envs, 3)
+
+        self.arrays['actions'][:] = actions
+        self.run_command(STEP)
+        return self.arrays['observations'], self.arrays['rewards'], self.arrays['terminated'], self.arrays['truncated'], {}
+
+    def close(self):
+
+        if self.closed:
+            return
+        self.closed = True
+
+        if not self.barrier.broken:
+            self.arrays['command'][0] = CLOSE
+            self.barrier.wait()
+        for process in self.processes:
+            process.join()
+
+        del self.arrays
+        for memory in self.shared_memories.values():
+            memory.close()
+            memory.unlink()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
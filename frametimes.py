@@ -0,0 +1,176 @@
+import sys
+import math
+import heapq
+from instruments import Instrument
+
+
+# Reports how smooth a level ran whenever it's completed or the player dies: the p50/p95/p99/max frame time, how many
+# frames went over budget, and the worst hitches along with what happened on those frames (e.g. enemies spawning, a
+# nuke, a burst of particles, or the level being built), since an average hides the odd long frame players notice
+#
+# Frame times go into a histogram with log spaced buckets (so each percentile is within a few percent, at a fixed cost
+# per frame however long the level runs), and only the worst few frames are kept, in a heap
+# Frame times are the time spent on the frame's work, not counting the wait for the frame limiter
+#
+# The game notes what happens on a frame with `note_event('spawn')` etc., which does nothing unless a report is active
+
+FRAME_BUDGET_MS = 1000 / 60
+
+MIN_FRAME_MS = 0.05          # Frames quicker than this all go in the first bucket
+BUCKETS_PER_DOUBLING = 16    # So bucket bounds are ~4.4% apart
+BUCKET_COUNT = 20 * BUCKETS_PER_DOUBLING
+
+
+def bucket_index(frame_ms):
+
+    if frame_ms <= MIN_FRAME_MS:
+        return 0
+    return min(BUCKET_COUNT - 1, int(math.log2(frame_ms / MIN_FRAME_MS) * BUCKETS_PER_DOUBLING))
+
+
+def bucket_upper_bound(index):
+
+    return MIN_FRAME_MS * 2 ** ((index + 1) / BUCKETS_PER_DOUBLING)
+
+
+class FrameTimeHistogram:
+
+    def __init__(self):
+
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.max_ms = 0
+
+    def add(self, frame_ms):
+
+        self.counts[bucket_index(frame_ms)] += 1
+        self.count += 1
+        self.max_ms = max(self.max_ms, frame_ms)
+
+    def percentile(self, percent):
+        # The upper bound of the bucket the percentile falls in (but never more than the longest frame)
+
+        if self.count == 0:
+            return 0
+
+        target = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket_upper_bound(index), self.max_ms)
+        return self.max_ms
+
+
+class FrameTimeReport(Instrument):
+    # As one of the game's instruments, it records every frame's work time. It must be activated too, to note events
+
+    active = None  # The report `note_event` notes events to, if any
+
+    def __init__(self, budget_ms=FRAME_BUDGET_MS, hitch_count=5, file=sys.stdout):
+
+        self.budget_ms = budget_ms
+        self.hitch_count = hitch_count
+        self.file = file
+        self.reports = []  # Every report so far, as dicts
+
+        # The level being measured, and what to compare against to see when it's completed or the player has died
+        self.level = None
+        self.level_index = None
+        self.level_completed = False
+        self.deaths = 0
+
+        self.frame_events = []
+        self.start_segment()
+
+    def activate(self):
+
+        FrameTimeReport.active = self
+
+    def deactivate(self):
+
+        if FrameTimeReport.active is self:
+            FrameTimeReport.active = None
+
+    def start_segment(self):
+
+        self.histogram = FrameTimeHistogram()
+        self.over_budget = 0
+        self.hitches = []  # Min heap of (frame ms, frame, events), the worst `hitch_count` frames
+
+    def record_frame(self, frame, frame_ms, level_index, level):
+        # Called once every frame, after it's finished. `level` is None when not in a level
+
+        events, self.frame_events = self.frame_events, []
+
+        if level is not self.level:
+            # A new level (or the intro screen) starts a new segment
+            self.level, self.level_index = level, level_index
+            self.level_completed = level is not None and level.level_completed
+            self.deaths = level.game_data.deaths if level is not None else 0
+            self.start_segment()
+
+        if level is None:
+            return
+
+        self.histogram.add(frame_ms)
+        if frame_ms > self.budget_ms:
+            self.over_budget += 1
+        hitch = (frame_ms, frame, events)
+        if len(self.hitches) < self.hitch_count:
+            heapq.heappush(self.hitches, hitch)
+        elif frame_ms > self.hitches[0][0]:
+            heapq.heapreplace(self.hitches, hitch)
+
+        if level.level_completed and not self.level_completed:
+            self.level_completed = True
+            self.report('completed')
+        elif level.game_data.deaths != self.deaths:
+            self.deaths = level.game_data.deaths
+            self.report('died')
+
+    def frame_ended(self, game, frame_time, dt, work_time):
+
+        self.record_frame(game.frame, work_time * 1000, game.game_data.current_level, game.playing_level())
+
+    def report(self, outcome):
+        # Report on the frames since the level started (or the last report), and start measuring again
+
+        histogram = self.histogram
+        report = {
+            'level': self.level_index,
+            'outcome': outcome,
+            'frames': histogram.count,
+            'p50': histogram.percentile(50),
+            'p95': histogram.percentile(95),
+            'p99': histogram.percentile(99),
+            'max': histogram.max_ms,
+            'over_budget': self.over_budget,
+            'hitches': sorted(self.hitches, reverse=True)
+        }
+        self.reports.append(report)
+        self.start_segment()
+
+        if self.file is not None:
+            print(format_report(report, self.budget_ms), file=self.file)
+
+
+def format_report(report, budget_ms=FRAME_BUDGET_MS):
+
+    lines = [
+        'Level %d %s after %d frames: p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, max %.1f ms, %d over %.1f ms budget' % (
+            report['level'], report['outcome'], report['frames'], report['p50'], report['p95'], report['p99'],
+            report['max'], report['over_budget'], budget_ms
+        )
+    ]
+    for frame_ms, frame, events in report['hitches']:
+        lines.append('  frame %d: %.1f ms  %s' % (frame, frame_ms, ', '.join(events) if events else '-'))
+    return '\n'.join(lines)
+
+
+def note_event(event):
+    # Note that something happened on this frame (e.g. 'spawn'), to show alongside it if it turns out to be a hitch
+
+    report = FrameTimeReport.active
+    if report is not None and event not in report.frame_events:
+        report.frame_events.append(event)
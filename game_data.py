@@ -1,20 +1,23 @@
-from boss_level import BossLevel
-from shop_level import ShopLevel
-from normal_level import NormalLevel
+import importlib
+from util import RandomStreams
 from enemies import Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
 
 
 class GameData:
 
-    def __init__(self, old_easy_mode=None, old_volume=None):
+    def __init__(self, old_easy_mode=None, old_volume=None, random_streams=None):
 
         self.lives = 0
         self.coins = 0
+        self.deaths = 0
         self.stored_powerup = None
         self.current_level = -1
         self.volume = old_volume if old_volume is not None else 1
         self.easy_mode = old_easy_mode if old_easy_mode is not None else True
 
+        # Everything random in the game draws from these, so the session can be reproduced from its seed
+        self.random_streams = random_streams if random_streams is not None else RandomStreams()
+
         # -1 represents no upgrades purchased
         # current number + 1 represents the next available upgrade
         self.upgrades = {
@@ -23,6 +26,31 @@ class GameData:
             'ammo': -1
         }
 
+    def get_state(self):
+
+        return self.lives, self.coins, self.deaths, self.stored_powerup, self.current_level, dict(self.upgrades), self.random_streams.get_state()
+
+    def set_state(self, state):
+
+        self.lives, self.coins, self.deaths, self.stored_powerup, self.current_level, upgrades, random_streams_state = state
+        self.upgrades = dict(upgrades)
+        self.random_streams.set_state(random_streams_state)
+
+
+# Each type of level, by the module & class that build it. They (and the sprites etc. they import) are only imported
+# when a level of that type is first built, rather than at start up
+LEVEL_TYPES = {
+    'normal': ('normal_level', 'NormalLevel'),
+    'shop': ('shop_level', 'ShopLevel'),
+    'boss': ('boss_level', 'BossLevel')
+}
+
+
+def level_class(level_data):
+
+    module_name, class_name = LEVEL_TYPES[level_data['level_type']]
+    return getattr(importlib.import_module(module_name), class_name)
+
 
 LEVEL_DATA = {
     0: {
@@ -30,7 +58,7 @@ LEVEL_DATA = {
         'tmx': 'data/0/level_0.tmx',
         'duration': 30000,
         'type': 'desert',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Orc, 'spawn_rate': 1000, 'p': [0.5, 0.3, 0.2]}
         ]
@@ -40,7 +68,7 @@ LEVEL_DATA = {
         'tmx': 'data/1/level_1.tmx',
         'duration': 35000,
         'type': 'desert',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Orc, 'spawn_rate': 900, 'p': [0.4, 0.3, 0.3]},
             {'type': Spikeball, 'spawn_rate': 5000}
@@ -51,7 +79,7 @@ LEVEL_DATA = {
         'tmx': 'data/2/level_2.tmx',
         'duration': 35000,
         'type': 'desert',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Orc, 'spawn_rate': 900, 'p': [0.3, 0.3, 0.4]},
             {'type': Ogre, 'spawn_rate': 2500},
@@ -63,7 +91,7 @@ LEVEL_DATA = {
         'tmx': 'data/3/level_3.tmx',
         'duration': 40000,
         'type': 'desert',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Orc, 'spawn_rate': 800, 'p': [0.1, 0.5, 0.4]},
             {'type': Ogre, 'spawn_rate': 2000},
@@ -74,14 +102,14 @@ LEVEL_DATA = {
         'bg': 'data/desert_bg.png',
         'tmx': 'data/4/level_4.tmx',
         'type': 'desert',
-        'level_type': ShopLevel,
+        'level_type': 'shop',
         'enemies': []
     },
     5: {
         'bg': 'data/desert_bg.png',
         'tmx': 'data/5/level_5.tmx',
         'type': 'desert',
-        'level_type': BossLevel,
+        'level_type': 'boss',
         'boss_health': 50,
         'bullet_cooldown': 300,
         'firing_strategy': 'upwards',
@@ -92,7 +120,7 @@ LEVEL_DATA = {
         'tmx': 'data/6/level_6.tmx',
         'duration': 40000,
         'type': 'forest',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Ogre, 'spawn_rate': 2000},
             {'type': Mushroom, 'spawn_rate': 1600},
@@ -104,7 +132,7 @@ LEVEL_DATA = {
         'tmx': 'data/7/level_7.tmx',
         'duration': 45000,
         'type': 'forest',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Ogre, 'spawn_rate': 2000},
             {'type': Mushroom, 'spawn_rate': 1500},
@@ -116,7 +144,7 @@ LEVEL_DATA = {
         'tmx': 'data/8/level_8.tmx',
         'duration': 50000,
         'type': 'forest',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Ogre, 'spawn_rate': 1750},
             {'type': Mushroom, 'spawn_rate': 1300},
@@ -127,14 +155,14 @@ LEVEL_DATA = {
         'bg': 'data/forest_bg.png',
         'tmx': 'data/9/level_9.tmx',
         'type': 'forest',
-        'level_type': ShopLevel,
+        'level_type': 'shop',
         'enemies': []
     },
     10: {
         'bg': 'data/forest_bg.png',
         'tmx': 'data/10/level_10.tmx',
         'type': 'forest',
-        'level_type': BossLevel,
+        'level_type': 'boss',
         'boss_health': 100,
         'bullet_cooldown': 200,
         'firing_strategy': 'towards_player',
@@ -145,7 +173,7 @@ LEVEL_DATA = {
         'tmx': 'data/11/level_11.tmx',
         'duration': 50000,
         'type': 'graveyard',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Mummy, 'spawn_rate': 1200, 'p': [0.1, 0.2, 0.7]},
             {'type': Imp, 'spawn_rate': 1300}
@@ -156,7 +184,7 @@ LEVEL_DATA = {
         'tmx': 'data/12/level_12.tmx',
         'duration': 50000,
         'type': 'graveyard',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Mummy, 'spawn_rate': 1000, 'p': [0.1, 0.1, 0.8]},
             {'type': Imp, 'spawn_rate': 1100}
@@ -167,7 +195,7 @@ LEVEL_DATA = {
         'tmx': 'data/13/level_13.tmx',
         'duration': 60000,
         'type': 'graveyard',
-        'level_type': NormalLevel,
+        'level_type': 'normal',
         'enemies': [
             {'type': Mummy, 'spawn_rate': 800, 'p': [0.0, 0.1, 0.9]},
             {'type': Imp, 'spawn_rate': 900}
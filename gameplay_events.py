@@ -0,0 +1,160 @@
+import struct
+from util import get_ticks
+
+
+# A stream of what happens in the game (enemies spawning & dying, drops, powerups, purchases, deaths), for analytics
+# Each event is a fixed size binary record, packed straight into a buffer allocated up front, which is written out in
+# one go whenever it fills up, so logging an event costs about as much as a function call
+#
+# A record is the game time (in ms, since the session started), the level, the kind of event, two small values whose
+# meaning depends on the kind (e.g. for a kill, the enemy type and what killed it), and the position it happened at
+#
+# The game logs events with `log_event(...)`, which does nothing unless an event log is active or something is listening
+# Listeners (e.g. heatmaps, see heatmaps.py) are functions called with each event's (kind, detail, extra, position)
+
+MAGIC = b'PKEV'
+VERSION = 1
+HEADER = struct.Struct('<4sBH')      # Magic, version, record size
+RECORD = struct.Struct('<IBBBBhh')   # Game time, level, kind, detail, extra, x, y
+
+# Kinds of event, and what their detail & extra are
+LEVEL_START = 0         # Level index
+SPAWN = 1               # Enemy type, side of the map
+KILL = 2                # Enemy type, cause
+DROP_CREATED = 3        # Drop name
+DROP_COLLECTED = 4      # Drop name, player
+POWERUP_APPLIED = 5     # Drop name
+PURCHASE = 6            # Upgrade type, new upgrade level
+PLAYER_DEATH = 7        # Whether it was game over, player
+KINDS = ['level_start', 'spawn', 'kill', 'drop_created', 'drop_collected', 'powerup_applied', 'purchase', 'player_death']
+
+ENEMY_TYPES = ['Orc', 'Ogre', 'Butterfly', 'Mushroom', 'Mummy', 'Imp', 'Spikeball', 'Cowboy']
+SIDES = ['top', 'left', 'bottom', 'right']
+KILL_CAUSES = ['bullet', 'zombie', 'nuke']
+DROP_NAMES = [
+    'one', 'five', 'coffee', 'extra_life', 'machine_gun', 'nuke', 'sheriff_badge', 'shotgun', 'smoke_bomb',
+    'tombstone', 'wagon_wheel'
+]
+UPGRADE_TYPES = ['boots', 'gun', 'ammo']
+
+# Name -> index, for each of the above
+ENEMY_TYPE_INDEXES = {name: index for index, name in enumerate(ENEMY_TYPES)}
+SIDE_INDEXES = {name: index for index, name in enumerate(SIDES)}
+KILL_CAUSE_INDEXES = {name: index for index, name in enumerate(KILL_CAUSES)}
+DROP_NAME_INDEXES = {name: index for index, name in enumerate(DROP_NAMES)}
+UPGRADE_TYPE_INDEXES = {name: index for index, name in enumerate(UPGRADE_TYPES)}
+
+
+listeners = []
+
+
+class EventLog:
+
+    active = None  # The log `log_event` logs to, if any
+
+    def __init__(self, path, capacity=4096):
+        # `capacity` is how many events are buffered before they're written out
+
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.capacity = capacity
+        self.count = 0
+        self.level = 0
+        self.total = 0
+
+    def activate(self):
+
+        EventLog.active = self
+
+    def deactivate(self):
+
+        if EventLog.active is self:
+            EventLog.active = None
+
+    def log(self, kind, detail, extra, pos):
+
+        RECORD.pack_into(self.buffer, self.count * RECORD.size, get_ticks(), self.level, kind, detail, extra, int(pos[0]), int(pos[1]))
+        self.count += 1
+        if self.count == self.capacity:
+            self.flush()
+
+    def flush(self):
+
+        self.file.write(memoryview(self.buffer)[:self.count * RECORD.size])
+        self.total += self.count
+        self.count = 0
+
+    def close(self):
+
+        self.flush()
+        self.file.close()
+        self.deactivate()
+
+    def stats(self):
+
+        return 'Event log: %d events' % self.total
+
+
+def log_event(kind, detail=0, extra=0, pos=(0, 0)):
+
+    event_log = EventLog.active
+    if event_log is not None:
+        event_log.log(kind, detail, extra, pos)
+    for listener in listeners:
+        listener(kind, detail, extra, pos)
+
+
+def log_level_start(level_index):
+    # Events are tagged with the level they happened in, from when it starts
+
+    if EventLog.active is not None:
+        EventLog.active.level = level_index
+    log_event(LEVEL_START, level_index)
+
+
+def read_events(path):
+    # Returns a list of (game time, level, kind, detail, extra, x, y)
+
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, version, record_size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError('%s is not a version %d event log' % (path, VERSION))
+
+    return list(RECORD.iter_unpack(memoryview(data)[HEADER.size:]))
+
+
+def describe_event(event):
+    # An event as a line of text, with its kind, detail & extra named
+
+    time, level, kind, detail, extra, x, y = event
+    kind_name = KINDS[kind]
+    if kind == SPAWN:
+        values = '%s from the %s' % (ENEMY_TYPES[detail], SIDES[extra])
+    elif kind == KILL:
+        values = '%s by %s' % (ENEMY_TYPES[detail], KILL_CAUSES[extra])
+    elif kind == DROP_CREATED or kind == POWERUP_APPLIED:
+        values = DROP_NAMES[detail]
+    elif kind == DROP_COLLECTED:
+        values = '%s by player %d' % (DROP_NAMES[detail], extra)
+    elif kind == PURCHASE:
+        values = '%s level %d' % (UPGRADE_TYPES[detail], extra)
+    elif kind == PLAYER_DEATH:
+        values = 'player %d%s' % (extra, ', game over' if detail else '')
+    else:
+        values = ''
+    return '%8d ms  level %2d  %-16s %-28s (%d, %d)' % (time, level, kind_name, values, x, y)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print an event log (as written by main.py --event-log)')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    for event in read_events(args.path):
+        print(describe_event(event))
@@ -0,0 +1,102 @@
+import gc
+import time
+from game_data import LEVEL_DATA
+from instruments import Instrument
+
+
+# Bullets, particles, drops, timers and Vector2s are created every frame, so the cyclic garbage collector runs often,
+# and a full (generation 2) collection can land in the middle of play as a 10ms+ pause
+#
+# GCMonitor times every collection (through gc.callbacks), for the debug HUD and telemetry
+# GCPolicy moves the collections out of play: when a level has been built (half way through the transition to it,
+# while the screen is covered) it collects everything and freezes what's left (the level's tiles, assets etc. that live
+# as long as the level) so later collections don't keep scanning it, then raises the thresholds, and stops generation 2
+# collections until the next level is built. In the shop, where nothing's happening, the default thresholds are kept
+
+GENERATIONS = 3
+
+
+class GCMonitor:
+
+    def __init__(self):
+
+        self.collections = [0] * GENERATIONS
+        self.total_ms = 0
+        self.max_ms = 0
+        self.last_ms = 0
+        self.last_generation = None
+        self.frame_ms = 0  # Time spent collecting since `take_frame_ms` was last called
+        self.start_time = None
+
+    def install(self):
+
+        if self.callback not in gc.callbacks:
+            gc.callbacks.append(self.callback)
+
+    def uninstall(self):
+
+        if self.callback in gc.callbacks:
+            gc.callbacks.remove(self.callback)
+
+    def callback(self, phase, info):
+
+        if phase == 'start':
+            self.start_time = time.perf_counter()
+            return
+
+        if self.start_time is None:
+            return  # Installed part way through a collection
+        pause_ms = (time.perf_counter() - self.start_time) * 1000
+        self.start_time = None
+
+        generation = info['generation']
+        self.collections[generation] += 1
+        self.total_ms += pause_ms
+        self.max_ms = max(self.max_ms, pause_ms)
+        self.last_ms = pause_ms
+        self.last_generation = generation
+        self.frame_ms += pause_ms
+
+    def take_frame_ms(self):
+        # The time spent collecting since last called, i.e. during the frame when called once a frame
+
+        frame_ms, self.frame_ms = self.frame_ms, 0
+        return frame_ms
+
+    def hud_text(self):
+
+        return 'GC %s | last %.1f ms (gen %s) | max %.1f ms | total %.0f ms' % (
+            '/'.join(str(count) for count in self.collections), self.last_ms,
+            '-' if self.last_generation is None else self.last_generation, self.max_ms, self.total_ms
+        )
+
+
+class GCPolicy(Instrument):
+    # One of the game's instruments, as it acts whenever a level is loaded and whenever a session ends
+
+    # Thresholds while playing: collect the young generation less often (each collection is still quick),
+    # and never get as far as a full collection
+    PLAY_THRESHOLDS = (5000, 20, 1_000_000)
+
+    def __init__(self):
+
+        self.default_thresholds = gc.get_threshold()
+
+    def level_loaded(self, game, level):
+        # Called once a level has been built, while the transition covers the screen
+
+        # The shop has no enemies, so collections can carry on as normal in it
+        quiet = LEVEL_DATA[game.game_data.current_level]['level_type'] == 'shop'
+
+        # What was frozen for the last level may be garbage now, so it has to be unfrozen to be collected
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        gc.set_threshold(*(self.default_thresholds if quiet else self.PLAY_THRESHOLDS))
+
+    def session_ended(self, game):
+        # Called when going back to the intro screen, where pauses don't matter
+
+        gc.unfreeze()
+        gc.set_threshold(*self.default_thresholds)
+        gc.collect()
@@ -0,0 +1,179 @@
+import os
+import numpy as np
+from settings import *
+import gameplay_events
+from gameplay_events import LEVEL_START, KILL, DROP_COLLECTED, PLAYER_DEATH
+from instruments import Instrument
+
+
+# Counts where things happen in each level, on the level's 16x16 tile grid (or a finer one), for level designers:
+# where the players spend their time, where they die, where enemies are killed, and where drops are picked up
+#
+# Deaths, kills & pickups come from the gameplay events (see gameplay_events.py), and the players' positions are added
+# once per tick, so it's cheap enough to leave on in batch simulations. Heatmaps are plain NumPy arrays, so those from
+# many processes can be sent back & added together, saved as .npz files, and drawn as images over the level background
+
+LAYERS = ['occupancy', 'deaths', 'kills', 'pickups']
+OCCUPANCY, DEATHS, KILLS, PICKUPS = range(len(LAYERS))
+
+# Event kind -> layer it's counted in
+EVENT_LAYERS = {PLAYER_DEATH: DEATHS, KILL: KILLS, DROP_COLLECTED: PICKUPS}
+
+
+class LevelHeatmap:
+
+    def __init__(self, level_index, cells_per_tile=1, counts=None):
+
+        self.level_index = level_index
+        self.cells_per_tile = cells_per_tile
+        self.cell_size = TILE_SIZE * ZOOM_FACTOR / cells_per_tile
+        self.rows, self.columns = TILES_HIGH * cells_per_tile, TILES_WIDE * cells_per_tile
+        self.counts = counts if counts is not None else np.zeros((len(LAYERS), self.rows, self.columns), dtype=np.int64)
+
+    def add(self, layer, pos):
+        # Positions off the map (e.g. enemies killed as they walk on) count in the nearest cell on it
+
+        column = min(max(int(pos[0] // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(pos[1] // self.cell_size), 0), self.rows - 1)
+        self.counts[layer, row, column] += 1
+
+    def add_players(self, level):
+
+        for player in level.players:
+            self.add(OCCUPANCY, player.hitbox.center)
+
+    def merge(self, other):
+
+        if other.cells_per_tile != self.cells_per_tile:
+            raise ValueError('can\'t merge heatmaps with %d and %d cells per tile' % (self.cells_per_tile, other.cells_per_tile))
+        self.counts += other.counts
+
+    def save(self, path):
+
+        np.savez_compressed(path, level_index=self.level_index, cells_per_tile=self.cells_per_tile, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+
+        with np.load(path) as data:
+            return cls(int(data['level_index']), int(data['cells_per_tile']), data['counts'].copy())
+
+    def render(self, layer, scale=ZOOM_FACTOR):
+        # The layer drawn over the level's background, as a pygame surface. Counts are shown on a log scale, from
+        # transparent yellow for the fewest to opaque red for the most
+
+        import pygame
+        from game_data import LEVEL_DATA
+
+        background = pygame.image.load(LEVEL_DATA[self.level_index]['bg'])
+        width, height = background.get_size()
+
+        counts = self.counts[layer]
+        intensity = np.log1p(counts) / max(np.log1p(counts.max()), 1e-9)
+
+        # Each pixel of the background takes the cell it's in, however many pixels a cell covers (which needn't be a
+        # whole number, e.g. with 3 cells per 16 pixel tile). Pixel arrays are indexed (x, y), hence the transpose
+        rows = np.arange(height) * self.rows // height
+        columns = np.arange(width) * self.columns // width
+        intensity = intensity[np.ix_(rows, columns)].T
+
+        overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+        pixels = pygame.surfarray.pixels3d(overlay)
+        pixels[..., 0] = 255
+        pixels[..., 1] = (255 * (1 - intensity)).astype(np.uint8)
+        pixels[..., 2] = 0
+        del pixels
+        alpha = pygame.surfarray.pixels_alpha(overlay)
+        alpha[...] = np.where(intensity > 0, 60 + 160 * intensity, 0).astype(np.uint8)
+        del alpha
+
+        image = background.copy()
+        image.blit(overlay, (0, 0))
+        return pygame.transform.scale_by(image, scale)
+
+    def export_images(self, directory, scale=ZOOM_FACTOR):
+        # Writes level_NN_<layer>.png for each layer
+
+        import pygame
+
+        for layer, name in enumerate(LAYERS):
+            path = os.path.join(directory, 'level_%02d_%s.png' % (self.level_index, name))
+            pygame.image.save(self.render(layer, scale), path)
+
+
+class HeatmapRecorder(Instrument):
+    # Keeps a heatmap per level (by its index in LEVEL_DATA), adding to the level being played
+    # Listens to the gameplay events once started, and `add_tick` should be called with the level once per tick
+    # (which it is as one of the game's instruments)
+
+    def __init__(self, cells_per_tile=1):
+
+        self.cells_per_tile = cells_per_tile
+        self.heatmaps = {}
+        self.current = None
+
+    def start(self):
+
+        if self.on_event not in gameplay_events.listeners:
+            gameplay_events.listeners.append(self.on_event)
+
+    def stop(self):
+
+        if self.on_event in gameplay_events.listeners:
+            gameplay_events.listeners.remove(self.on_event)
+
+    def heatmap(self, level_index):
+
+        if level_index not in self.heatmaps:
+            self.heatmaps[level_index] = LevelHeatmap(level_index, self.cells_per_tile)
+        return self.heatmaps[level_index]
+
+    def on_event(self, kind, detail, extra, pos):
+
+        if kind == LEVEL_START:
+            self.current = self.heatmap(detail)
+        elif self.current is not None and kind in EVENT_LAYERS:
+            self.current.add(EVENT_LAYERS[kind], pos)
+
+    def add_tick(self, level):
+
+        if self.current is not None:
+            self.current.add_players(level)
+
+    def tick_ended(self, game, level):
+
+        if level is not None:
+            self.add_tick(level)
+
+    def merge(self, heatmaps):
+        # Add heatmaps (e.g. sent back from other processes) to ours
+
+        for heatmap in heatmaps:
+            self.heatmap(heatmap.level_index).merge(heatmap)
+
+    def save(self, directory, images=True):
+        # Writes level_NN.npz for each level, and its images
+
+        os.makedirs(directory, exist_ok=True)
+        for level_index, heatmap in sorted(self.heatmaps.items()):
+            heatmap.save(os.path.join(directory, 'level_%02d.npz' % level_index))
+            if images:
+                heatmap.export_images(directory)
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Merge heatmaps (e.g. from separate runs) and draw them as images')
+    parser.add_argument('output_dir')
+    parser.add_argument('heatmaps', nargs='+', metavar='NPZ', help='level_NN.npz files, from any number of levels & runs')
+    args = parser.parse_args()
+
+    # Images are drawn on surfaces without a window
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+    heatmaps = [LevelHeatmap.load(path) for path in args.heatmaps]
+    recorder = HeatmapRecorder(heatmaps[0].cells_per_tile)
+    recorder.merge(heatmaps)
+    recorder.save(args.output_dir)
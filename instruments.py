@@ -0,0 +1,55 @@
+class Instrument:
+    # Something that watches the game as it runs: profilers, telemetry, logs, spectators, the debug HUD, ...
+    # The game is given a list of them, and calls each of these on every one, at the same fixed points
+    # This base class does nothing at any of them, so each instrument only overrides the ones it needs
+
+    def run_started(self, game):
+        # When `Game.run` starts
+
+        pass
+
+    def run_ended(self, game):
+        # When `Game.run` ends, however it ends
+
+        pass
+
+    def frame_started(self, game):
+        # At the start of every frame, before the game handles its events
+
+        pass
+
+    def tick_ended(self, game, level):
+        # After every tick the game is stepped by, with the level being played (None on the intro screen)
+
+        pass
+
+    def frame_drawn(self, game):
+        # Once every frame has been drawn, before it's shown
+
+        pass
+
+    def frame_shown(self, game):
+        # Once every frame is on screen
+
+        pass
+
+    def frame_ended(self, game, frame_time, dt, work_time):
+        # At the end of every frame, `frame_time` seconds since the last one ended, after stepping by `dt` seconds
+        # `work_time` is how long the frame took, in seconds, not counting waiting to limit the frame rate
+
+        pass
+
+    def level_started(self, game, level_index):
+        # When switching to a level, before it's built
+
+        pass
+
+    def level_loaded(self, game, level):
+        # Once a level has been built, while the transition to it still covers the screen
+
+        pass
+
+    def session_ended(self, game):
+        # When a game is over (or finished, or quit), before going back to the intro screen
+
+        pass
@@ -102,11 +102,11 @@ class RotatingSprite(pygame.sprite.Sprite):
 
 class IntroScreen:
 
-    def __init__(self, game_data, assets, transition_to_next_level, update_volume):
+    def __init__(self, game_data, assets, transition_to_next_level, update_volume, display_surface=None):
 
         # Setup
         self.game_data = game_data
-        self.display_surface = pygame.display.get_surface()
+        self.display_surface = display_surface if display_surface is not None else pygame.display.get_surface()
         self.transition_to_next_level = transition_to_next_level
         self.update_volume = update_volume
 
@@ -188,9 +188,7 @@ class IntroScreen:
         self.hard_text_surf = self.font.render('Hard', False, (230, 230, 230))
         self.hard_text_rect = self.hard_text_surf.get_rect(midleft=(self.difficulty_button.rect.right + 50, self.difficulty_button.rect.centery))
 
-    def run(self, dt):
-
-        # Event Loop
+    def handle_events(self):
 
         for event in pygame.event.get():
 
@@ -213,10 +211,11 @@ class IntroScreen:
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                 self.transition_to_next_level()
 
-        # Updates
+    def update(self, dt):
+
         self.all_sprites.update(dt)
 
-        # Drawing
+    def draw(self):
 
         self.display_surface.fill((238, 183, 81))
         self.all_sprites.draw(self.display_surface)
@@ -225,3 +224,9 @@ class IntroScreen:
         self.display_surface.blit(self.hard_text_surf, self.hard_text_rect)
         self.display_surface.blit(self.welcome_message_surf, self.welcome_message_rect)
         self.display_surface.blit(self.keyboard_surf, self.keyboard_rect)
+
+    def run(self, dt):
+
+        self.handle_events()
+        self.update(dt)
+        self.draw()
@@ -0,0 +1,103 @@
+import sys
+import time
+import pygame
+from instruments import Instrument
+
+
+# Measures the time from a key being pressed to the first frame showing its effect being on screen: for a movement key,
+# the player's direction changing, and for a fire key, a bullet being created (through `BaseLevel.create_bullet`)
+# The player reads the keys once per frame (in `Player.input`), so a press waits for the next frame's update, then that
+# frame's drawing and display flip, which is what we want to see change as the loop is restructured
+#
+# pygame doesn't expose SDL's event timestamps, so key presses are timestamped as the game takes them off the queue at
+# the start of the frame. They're taken off to be timestamped, then put straight back for the game to handle as usual
+#
+# It's one of the game's instruments, so it's called at the start of each frame, after each tick, and once each frame is
+# on screen
+
+MOVE_KEYS = {pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d}
+FIRE_KEYS = {pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT}
+KINDS = ['move', 'fire']
+
+
+class InputLatencyTracker(Instrument):
+
+    def __init__(self, timeout=0.5):
+        # Presses that nothing has happened for after `timeout` seconds (e.g. moving against a key already held down
+        # that takes precedence) are given up on
+
+        self.timeout = timeout
+        self.pending = []       # [kind, time pressed, whether its effect has been seen], oldest first
+        self.latencies = {kind: [] for kind in KINDS}
+        self.expired = 0
+
+        # What the player was like before the frame's update, to see what changed
+        self.level = None
+        self.direction = None
+        self.bullets_created = 0
+
+    def frame_started(self, game):
+        # Called at the start of each frame, before the game handles its events
+
+        key_presses = pygame.event.get(pygame.KEYDOWN)
+        now = time.perf_counter()
+        for event in key_presses:
+            if event.key in MOVE_KEYS:
+                self.pending.append(['move', now, False])
+            elif event.key in FIRE_KEYS:
+                self.pending.append(['fire', now, False])
+            pygame.event.post(event)
+
+        # What the player's like before the frame's update (handling the events doesn't change it)
+        level = self.level = game.playing_level()
+        if level is not None:
+            self.direction = tuple(level.players[0].direction)
+            self.bullets_created = level.player_bullets_created
+
+    def tick_ended(self, game, level):
+        # `level` is None when not in a level
+
+        # Nothing to compare with if the level changed in the update
+        if level is None or level is not self.level:
+            return
+
+        moved = tuple(level.players[0].direction) != self.direction
+        fired = level.player_bullets_created != self.bullets_created
+        for press in self.pending:
+            if (press[0] == 'move' and moved) or (press[0] == 'fire' and fired):
+                press[2] = True
+
+    def frame_shown(self, game):
+        # Called once the frame's on screen
+
+        now = time.perf_counter()
+        still_pending = []
+        for kind, press_time, seen in self.pending:
+            if seen:
+                self.latencies[kind].append(now - press_time)
+            elif now - press_time > self.timeout:
+                self.expired += 1
+            else:
+                still_pending.append([kind, press_time, seen])
+        self.pending = still_pending
+
+    def report(self, file=sys.stdout):
+
+        print('Input to display latency:', file=file)
+        for kind in KINDS:
+            latencies = sorted(self.latencies[kind])
+            if not latencies:
+                print('  %s: no presses measured' % kind, file=file)
+                continue
+            print('  %s (%d presses): p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, max %.1f ms' % (
+                kind, len(latencies), percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000, latencies[-1] * 1000
+            ), file=file)
+        print('  %d presses had no effect within %.0f ms' % (self.expired, self.timeout * 1000), file=file)
+
+
+def percentile(sorted_values, percent):
+    # Nearest rank percentile
+
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
@@ -1,36 +1,115 @@
+import sys
+from profiling import StartupProfiler, LevelProfiler, SamplingProfiler
+
+# Created before any other game imports, so that the start up report includes their import times
+startup_profiler = StartupProfiler(enabled='--profile-startup' in sys.argv)
+
 import time
 import pygame
+import argparse
 from settings import *
+from tracing import Tracer, span
+from capture import FrameCapture
+from telemetry import TelemetrySink
+from frametimes import FrameTimeReport
+from gcstats import GCMonitor, GCPolicy
 from intro_screen import IntroScreen
-from game_data import GameData, LEVEL_DATA
-from util import import_folder, import_folder_dict, import_image
+from ui import DebugHUD
+from controls import KeyboardInput
+from game_data import GameData, LEVEL_DATA, level_class
+from replay import Recording, InputRecorder, ReplayInput
+from util import import_folder, import_folder_dict, import_image, GameClock, RandomStreams
 from enemies import Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
 
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, startup_profiler=None, seed=None, record_path=None, replay=None, autopilot=None, instruments=()):
+        # `seed` fixes the seed of every session's random streams, rather than picking a new one each time
+        # `record_path` is where to save a recording of each session, so it can be replayed later
+        # `replay` is a recording to play back (instead of taking input from the keyboard), starting straight away
+        # `autopilot` is an Autopilot to play instead of the keyboard, starting a new game straight away whenever one ends
+        # `instruments` are the Instruments (see instruments.py) watching the game: profilers, telemetry, spectators,
+        # the debug HUD, ... Each is called at the same fixed points in every frame, tick, level & session
+
+        # Start up timings are only reported if the profiler passed in is enabled
+        self.startup_profiler = startup_profiler if startup_profiler is not None else StartupProfiler()
+        self.instruments = list(instruments)
+
+        # Recording & replaying
+        # Both need the game to step with a fixed time step, as otherwise the run depends on the frame rate
+        self.seed = replay.seed if replay is not None else seed
+        self.record_path = record_path
+        self.recording = None
+        self.replay_input = ReplayInput(replay) if replay is not None else None
+        self.fixed_dt = 1 / TICKS_PER_SECOND if record_path is not None or replay is not None else None
+        self.autopilot = autopilot
+        self.frame = 0
+
+        # Where the player's inputs come from, and the game time everything in the game runs on
+        self.input_provider = self.replay_input if self.replay_input is not None else self.live_input()
+        self.game_clock = GameClock()
+        self.game_clock.activate()
 
         # General Setup
-        pygame.init()
-        self.display_surface = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption('Journey of the Prairie King')
+        with self.startup_profiler.phase('pygame.init'):
+            pygame.init()
+        with self.startup_profiler.phase('display'):
+            self.display_surface = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption('Journey of the Prairie King')
         self.clock = pygame.time.Clock()
 
-        self.font = pygame.font.Font('font/Stardew_Valley.ttf', int(10 * ZOOM_FACTOR))
-        self.game_data = GameData()
+        with self.startup_profiler.phase('font'):
+            self.font = pygame.font.Font('font/Stardew_Valley.ttf', int(10 * ZOOM_FACTOR))
+        self.game_data = GameData(old_easy_mode=replay.easy_mode if replay is not None else None)
 
-        self.import_audio()   # Create dict of self.audio
-        self.import_assets()  # Create dict of self.assets
+        with self.startup_profiler.phase('audio'):
+            self.import_audio()   # Create dict of self.audio
+        with self.startup_profiler.phase('assets'):
+            self.import_assets()  # Create dict of self.assets
 
         # Create the intro screen
-        self.level = IntroScreen(self.game_data, self.assets, self.transition_to_next_level, self.update_volume)
+        with self.startup_profiler.phase('intro screen'):
+            self.level = IntroScreen(self.game_data, self.assets, self.start_session, self.update_volume, self.display_surface)
 
         # Transition object to switch between levels
-        self.transition = Transition(func=self.switch_to_next_level)
+        self.transition = Transition(func=self.switch_to_next_level, display_surface=self.display_surface)
 
         # Transition object to restart the game
-        self.game_over_transition = Transition(func=self.restart_game_over)
+        self.game_over_transition = Transition(func=self.restart_game_over, display_surface=self.display_surface)
+
+        # A replay skips the intro screen
+        if self.replay_input is not None:
+            self.start_session()
+
+    def live_input(self):
+        # Where the inputs come from when not replaying
+
+        return self.autopilot if self.autopilot is not None else KeyboardInput()
+
+    def playing_level(self):
+        # The level being played, or None when on the intro screen
+
+        level = self.level
+        return None if isinstance(level, IntroScreen) else level
+
+    def profile_context(self):
+        # What the game is doing, to tag the sampling profiler's samples with: the level (by its index in LEVEL_DATA)
+        # and the phase of the game. Called from the profiler's thread, so only reads what's there
+
+        level = self.playing_level()
+        if level is None:
+            return 'intro', 'transition' if self.transition.active else 'menu'
+
+        if self.transition.active or self.game_over_transition.active:
+            phase = 'transition'
+        elif level.game_over:
+            phase = 'game over'
+        elif level.level_completed:
+            phase = 'completed'
+        else:
+            phase = 'playing'
+        return 'level_%02d' % self.game_data.current_level, phase
 
     def import_audio(self):
 
@@ -51,6 +130,31 @@ class Game:
         for audio in self.audio:
             self.audio[audio].set_volume(self.game_data.volume / 10)
 
+    def start_session(self):
+        # Called when the player starts a new game from the intro screen
+        # The game time & random streams start again for every session, so that a session can be reproduced from just
+        # its seed and inputs (which is all a recording stores)
+
+        self.game_clock = GameClock()
+        self.game_clock.activate()
+        self.game_data.random_streams = RandomStreams(self.seed)
+
+        if self.record_path is not None:
+            self.recording = Recording(self.game_data.random_streams.seed, self.game_data.easy_mode)
+            self.input_provider = InputRecorder(self.live_input(), self.recording)
+
+        self.transition_to_next_level()
+
+    def end_session(self):
+        # Called when the game is over (or quit), to save the recording of the session if we were making one
+
+        for instrument in self.instruments:
+            instrument.session_ended(self)
+        if self.recording is not None:
+            self.recording.save(self.record_path)
+            self.recording = None
+            self.input_provider = self.live_input()
+
     def transition_to_next_level(self):
         # Called from within a level to start the transition
         # Once started, transition will animate and at some point call `switch_to_next_level`
@@ -64,20 +168,48 @@ class Game:
 
     def restart_game_over(self):
 
+        self.end_session()
         self.game_data = GameData(self.game_data.easy_mode, self.game_data.volume)
-        self.level = IntroScreen(self.game_data, self.assets, self.transition_to_next_level, self.update_volume)
+        self.level = IntroScreen(self.game_data, self.assets, self.start_session, self.update_volume, self.display_surface)
 
     def switch_to_next_level(self):
         # Called from transition object, when it's time to create the next level object
 
         self.game_data.current_level += 1
         if self.game_data.current_level in LEVEL_DATA:
-            level_class = LEVEL_DATA[self.game_data.current_level]['level_type']
-            self.level = level_class(LEVEL_DATA[self.game_data.current_level], self.game_data, self.audio, self.assets, self.font, self.transition_to_next_level, self.transition_to_restart)
+            for instrument in self.instruments:
+                instrument.level_started(self, self.game_data.current_level)
+            level_data = LEVEL_DATA[self.game_data.current_level]
+            self.level = level_class(level_data)(level_data, self.game_data, self.audio, self.assets, self.font, self.transition_to_next_level, self.transition_to_restart, self.input_provider, self.display_surface, self.game_clock)
+            if self.autopilot is not None:
+                self.autopilot.attach(self.level)
+            for instrument in self.instruments:
+                instrument.level_loaded(self, self.level)
         else:
             # Finished the last level, restart game
             self.restart_game_over()
 
+    def snapshot(self):
+        # The state of the session, so it can be restored into another game (e.g. in another process) playing the
+        # same session. Only possible while in a level, not on the intro screen
+
+        if self.playing_level() is None:
+            raise ValueError('can only snapshot the game while in a level')
+
+        return self.game_data.current_level, self.level.snapshot(), self.transition.get_state(), self.game_over_transition.get_state()
+
+    def restore(self, snapshot):
+
+        current_level, level_snapshot, transition, game_over_transition = snapshot
+
+        # Build the level, then put it (and the game data & clock) into the snapshot's state
+        self.game_data.current_level = current_level - 1
+        self.switch_to_next_level()
+        self.level.restore(level_snapshot)
+
+        self.transition.set_state(transition)
+        self.game_over_transition.set_state(game_over_transition)
+
     def import_assets(self):
 
         self.assets = {
@@ -153,26 +285,84 @@ class Game:
             }
         }
 
-    def run(self):
+    def step(self, dt):
+        # Move the game forward by one tick of `dt` seconds, without drawing anything
 
-        last_time = time.time()
-        while True:
+        # The autopilot skips the intro screen, starting a new game as soon as it's shown (e.g. after a game over)
+        if self.autopilot is not None and isinstance(self.level, IntroScreen) and \
+                not self.transition.active and not self.game_over_transition.active:
+            self.start_session()
+
+        self.input_provider.poll()
+        self.game_clock.advance(dt)
+
+        self.level.update(dt)
+        self.transition.update(dt)
+        self.game_over_transition.update(dt)
 
-            # Delta Time
-            dt = time.time() - last_time
-            last_time = time.time()
+        level = self.playing_level()
+        for instrument in self.instruments:
+            instrument.tick_ended(self, level)
 
-            # Clear Display Surface
-            self.display_surface.fill('black')
+    def draw(self):
 
-            # Updates & Drawing
-            self.level.run(dt)
-            self.transition.run(dt)
-            self.game_over_transition.run(dt)
+        # Clear Display Surface
+        self.display_surface.fill('black')
+
+        self.level.draw()
+        self.transition.draw()
+        self.game_over_transition.draw()
+
+        for instrument in self.instruments:
+            instrument.frame_drawn(self)
+
+        # Hand the finished frame to anything capturing it
+        if FrameCapture.active is not None:
+            FrameCapture.active.capture('display', self.display_surface)
+
+    def run(self):
+        # Runs until the window is closed, or the end of the recording if we're replaying one
 
-            # Update display surface & limit max frame rate
-            pygame.display.update()
-            self.clock.tick(60)
+        for instrument in self.instruments:
+            instrument.run_started(self)
+        last_time = time.time()
+        try:
+            while self.replay_input is None or not self.replay_input.finished:
+
+                # Delta Time
+                frame_time = dt = time.time() - last_time
+                last_time = time.time()
+                if self.fixed_dt is not None:
+                    dt = self.fixed_dt
+
+                # Events, Updates & Drawing
+                work_start_time = time.perf_counter()
+                with span('events'):
+                    for instrument in self.instruments:
+                        instrument.frame_started(self)
+                    self.level.handle_events()
+                with span('update'):
+                    self.step(dt)
+                with span('draw'):
+                    self.draw()
+
+                # Update display surface & limit max frame rate
+                with span('display flip'):
+                    pygame.display.update()
+                for instrument in self.instruments:
+                    instrument.frame_shown(self)
+                work_time = time.perf_counter() - work_start_time
+                with span('frame limit'):
+                    self.clock.tick(60)
+
+                for instrument in self.instruments:
+                    instrument.frame_ended(self, frame_time, dt, work_time)
+                self.frame += 1
+
+        finally:
+            self.end_session()
+            for instrument in self.instruments:
+                instrument.run_ended(self)
 
 
 class Transition:
@@ -181,9 +371,9 @@ class Transition:
     # Half-way through the animation, we call a function in Game to create the next level object
     # We then reverse the animation until we've finished and are no longer active
 
-    def __init__(self, func):
+    def __init__(self, func, display_surface=None):
 
-        self.display_surface = pygame.display.get_surface()
+        self.display_surface = display_surface if display_surface is not None else pygame.display.get_surface()
 
         # `func` is the function to call to initiate the next level object, called half way through animation
         self.func = func
@@ -197,23 +387,155 @@ class Transition:
         self.threshold = self.radius + (30 * ZOOM_FACTOR)
         self.speed = 300 * ZOOM_FACTOR
 
-    def run(self, dt):
+    def update(self, dt):
 
         if self.active:
 
             self.border_width += self.speed * dt * self.direction
             if self.border_width >= self.threshold:
                 self.direction = -1
-                self.func()
+                with span('level switch', 'load'):
+                    self.func()
             elif self.border_width < 0:
                 self.active = False
                 self.border_width = 0
                 self.direction = 1
 
+    def get_state(self):
+
+        return self.active, self.border_width, self.direction
+
+    def set_state(self, state):
+
+        self.active, self.border_width, self.direction = state
+
+    def draw(self):
+
+        if self.active:
             pygame.draw.circle(self.display_surface, 'black', self.center, self.radius, int(self.border_width))
 
+    def run(self, dt):
+
+        self.update(dt)
+        self.draw()
+
 
 if __name__ == '__main__':
 
-    game = Game()
-    game.run()
+    parser = argparse.ArgumentParser(description='Journey of the Prairie King')
+    parser.add_argument('--profile-startup', action='store_true', help='print a report of start up import & load times')
+    parser.add_argument('--seed', type=int, help='seed for the random streams, to play the same game again')
+    parser.add_argument('--record', metavar='FILE', help='record each game played to FILE')
+    parser.add_argument('--replay', metavar='FILE', help='play back a recorded game from FILE')
+    parser.add_argument('--spectate', type=int, metavar='PORT', help='stream the game to spectators on localhost PORT')
+    parser.add_argument('--hash-log', metavar='FILE', help='log the hash of every tick\'s state to FILE (see statehash.py)')
+    parser.add_argument('--hash-sections', action='store_true', help='log the hash of each entity\'s state too')
+    parser.add_argument('--autopilot', action='store_true', help='let a bot play, one game after another')
+    parser.add_argument('--profile-levels', metavar='DIR', help='profile each level played, writing a .prof & collapsed stack .folded file per level to DIR')
+    parser.add_argument('--sample-profile', metavar='FILE', help='sample the game\'s stack while it runs, writing collapsed stacks to FILE on exit (or F9)')
+    parser.add_argument('--sample-rate', type=int, default=100, metavar='HZ', help='samples per second for --sample-profile')
+    parser.add_argument('--telemetry', metavar='FILE', help='record telemetry for every frame to FILE')
+    parser.add_argument('--telemetry-format', choices=['jsonl', 'columnar'], default='jsonl', help='format of the --telemetry file')
+    parser.add_argument('--frame-report', action='store_true', help='report frame time percentiles & the worst hitches whenever a level is completed or the player dies')
+    parser.add_argument('--debug-hud', action='store_true', help='show the frame rate & garbage collection timings over the game')
+    parser.add_argument('--gc-policy', action='store_true', help='collect garbage between levels, rather than in the middle of play')
+    parser.add_argument('--event-log', metavar='FILE', help='log spawns, kills, drops, powerups, purchases & deaths to FILE (see gameplay_events.py)')
+    parser.add_argument('--heatmaps', metavar='DIR', help='save heatmaps of where players go, die, kill & pick up drops in each level to DIR')
+    parser.add_argument('--input-latency', action='store_true', help='report how long key presses take to show on screen, on exit')
+    parser.add_argument('--trace', metavar='FILE', help='write a timeline of each frame\'s phases (and level builds etc.) to FILE, as Chrome trace-event JSON')
+    args = parser.parse_args()
+
+    instruments = []
+
+    spectators = None
+    if args.spectate is not None:
+        from spectator import SpectatorBroadcaster
+        spectators = SpectatorBroadcaster(args.spectate)
+        instruments.append(spectators)
+
+    autopilot = None
+    if args.autopilot:
+        from autopilot import Autopilot
+        autopilot = Autopilot(args.seed)
+
+    state_hash_log = None
+    if args.hash_log is not None:
+        from statehash import StateHashLog
+        state_hash_log = StateHashLog(args.hash_log, args.hash_sections)
+        instruments.append(state_hash_log)
+
+    if args.profile_levels is not None:
+        instruments.append(LevelProfiler(args.profile_levels))
+
+    if args.sample_profile is not None:
+        instruments.append(SamplingProfiler(args.sample_profile, args.sample_rate))
+
+    # Garbage collections are timed for the debug HUD & telemetry
+    gc_monitor = None
+    if args.debug_hud or args.telemetry is not None:
+        gc_monitor = GCMonitor()
+        gc_monitor.install()
+
+    telemetry = None
+    if args.telemetry is not None:
+        telemetry = TelemetrySink(args.telemetry, args.telemetry_format, gc_monitor=gc_monitor)
+        instruments.append(telemetry)
+
+    if args.frame_report:
+        frame_report = FrameTimeReport(file=sys.stderr)
+        frame_report.activate()
+        instruments.append(frame_report)
+
+    if args.debug_hud:
+        instruments.append(DebugHUD(gc_monitor))
+
+    if args.gc_policy:
+        instruments.append(GCPolicy())
+
+    event_log = None
+    if args.event_log is not None:
+        from gameplay_events import EventLog
+        event_log = EventLog(args.event_log)
+        event_log.activate()
+
+    heatmaps = None
+    if args.heatmaps is not None:
+        from heatmaps import HeatmapRecorder
+        heatmaps = HeatmapRecorder()
+        heatmaps.start()
+        instruments.append(heatmaps)
+
+    input_latency = None
+    if args.input_latency:
+        from latency import InputLatencyTracker
+        input_latency = InputLatencyTracker()
+        instruments.append(input_latency)
+
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer(args.trace)
+        tracer.activate()
+
+    game = Game(startup_profiler, seed=args.seed, record_path=args.record, replay=Recording.load(args.replay) if args.replay else None, autopilot=autopilot, instruments=instruments)
+    startup_profiler.report()
+    try:
+        game.run()
+    finally:
+        if spectators is not None:
+            print(spectators.stats(), file=sys.stderr)
+            spectators.close()
+        if state_hash_log is not None:
+            state_hash_log.close()
+        if tracer is not None:
+            tracer.save()
+        if input_latency is not None:
+            input_latency.report(sys.stderr)
+        if heatmaps is not None:
+            heatmaps.stop()
+            heatmaps.save(args.heatmaps)
+        if event_log is not None:
+            event_log.close()
+            print(event_log.stats(), file=sys.stderr)
+        if telemetry is not None:
+            telemetry.close()
+            print(telemetry.stats(), file=sys.stderr)
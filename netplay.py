@@ -0,0 +1,581 @@
+import sys
+import time
+import socket
+import random
+import struct
+import argparse
+import pygame
+from settings import *
+from util import GameClock, RandomStreams
+from game_data import GameData, LEVEL_DATA, level_class
+from controls import InputProvider, keys_to_mask
+from statehash import StateHasher, StateHashLog, combine_hashes
+
+
+# Two player co-op over UDP, kept in sync by rollback: both peers run the same levels on the same seed, and each tick
+# is stepped with both players' inputs. Our own inputs are known straight away (a couple of ticks early, as they're
+# delayed by `input_delay` ticks to give them time to arrive). The other player's are predicted to be the same as the
+# last ones received, and when theirs arrive and differ from what was predicted, we restore the level's state from
+# before that tick and step it again up to the present, with the right inputs
+#
+# So rolling back is cheap, each tick's state is kept with `BaseLevel.get_state` (plain values, no serializing), and
+# only for the ticks that could still be rolled back (those not yet confirmed by the other player's inputs)
+# If the other player falls more than `max_rollback` ticks behind, we wait for them rather than predicting further
+#
+# A level only ends (the next is built, or the game is over) once the tick it ended on has been confirmed, as
+# a rollback could change whether it ends. Neither peer steps past the end of a level until then
+#
+# Packets:
+#  - HELLO (guest -> host) until a START comes back with the seed, easy mode & first level
+#  - INPUT: the first tick of ours the sender doesn't have yet (an ack), the hash of the state before the last tick
+#    confirmed (see statehash.py), then our inputs from the first tick they haven't acked on (so lost packets are made up
+#    for by the next)
+#
+# Both peers hash the state before every tick once it's confirmed, and compare their hashes with the other's: any
+# difference is a desync (the simulation isn't deterministic), which is reported with the first tick it happened on
+
+HELLO, START, INPUT = b'H', b'S', b'I'
+START_MESSAGE = struct.Struct('<Q?b')    # seed, easy mode, first level
+INPUT_HEADER = struct.Struct('<IIB')     # ack, first tick, number of inputs
+INPUT_HASH = struct.Struct('<iI')       # tick (or -1 for none yet), hash of the state before it
+INPUT_MASK = struct.Struct('<H')
+MAX_INPUTS_PER_PACKET = 64
+HASH_HISTORY = 10 * TICKS_PER_SECOND  # How long to keep our hashes for, for the other player's to be compared with
+
+HOST, GUEST = 0, 1
+
+
+class LockstepInput(InputProvider):
+    # A player's input for the tick being stepped, set by the session before each tick
+
+    def set_mask(self, mask):
+
+        self.keys.mask = mask
+
+
+class UdpTransport:
+
+    def __init__(self, connection, peer_address, start_packet=None):
+        # The host's `start_packet` is sent again with every packet until the guest's inputs arrive, in case it was lost
+
+        self.connection = connection
+        self.peer_address = peer_address
+        self.start_packet = start_packet
+
+    def send(self, packet):
+
+        try:
+            if self.start_packet is not None:
+                self.connection.sendto(self.start_packet, self.peer_address)
+            self.connection.sendto(packet, self.peer_address)
+        except OSError:
+            # E.g. the other player has gone, which we find out from not hearing from them
+            pass
+
+    def receive(self):
+        # Returns the packets waiting, without blocking
+
+        packets = []
+        while True:
+            try:
+                packet, address = self.connection.recvfrom(2048)
+            except (BlockingIOError, ConnectionRefusedError):
+                return packets
+            if address == self.peer_address:
+                packets.append(packet)
+                if packet[:1] == INPUT:
+                    self.start_packet = None
+
+
+def host_handshake(port, seed, easy_mode, level_index, timeout=60):
+    # Wait for a guest to say hello, and returns (transport, seed, easy mode, first level)
+
+    connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    connection.bind(('0.0.0.0', port))
+    connection.settimeout(timeout)
+
+    while True:
+        packet, address = connection.recvfrom(2048)
+        if packet[:1] == HELLO:
+            break
+
+    connection.setblocking(False)
+    return UdpTransport(connection, address, START + START_MESSAGE.pack(seed, easy_mode, level_index)), seed, easy_mode, level_index
+
+
+def join_handshake(host, port, timeout=60):
+    # Say hello to the host until it replies, and returns (transport, seed, easy mode, first level)
+
+    connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    connection.settimeout(0.25)
+    address = (socket.gethostbyname(host), port)
+
+    give_up_time = time.time() + timeout
+    while time.time() < give_up_time:
+        connection.sendto(HELLO, address)
+        try:
+            packet, _ = connection.recvfrom(2048)
+        except socket.timeout:
+            continue
+        if packet[:1] == START:
+            connection.setblocking(False)
+            return (UdpTransport(connection, address),) + START_MESSAGE.unpack(packet[1:])
+
+    raise TimeoutError('no reply from %s:%d' % address)
+
+
+class RollbackSession:
+    # One peer's copy of the game. `advance` is called once a frame with our input, and steps the game a tick
+    # (after any rollback), unless it has to wait for the other player
+
+    def __init__(self, game, transport, player_index, seed, easy_mode=True, level_index=0, input_delay=2, max_rollback=8, display_surface=None, state_hash_log=None):
+        # `game` provides the audio, assets & font the levels are built with (a Game, or a headless one)
+        # `state_hash_log` is a StateHashLog to log the hash of every confirmed tick to
+
+        self.game = game
+        self.transport = transport
+        self.player_index = player_index
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        self.display_surface = display_surface if display_surface is not None else game.display_surface
+        self.dt = 1 / TICKS_PER_SECOND
+
+        # Player 0 is the host's, player 1 the guest's
+        self.inputs = [LockstepInput(), LockstepInput()]
+        self.local_input = self.inputs[player_index]
+        self.remote_input = self.inputs[1 - player_index]
+
+        self.clock = GameClock()
+        self.game_data = GameData(old_easy_mode=easy_mode, old_volume=0, random_streams=RandomStreams(seed))
+        self.game_data.current_level = level_index - 1
+        self.level = None
+        self.finished = False
+        self.final_tick = None  # The tick the game was over or the last level left on
+
+        # Ticks are counted from the start of the session, across levels
+        self.tick = 0                 # The next tick to step
+        self.level_end_tick = None    # The tick the level ended on, if it has (and it might still be rolled back)
+        self.tick_stepping = 0        # The tick being stepped (or re-stepped)
+        self.local_masks = {}         # tick -> our input
+        self.oldest_local_tick = 0
+        self.remote_masks = {}        # tick -> their input, for ticks received but not yet confirmed in order
+        self.remote_confirmed = -1    # We have their inputs for every tick up to this one
+        self.confirmed_masks = {}     # tick -> their input, for ticks confirmed before they've been stepped
+        self.last_remote_mask = 0     # Their input on `remote_confirmed`, which is what we predict they do next
+        self.predicted_masks = {}     # tick -> their input we stepped it with, for ticks not yet confirmed
+        self.states = {}              # tick -> the level's state before it was stepped, for ticks stepped unconfirmed
+        self.peer_ack = 0             # They have our inputs for every tick before this one
+        self.last_heard = time.time()
+
+        # Desync detection
+        self.hasher = StateHasher()
+        self.state_hash_log = state_hash_log
+        self.confirmed_hashes = {}    # tick -> hash of the state before it, for the last HASH_HISTORY confirmed ticks
+        self.last_confirmed_hash = (-1, 0)
+        self.peer_hashes = {}         # tick -> their hash, for ticks we haven't confirmed yet
+        self.desync_tick = None       # The first tick the states differed on, if they have
+
+        # Accounting
+        self.rollbacks = 0
+        self.resimulated_ticks = 0
+        self.max_rollback_ticks = 0
+        self.stalls = 0
+        self.rollback_time = 0.0
+        self.max_rollback_time = 0.0
+
+        self.next_level()
+
+    def end_level(self):
+        # Called by the level when the player leaves it, or the game is over
+
+        if self.level_end_tick is None:
+            self.level_end_tick = self.tick_stepping
+
+    def next_level(self):
+
+        self.game_data.current_level += 1
+        self.level_end_tick = None
+        self.states = {}
+
+        if self.game_data.current_level not in LEVEL_DATA:
+            self.finished = True
+            return
+
+        level_data = LEVEL_DATA[self.game_data.current_level]
+        self.level = level_class(level_data)(
+            level_data, self.game_data, self.game.audio, self.game.assets, self.game.font, self.end_level, self.end_level,
+            self.inputs[HOST], self.display_surface, self.clock, self.inputs[GUEST]
+        )
+
+    def predicted_remote_mask(self, tick):
+
+        return self.remote_masks.get(tick, self.last_remote_mask)
+
+    def step_tick(self, tick):
+
+        state = self.level.get_state()
+        if tick <= self.remote_confirmed:
+            # Their input's already confirmed, so this tick can't be rolled back, and the state before it is final
+            remote_mask = self.confirmed_masks.pop(tick)
+            self.confirm_state(tick, state)
+        else:
+            remote_mask = self.predicted_remote_mask(tick)
+            self.predicted_masks[tick] = remote_mask
+            self.states[tick] = state
+
+        self.local_input.set_mask(self.local_masks.get(tick, 0))
+        self.remote_input.set_mask(remote_mask)
+
+        self.tick_stepping = tick
+        self.level.step(self.dt)
+
+    def roll_back(self, tick):
+        # Put the level back to before `tick`, and step it again up to the present
+
+        start_time = time.perf_counter()
+
+        self.level.set_state(self.states[tick])
+        self.level_end_tick = None
+        for resimulated_tick in range(tick, self.tick):
+            self.step_tick(resimulated_tick)
+            if self.level_end_tick is not None:
+                # The level now ends earlier than it did, so the ticks after never happen
+                for unstepped_tick in range(resimulated_tick + 1, self.tick):
+                    self.predicted_masks.pop(unstepped_tick, None)
+                    self.states.pop(unstepped_tick, None)
+                self.tick = resimulated_tick + 1
+                break
+
+        elapsed = time.perf_counter() - start_time
+        self.rollbacks += 1
+        self.resimulated_ticks += self.tick - tick
+        self.max_rollback_ticks = max(self.max_rollback_ticks, self.tick - tick)
+        self.rollback_time += elapsed
+        self.max_rollback_time = max(self.max_rollback_time, elapsed)
+
+    def send_inputs(self):
+
+        last_tick = self.tick + self.input_delay
+        first_tick = max(self.peer_ack, last_tick - MAX_INPUTS_PER_PACKET + 1)
+        masks = [INPUT_MASK.pack(self.local_masks.get(tick, 0)) for tick in range(first_tick, last_tick + 1)]
+
+        self.transport.send(
+            INPUT + INPUT_HEADER.pack(self.remote_confirmed + 1, first_tick, len(masks)) +
+            INPUT_HASH.pack(*self.last_confirmed_hash) + b''.join(masks)
+        )
+
+    def receive_inputs(self):
+        # Returns the earliest tick already stepped with a wrong prediction of their input, if any
+
+        mispredicted_tick = None
+
+        for packet in self.transport.receive():
+            if packet[:1] != INPUT:
+                continue
+            self.last_heard = time.time()
+
+            ack, first_tick, count = INPUT_HEADER.unpack_from(packet, 1)
+            self.peer_ack = max(self.peer_ack, ack)
+            self.check_hash(*INPUT_HASH.unpack_from(packet, 1 + INPUT_HEADER.size))
+
+            for index in range(count):
+                tick = first_tick + index
+                if tick <= self.remote_confirmed or tick in self.remote_masks:
+                    continue
+                mask, = INPUT_MASK.unpack_from(packet, 1 + INPUT_HEADER.size + INPUT_HASH.size + index * INPUT_MASK.size)
+                self.remote_masks[tick] = mask
+
+                if tick in self.predicted_masks and self.predicted_masks[tick] != mask:
+                    if mispredicted_tick is None or tick < mispredicted_tick:
+                        mispredicted_tick = tick
+
+        return mispredicted_tick
+
+    def confirm_remote_inputs(self):
+        # Move on past the ticks we now have their inputs for, which can't be rolled back any more
+
+        while self.remote_confirmed + 1 in self.remote_masks:
+            self.remote_confirmed += 1
+            self.last_remote_mask = self.remote_masks.pop(self.remote_confirmed)
+
+            if self.remote_confirmed < self.tick:
+                # Already stepped. The state before a tick only depends on the inputs before it, so is final now too
+                self.predicted_masks.pop(self.remote_confirmed)
+                self.confirm_state(self.remote_confirmed, self.states.pop(self.remote_confirmed))
+            else:
+                # Kept for when it's stepped (their inputs usually arrive a couple of ticks early)
+                self.confirmed_masks[self.remote_confirmed] = self.last_remote_mask
+
+        # Our inputs they have, for ticks we've stepped that can't be rolled back, aren't needed any more
+        while self.oldest_local_tick < min(self.peer_ack, self.remote_confirmed + 1, self.tick):
+            self.local_masks.pop(self.oldest_local_tick, None)
+            self.oldest_local_tick += 1
+
+    def confirm_state(self, tick, state):
+
+        sections = self.hasher.sections(state)
+        state_hash = combine_hashes(section_hash for _, section_hash in sections)
+        if self.state_hash_log is not None:
+            self.state_hash_log.log_sections(tick, sections)
+
+        self.confirmed_hashes[tick] = state_hash
+        self.confirmed_hashes.pop(tick - HASH_HISTORY, None)
+        self.last_confirmed_hash = (tick, state_hash)
+        if tick in self.peer_hashes:
+            self.check_hash(tick, self.peer_hashes.pop(tick))
+
+    def check_hash(self, tick, peer_hash):
+        # Compare their hash of the state before `tick` with ours, or keep it until we've confirmed that tick too
+
+        if tick < 0 or self.desync_tick is not None:
+            return
+        if tick in self.confirmed_hashes:
+            if self.confirmed_hashes[tick] != peer_hash:
+                self.desync_tick = tick
+        elif tick > self.last_confirmed_hash[0]:
+            self.peer_hashes[tick] = peer_hash
+
+    def advance(self, local_mask):
+        # Returns True if a tick was stepped, or False if waiting for the other player
+
+        # Our input is for a few ticks from now (only once per tick, as we don't move on while waiting)
+        self.local_masks.setdefault(self.tick + self.input_delay, local_mask)
+        self.send_inputs()
+
+        mispredicted_tick = self.receive_inputs()
+        if mispredicted_tick is not None and mispredicted_tick < self.tick:
+            self.roll_back(mispredicted_tick)
+        self.confirm_remote_inputs()
+
+        # The level has ended, and now no rollback can change that
+        if not self.finished and self.level_end_tick is not None and self.level_end_tick <= self.remote_confirmed:
+            self.final_tick = self.level_end_tick
+            if self.level.game_over:
+                self.finished = True
+            else:
+                self.next_level()
+
+        if self.finished or self.level_end_tick is not None or self.tick - self.remote_confirmed > self.max_rollback:
+            self.stalls += 1
+            return False
+
+        self.step_tick(self.tick)
+        self.tick += 1
+        return True
+
+    def done(self):
+        # Finished, and the other player has all the inputs they need to finish too
+
+        return self.finished and self.peer_ack > self.final_tick
+
+    def stats(self):
+
+        return '%d ticks, %d rollbacks (%d ticks re-stepped, at most %d at once, %.2f ms on average, %.2f ms at most), %d stalls, %s' % (
+            self.tick, self.rollbacks, self.resimulated_ticks, self.max_rollback_ticks,
+            1000 * self.rollback_time / max(1, self.rollbacks), 1000 * self.max_rollback_time, self.stalls,
+            'no desync' if self.desync_tick is None else 'DESYNC from tick %d' % self.desync_tick
+        )
+
+
+def run(session, timeout=10):
+    # Play in a window until the game is over, the window is closed, or we stop hearing from the other player
+
+    game = session.game
+    reported_desync = False
+    while not session.done():
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+
+        if time.time() - session.last_heard > timeout:
+            print('Lost the other player', file=sys.stderr)
+            return
+
+        session.advance(keys_to_mask(pygame.key.get_pressed()))
+        if session.desync_tick is not None and not reported_desync:
+            print('Desynced from the other player on tick %d' % session.desync_tick, file=sys.stderr)
+            reported_desync = True
+
+        if not session.finished:
+            game.display_surface.fill('black')
+            session.level.draw()
+            pygame.display.update()
+        game.clock.tick(TICKS_PER_SECOND)
+
+
+class FlakyTransport(UdpTransport):
+    # Drops a fraction of the packets sent, and holds the rest back for up to `max_delay` more sends (so they can
+    # arrive out of order), to check the sessions cope
+
+    def __init__(self, connection, peer_address, loss=0, max_delay=0, seed=0):
+
+        super().__init__(connection, peer_address)
+        self.loss = loss
+        self.max_delay = max_delay
+        self.random = random.Random(seed)
+        self.sends = 0
+        self.delayed = []  # (send it's due on, packet)
+
+    def send(self, packet):
+
+        self.sends += 1
+        if self.random.random() >= self.loss:
+            self.delayed.append((self.sends + self.random.randint(0, self.max_delay), packet))
+
+        due = [packet for due_send, packet in self.delayed if due_send <= self.sends]
+        self.delayed = [(due_send, packet) for due_send, packet in self.delayed if due_send > self.sends]
+        for packet in due:
+            super().send(packet)
+
+
+def check_loopback(game, seed=0, ticks=10 * TICKS_PER_SECOND, loss=0, max_delay=0, desync_tick=None, file=sys.stdout):
+    # Plays a host & a guest session against each other in this process, over UDP on localhost (through FlakyTransports),
+    # the host with the autopilot's inputs (so levels are left) and the guest with a RandomAgent's, both with lives to
+    # spare, and compares the hashes of every tick both have confirmed
+    # With `desync_tick`, the guest is given a coin on the first tick from then on with nothing left to roll back,
+    # which both sessions should report as a desync. Returns a list of what went wrong
+
+    import os
+    import tempfile
+    from simulate import RandomAgent
+    from autopilot import Autopilot
+    from statehash import read_hash_log, first_divergence
+
+    connections = []
+    for _ in range(2):
+        connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        connection.bind(('127.0.0.1', 0))
+        connection.setblocking(False)
+        connections.append(connection)
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_paths = [os.path.join(directory, 'host.log'), os.path.join(directory, 'guest.log')]
+        sessions, agents = [], []
+        for player_index in [HOST, GUEST]:
+            transport = FlakyTransport(connections[player_index], connections[1 - player_index].getsockname(), loss, max_delay, seed + player_index)
+            hash_log = StateHashLog(log_paths[player_index], sections=True)
+            session = RollbackSession(game, transport, player_index, seed, state_hash_log=hash_log)
+            session.game_data.lives = 99
+            sessions.append(session)
+            agents.append(Autopilot(seed) if player_index == HOST else RandomAgent(seed))
+        host, guest = sessions
+
+        nudged_tick = None
+        try:
+            # Strictly alternating, with a limit in case they stall on each other
+            for _ in range(ticks * 10):
+                if all(session.done() or session.tick >= ticks for session in sessions):
+                    break
+
+                if desync_tick is not None and nudged_tick is None and guest.tick >= desync_tick and guest.remote_confirmed == guest.tick - 1:
+                    guest.game_data.coins += 1
+                    nudged_tick = guest.tick
+
+                for session, agent in zip(sessions, agents):
+                    if not session.done():
+                        if agent.level is not session.level:
+                            agent.attach(session.level)
+                        agent.poll()
+                        session.advance(agent.keys.mask)
+        finally:
+            for session in sessions:
+                session.state_hash_log.close()
+            for connection in connections:
+                connection.close()
+
+        logs = [read_hash_log(path) for path in log_paths]
+
+    for name, session, log in zip(['host', 'guest'], sessions, logs):
+        print('%s: %d ticks hashed, %s' % (name, len(log), session.stats()), file=file)
+
+    problems = []
+    for name, session, log in zip(['host', 'guest'], sessions, logs):
+        if sorted(log) != list(range(len(log))):
+            problems.append('the %s didn\'t hash every tick it confirmed' % name)
+    if min(len(log) for log in logs) < min(ticks, min(session.tick for session in sessions)) - host.max_rollback - host.input_delay:
+        problems.append('only %d ticks were confirmed by both' % min(len(log) for log in logs))
+
+    divergence = first_divergence(*logs)
+    if desync_tick is None:
+        if divergence is not None:
+            problems.append('the states differ from tick %d (%s)' % (divergence[0], ', '.join(divergence[1])))
+        for name, session in zip(['host', 'guest'], sessions):
+            if session.desync_tick is not None:
+                problems.append('the %s reported a desync on tick %d' % (name, session.desync_tick))
+    else:
+        if nudged_tick is None:
+            problems.append('the guest never got to tick %d with nothing to roll back' % desync_tick)
+        elif divergence is None or divergence[0] != nudged_tick:
+            problems.append('the states should first differ on tick %d, not %s' % (nudged_tick, divergence and divergence[0]))
+        for name, session in zip(['host', 'guest'], sessions):
+            if session.desync_tick is None:
+                problems.append('the %s didn\'t report the desync' % name)
+            elif nudged_tick is not None and session.desync_tick < nudged_tick:
+                problems.append('the %s reported a desync on tick %d, before it happened' % (name, session.desync_tick))
+
+    return problems
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Play two player co-op over the network')
+    parser.add_argument('--join', metavar='HOST', help='join a game hosted on HOST (otherwise host one)')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--seed', type=int, help='seed for the random streams (when hosting)')
+    parser.add_argument('--hard', action='store_true', help='play on hard mode (when hosting)')
+    parser.add_argument('--level', type=int, default=0, help='level to start on (when hosting)')
+    parser.add_argument('--input-delay', type=int, default=2, help='ticks our inputs are delayed by')
+    parser.add_argument('--max-rollback', type=int, default=8, help='most ticks to predict the other player\'s inputs for')
+    parser.add_argument('--hash-log', metavar='FILE', help='log the hash of every confirmed tick\'s state to FILE (see statehash.py)')
+    parser.add_argument('--hash-sections', action='store_true', help='log the hash of each entity\'s state too')
+    parser.add_argument('--check', action='store_true', help='play a host & guest against each other headless, and check they stay in sync and report a desync')
+    parser.add_argument('--check-seconds', type=float, default=120, help='game seconds to play each --check for')
+    args = parser.parse_args()
+
+    if args.check:
+        import os
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+    from main import Game
+
+    game = Game()
+
+    if args.check:
+        seed = args.seed if args.seed is not None else 0
+        ticks = int(args.check_seconds * TICKS_PER_SECOND)
+        failed = False
+        for name, loss, max_delay, desync_tick in [
+            ('no loss', 0, 0, None), ('20% loss, delayed up to 4 frames', 0.2, 4, None), ('forced desync', 0.2, 4, ticks // 2)
+        ]:
+            print('%s:' % name)
+            problems = check_loopback(game, seed, ticks, loss, max_delay, desync_tick)
+            for problem in problems:
+                print('FAIL: %s' % problem)
+            failed = failed or bool(problems)
+        if failed:
+            sys.exit(1)
+        print('OK: the sessions stayed in sync, and the forced desync was reported')
+        sys.exit()
+
+    if args.join is not None:
+        transport, seed, easy_mode, level_index = join_handshake(args.join, args.port)
+        player_index = GUEST
+    else:
+        print('Waiting for a player to join on port %d' % args.port, file=sys.stderr)
+        seed = args.seed if args.seed is not None else random.randrange(2 ** 63)
+        transport, seed, easy_mode, level_index = host_handshake(args.port, seed, not args.hard, args.level)
+        player_index = HOST
+
+    state_hash_log = StateHashLog(args.hash_log, args.hash_sections) if args.hash_log is not None else None
+    session = RollbackSession(
+        game, transport, player_index, seed, easy_mode, level_index, args.input_delay, args.max_rollback,
+        state_hash_log=state_hash_log
+    )
+    try:
+        run(session)
+    finally:
+        if state_hash_log is not None:
+            state_hash_log.close()
+    print(session.stats(), file=sys.stderr)
@@ -4,9 +4,9 @@ from base_level import BaseLevel
 
 class NormalLevel(BaseLevel):
 
-    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart):
+    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface=None, clock=None, partner_input_provider=None):
 
-        super().__init__(level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart)
+        super().__init__(level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface, clock, partner_input_provider)
 
         self.level_completed = False
         self.setup_level_timer(level_data)
@@ -23,6 +23,13 @@ class NormalLevel(BaseLevel):
         self.pause_able_timers.append(level_timer.level_timer)
         self.pause_able_timers.append(level_timer.delay_timer)
 
+    def reset(self):
+
+        super().reset()
+
+        self.level_completed = False
+        self.level_timer_group.sprite.reset()
+
     def check_level_completed(self):
         # You've completed the level if:
         # - Level timer is not active (reached the end)
@@ -0,0 +1,97 @@
+import numpy as np
+from boss import Cowboy
+from settings import *
+from enemies import Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
+
+
+# A compact encoding of a level's state, for agents to observe instead of the pixels
+# It's one flat float32 array: a stack of 16x16 grids, one value per tile, followed by a few single values (features)
+#  - Grids: whether each tile can be walked on, then how many of each enemy type, bullets & drops are on each tile
+#  - Features: the player's position & velocity, lives, stored powerup, how much of the level timer & each
+#    powerup/effect timer is left
+
+ENEMY_TYPES = [Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball, Cowboy]
+GRIDS = ['walkable'] + [enemy_type.__name__ for enemy_type in ENEMY_TYPES] + ['player_bullets', 'enemy_bullets', 'coins', 'powerups']
+
+PLAYER_TIMERS = ['coffee_timer', 'sheriff_timer', 'machine_gun_timer', 'shotgun_timer', 'wagon_wheel_timer']
+LEVEL_TIMERS = ['smoke_bomb_timer', 'tombstone_timer', 'lightening_timer']
+FEATURES = ['player_x', 'player_y', 'velocity_x', 'velocity_y', 'lives', 'stored_powerup', 'level_timer'] + PLAYER_TIMERS + LEVEL_TIMERS
+
+GRID_SIZE = len(GRIDS) * TILES_HIGH * TILES_WIDE
+OBSERVATION_SIZE = GRID_SIZE + len(FEATURES)
+
+TILE_PIXELS = TILE_SIZE * ZOOM_FACTOR
+
+
+class ObservationEncoder:
+    # Writes a level's state into a preallocated observation array each time `encode` is called
+    # The walkable grid never changes, so is written once when attached to a level
+    # Everything else is written in place each tick from the level's sprite groups, without allocating any arrays
+
+    def __init__(self, level, observation=None):
+        # `observation` is an array of OBSERVATION_SIZE to write into (e.g. a view of shared memory), instead of our own
+
+        self.observation = observation if observation is not None else np.zeros(OBSERVATION_SIZE, dtype=np.float32)
+
+        # Views into the observation
+        self.grids = self.observation[:GRID_SIZE].reshape(len(GRIDS), TILES_HIGH, TILES_WIDE)
+        self.dynamic_grids = self.grids[1:]
+        self.features = self.observation[GRID_SIZE:]
+
+        self.enemy_grids = {enemy_type: GRIDS.index(enemy_type.__name__) for enemy_type in ENEMY_TYPES}
+        self.player_bullet_grid = GRIDS.index('player_bullets')
+        self.enemy_bullet_grid = GRIDS.index('enemy_bullets')
+        self.coin_grid = GRIDS.index('coins')
+        self.powerup_grid = GRIDS.index('powerups')
+
+        self.level = None
+        self.timers = []
+        self.attach(level)
+
+    def attach(self, level):
+
+        self.level = level
+        self.grids[0] = level.matrix
+        self.timers = [getattr(level.player, name) for name in PLAYER_TIMERS] + [getattr(level, name) for name in LEVEL_TIMERS]
+
+    def add_to_grid(self, grid, pos):
+        # Count a sprite on the tile it's centred on (clamped to the map, as some sprites can be just off it)
+
+        x = min(max(int(pos[0] // TILE_PIXELS), 0), TILES_WIDE - 1)
+        y = min(max(int(pos[1] // TILE_PIXELS), 0), TILES_HIGH - 1)
+        self.grids[grid, y, x] += 1
+
+    def encode(self):
+
+        level = self.level
+        self.dynamic_grids.fill(0)
+
+        for enemy in level.enemy_sprites:
+            self.add_to_grid(self.enemy_grids[type(enemy)], enemy.rect.center)
+
+        for bullet in level.bullet_sprites:
+            fired_by_player = bullet.enemy_sprites is level.enemy_sprites
+            self.add_to_grid(self.player_bullet_grid if fired_by_player else self.enemy_bullet_grid, bullet.rect.center)
+
+        for coin in level.coin_sprites:
+            self.add_to_grid(self.coin_grid, coin.rect.center)
+
+        for powerup in level.powerup_sprites:
+            self.add_to_grid(self.powerup_grid, powerup.rect.center)
+
+        # Features
+        features = self.features
+        player = level.player
+        level_timer = level.level_timer_group.sprite
+
+        features[0] = player.rect.centerx / GAME_WIDTH
+        features[1] = player.rect.centery / GAME_HEIGHT
+        features[2] = player.direction.x
+        features[3] = player.direction.y
+        features[4] = level.game_data.lives
+        features[5] = level.game_data.stored_powerup is not None
+        features[6] = level_timer.level_timer.percent_left() if level_timer is not None else 0
+        for index, timer in enumerate(self.timers, start=7):
+            features[index] = timer.percent_left()
+
+        return self.observation
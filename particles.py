@@ -15,6 +15,8 @@ class ParticleEffect(pygame.sprite.Sprite):
 
         # Image & animation
         # Copy the surfaces, as settings their alpha values will affect all with a reference to it
+        # (but keep the frames we were given, so the level can tell which effect this is when taking a snapshot)
+        self.source_frames = frames
         self.frames = [s.copy() for s in frames]
         self.frame_index = 0
         self.animation_speed = 9
@@ -32,6 +34,26 @@ class ParticleEffect(pygame.sprite.Sprite):
         self.death_timer = None if death_duration is None else Timer(death_duration, func=self.kill)
         self.delay_timer = None if delay is None else Timer(delay, auto_start=True)
 
+    def get_state(self):
+
+        return (
+            self.rect.center, self.frame_index,
+            None if self.death_timer is None else self.death_timer.get_state(),
+            None if self.delay_timer is None else self.delay_timer.get_state()
+        )
+
+    def set_state(self, state):
+
+        self.rect.center, self.frame_index, death_timer, delay_timer = state
+
+        if self.death_timer is not None:
+            self.death_timer.set_state(death_timer)
+        if self.delay_timer is not None:
+            self.delay_timer.set_state(delay_timer)
+
+        self.image = self.frames[min(int(self.frame_index), len(self.frames) - 1)]
+        self.image.set_alpha(0 if self.delay_timer is not None and self.delay_timer.active else 255)
+
     def update_timers(self):
 
         if self.delay_timer is not None:
@@ -1,13 +1,13 @@
 import math
 import pygame
-import random
 from settings import *
-from util import import_folder, Timer, rotate_vector, import_image
+from util import import_folder, Timer, rotate_vector, import_image, get_ticks
+from gameplay_events import log_event, POWERUP_APPLIED, DROP_NAME_INDEXES
 
 
 class Player(pygame.sprite.Sprite):
 
-    def __init__(self, pos, collision_sprites, create_bullet, game_data, apply_nuke, apply_smoke_bomb, tombstone_timer, apply_tombstone, lightening_timer, audio, destroy_player, groups):
+    def __init__(self, pos, collision_sprites, create_bullet, game_data, apply_nuke, apply_smoke_bomb, tombstone_timer, apply_tombstone, lightening_timer, audio, destroy_player, input_provider, groups):
 
         super().__init__(groups)
 
@@ -21,6 +21,7 @@ class Player(pygame.sprite.Sprite):
         self.apply_tombstone = apply_tombstone
         self.lightening_timer = lightening_timer
         self.destroy_player = destroy_player
+        self.input_provider = input_provider
 
         # Audio
         self.gun_shot_sound = audio['gunshot']
@@ -75,7 +76,7 @@ class Player(pygame.sprite.Sprite):
         assert not self.lightening_timer.active
         if not self.tombstone_timer.active:
             # Invincible in zombie mode
-            self.destroy_player()
+            self.destroy_player(self)
 
     def calculate_active_bullet_cooldown(self):
         # Calculate the bullet cooldown timer's duration based on the active buffs
@@ -158,6 +159,56 @@ class Player(pygame.sprite.Sprite):
         self.wagon_wheel_timer.deactivate()
         self.sheriff_timer.deactivate()
 
+    def reset_to_start(self, start_position):
+        # Called when a level is reset, to put the player back into the state it was created in
+
+        self.rect.center = start_position
+        self.hitbox.center = self.rect.center
+        self.pos = pygame.math.Vector2(self.rect.center)
+        self.direction = pygame.math.Vector2()
+        self.direction_shooting = None
+
+        self.status = 'idle'
+        self.frame_index = 0
+        self.image = self.animations[self.status][self.frame_index]
+        self.image.set_alpha(255)
+
+        for timer in [self.bullet_cooldown, self.flash_timer, self.coffee_timer, self.sheriff_timer,
+                      self.machine_gun_timer, self.shotgun_timer, self.wagon_wheel_timer, self.footstep_timer]:
+            timer.reset()
+
+        # Upgrades may have been bought since we were created
+        self.calculate_base_stats()
+        self.bullet_cooldown.duration = self.base_bullet_cooldown
+
+    def get_state(self):
+
+        return (
+            tuple(self.pos), self.rect.topleft, self.hitbox.topleft, tuple(self.direction), self.direction_shooting,
+            self.status, self.frame_index, self.bullet_cooldown.get_state(), self.flash_timer.get_state(),
+            self.coffee_timer.get_state(), self.sheriff_timer.get_state(), self.machine_gun_timer.get_state(),
+            self.shotgun_timer.get_state(), self.wagon_wheel_timer.get_state(), self.footstep_timer.get_state()
+        )
+
+    def set_state(self, state):
+
+        pos, self.rect.topleft, self.hitbox.topleft, direction, self.direction_shooting, self.status, self.frame_index, \
+            bullet_cooldown, flash, coffee, sheriff, machine_gun, shotgun, wagon_wheel, footstep = state
+
+        self.pos = pygame.math.Vector2(pos)
+        self.direction = pygame.math.Vector2(direction)
+        self.bullet_cooldown.set_state(bullet_cooldown)
+        self.flash_timer.set_state(flash)
+        self.coffee_timer.set_state(coffee)
+        self.sheriff_timer.set_state(sheriff)
+        self.machine_gun_timer.set_state(machine_gun)
+        self.shotgun_timer.set_state(shotgun)
+        self.wagon_wheel_timer.set_state(wagon_wheel)
+        self.footstep_timer.set_state(footstep)
+
+        # Upgrades may differ from when the state was taken
+        self.calculate_base_stats()
+
     def import_assets(self):
 
         self.animations = {}
@@ -174,6 +225,8 @@ class Player(pygame.sprite.Sprite):
         # - We had one stored and pressed space
         # - We already had one stored and collected another
 
+        log_event(POWERUP_APPLIED, DROP_NAME_INDEXES[powerup_name], pos=self.rect.center)
+
         if powerup_name == 'coffee':
             self.coffee_timer.activate()
 
@@ -185,7 +238,7 @@ class Player(pygame.sprite.Sprite):
             self.apply_nuke()
 
         elif powerup_name == 'smoke_bomb':
-            self.apply_smoke_bomb()
+            self.apply_smoke_bomb(self)
 
         elif powerup_name == 'shotgun':
             self.shotgun_timer.activate()
@@ -209,6 +262,8 @@ class Player(pygame.sprite.Sprite):
         # Although ordinarily we use hit-boxes for collisions, by using rects it gives us a bit more room away
         # from those objects, which is a feature I want
 
+        random = self.game_data.random_streams['teleport']
+
         coordinates_found = False
         while not coordinates_found:
 
@@ -239,7 +294,7 @@ class Player(pygame.sprite.Sprite):
 
     def input(self):
 
-        keys = pygame.key.get_pressed()
+        keys = self.input_provider.get_pressed()
 
         # Movement
 
@@ -442,7 +497,7 @@ class Player(pygame.sprite.Sprite):
         self.image = current_animation[int(self.frame_index)]
 
         if self.flash_timer.active:
-            if math.sin(pygame.time.get_ticks() * 0.05) >= 0:
+            if math.sin(get_ticks() * 0.05) >= 0:
                 self.image.set_alpha(0)
             else:
                 self.image.set_alpha(255)
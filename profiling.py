@@ -0,0 +1,402 @@
+import os
+import sys
+import time
+import builtins
+import threading
+import argparse
+import contextlib
+from instruments import Instrument
+
+
+# Budget (in milliseconds) for importing the main module, i.e. the import cost of `python main.py` before any window
+# opens. Checked by running `python profiling.py`, which exits with an error if it's exceeded
+# Most of it is pygame's own import (~210-230 ms, as it pulls in pkg_resources & numpy), which we can't cut
+IMPORT_TIME_BUDGET_MS = 400
+
+# Modules that are only needed once a level is being built or played, and so must not be imported at start up
+# (numpy isn't in here, as pygame imports it itself for the surfarray module whenever it's installed)
+LAZY_MODULES = ['pytmx', 'pathfinding', 'base_level', 'normal_level', 'shop_level', 'boss_level']
+
+
+class ImportTimer:
+    # Times every module imported while installed, by wrapping the builtin __import__
+    # Like `python -X importtime`, we record the self time of each import as well as its cumulative time,
+    # which includes the time spent on any nested imports it triggered
+
+    def __init__(self):
+
+        self.records = []       # (module name, self time, cumulative time, nesting depth), in import order
+        self.child_times = []   # Stack of time spent on nested imports, one entry per import in progress
+        self.original_import = None
+
+    def install(self):
+
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def uninstall(self):
+
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+
+        # Already imported, nothing to time (by far the most common case)
+        if level == 0 and not fromlist and name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        modules_before = len(sys.modules)
+        self.child_times.append(0)
+        start_time = time.perf_counter()
+
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        finally:
+            cumulative_time = time.perf_counter() - start_time
+            self_time = cumulative_time - self.child_times.pop()
+            if self.child_times:
+                self.child_times[-1] += cumulative_time
+
+            # Only record calls that actually loaded something new
+            if len(sys.modules) > modules_before:
+                self.records.append((self.resolve_name(name, globals, level), self_time, cumulative_time, len(self.child_times)))
+
+    @staticmethod
+    def resolve_name(name, globals, level):
+        # Relative imports (e.g. `from . import x`) are named relative to the importing package
+
+        if level == 0 or not globals or not globals.get('__package__'):
+            return '.' * level + name
+
+        package = globals['__package__'].rsplit('.', level - 1)[0]
+        return package + '.' + name if name else package
+
+    def total_time(self):
+
+        return sum(record[2] for record in self.records if record[3] == 0)
+
+
+class StartupProfiler:
+    # Reports how long start up takes, broken down into the cost of each module import and each named phase
+    # (e.g. loading the assets). When not enabled, it does nothing, so it can always be passed around
+
+    def __init__(self, enabled=False):
+
+        self.enabled = enabled
+        self.start_time = time.perf_counter()
+        self.phases = []  # (phase name, duration)
+        self.import_timer = ImportTimer()
+
+        if self.enabled:
+            self.import_timer.install()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+
+        if not self.enabled:
+            yield
+            return
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start_time))
+
+    def report(self, top=15, file=sys.stdout):
+
+        if not self.enabled:
+            return
+
+        self.import_timer.uninstall()
+
+        total_time = time.perf_counter() - self.start_time
+        print('Start up took %.1f ms' % (total_time * 1000), file=file)
+
+        print('\nImports (%.1f ms total), slowest first:' % (self.import_timer.total_time() * 1000), file=file)
+        print('  %10s | %10s | module' % ('self ms', 'cumul. ms'), file=file)
+        for name, self_time, cumulative_time, depth in sorted(self.import_timer.records, key=lambda r: -r[2])[:top]:
+            print('  %10.1f | %10.1f | %s%s' % (self_time * 1000, cumulative_time * 1000, '  ' * depth, name), file=file)
+
+        print('\nPhases:', file=file)
+        for name, duration in self.phases:
+            print('  %10.1f ms  %s' % (duration * 1000, name), file=file)
+
+
+class LevelProfiler(Instrument):
+    # Runs cProfile over each level's lifetime (from when it's switched to until the next switch), attributing the
+    # profile to the level's index in LEVEL_DATA, as e.g. the forest and graveyard levels stress different code paths
+    # A level played more than once (e.g. after a game over) adds to the same profile
+    #
+    # When each level ends, two files are (re)written to the output directory:
+    #  - level_NN.prof, for pstats, snakeviz, etc.
+    #  - level_NN.folded, in the collapsed stack format flamegraph tools read (e.g. flamegraph.pl, speedscope)
+    # When not enabled (no output directory), it does nothing, so it can always be passed around
+    # As one of the game's instruments, it profiles each level from when it's switched to, until the session ends
+
+    def __init__(self, output_dir=None):
+
+        self.output_dir = output_dir
+        self.enabled = output_dir is not None
+        self.profile = None
+        self.level_index = None
+        self.stats = {}  # Level index -> pstats.Stats of every time it's been played
+
+        if self.enabled:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def start(self, level_index):
+        # Stops profiling the last level, if there was one, and starts profiling this one
+
+        self.stop()
+        if not self.enabled:
+            return
+
+        # cProfile & pstats are only imported once profiling, as pstats is slow to import and this module is at start up
+        import cProfile
+
+        self.level_index = level_index
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+
+        if self.profile is None:
+            return
+
+        self.profile.disable()
+        profile, level_index = self.profile, self.level_index
+        self.profile = self.level_index = None
+
+        # Nothing was called while profiling (e.g. stopped straight after starting)
+        if not profile.getstats():
+            return
+
+        import pstats
+
+        if level_index in self.stats:
+            self.stats[level_index].add(profile)
+        else:
+            self.stats[level_index] = pstats.Stats(profile)
+
+        path = os.path.join(self.output_dir, 'level_%02d' % level_index)
+        self.stats[level_index].dump_stats(path + '.prof')
+        with open(path + '.folded', 'w') as file:
+            write_collapsed_stacks(self.stats[level_index], file)
+
+    def level_started(self, game, level_index):
+
+        self.start(level_index)
+
+    def session_ended(self, game):
+
+        self.stop()
+
+
+class SamplingProfiler(Instrument):
+    # Samples the main thread's stack from a background thread, at `rate` samples per second, via sys._current_frames
+    # Unlike cProfile nothing runs on the main thread, so the game runs at (almost) full speed and can be left on
+    # Each sample is tagged with what `context` returns when it's taken (e.g. the level and game phase), and counted
+    # per tag & stack. `dump` writes the counts as collapsed stacks, with the tags as the outermost frames
+    # When not enabled (no output path), it does nothing, so it can always be passed around
+    # As one of the game's instruments, it samples while the game runs (tagged by `Game.profile_context`, unless given
+    # another `context`), and dumps the samples so far when F9 is pressed
+
+    def __init__(self, output_path=None, rate=100, context=None):
+
+        self.output_path = output_path
+        self.enabled = output_path is not None
+        self.interval = 1 / rate
+        self.context = context
+        self.dump_key_held = False
+
+        self.counts = {}          # (tags, stack) -> number of samples
+        self.labels = {}          # Code object -> its frame label, as working them out is most of the cost of a sample
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.thread_id = None
+
+    def start(self):
+        # Starts sampling the thread this is called from
+
+        if not self.enabled or self.thread is not None:
+            return
+
+        self.thread_id = threading.get_ident()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.sample_loop, name='SamplingProfiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Stops sampling and dumps what was sampled
+
+        if self.thread is None:
+            return
+
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self.dump()
+
+    def sample_loop(self):
+
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = self.labels[code] = '%s:%s:%d' % (os.path.basename(code.co_filename), code.co_name, code.co_firstlineno)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+
+        # The main thread carries on while we sample it, so what it's doing may have moved on, in which case we skip it
+        try:
+            tags = tuple(self.context()) if self.context is not None else ()
+        except Exception:
+            return
+
+        key = (tags, tuple(stack))
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def dump(self):
+        # Write every sample so far (overwriting any earlier dump), e.g. on exit or when asked for by a hotkey
+
+        if not self.enabled:
+            return
+
+        with self.lock:
+            counts = list(self.counts.items())
+
+        with open(self.output_path, 'w') as file:
+            for (tags, stack), count in counts:
+                file.write('%s %d\n' % (';'.join(tags + stack), count))
+
+    def run_started(self, game):
+
+        if self.context is None:
+            self.context = game.profile_context
+        self.start()
+
+    def frame_ended(self, game, frame_time, dt, work_time):
+
+        # pygame's already been imported by the game, but isn't imported at the top so start up imports are all timed
+        import pygame
+
+        dump_key_held = pygame.key.get_pressed()[pygame.K_F9]
+        if dump_key_held and not self.dump_key_held:
+            self.dump()
+        self.dump_key_held = dump_key_held
+
+    def run_ended(self, game):
+
+        self.stop()
+
+
+def function_label(function):
+    # A pstats function key (file name, line number, function name) as a frame in a collapsed stack
+
+    file_name, line, name = function
+    if file_name == '~':
+        return name  # Built in, e.g. <method 'blit' of 'pygame.surface.Surface' objects>
+    return '%s:%s:%d' % (os.path.basename(file_name), name, line)
+
+
+def write_collapsed_stacks(stats, file, min_microseconds=1):
+    # Write pstats as collapsed stacks, a line per stack: the frames from the root joined by ';', then its self time in
+    # microseconds. cProfile only records who called whom, not whole stacks, so stacks are rebuilt by walking down from
+    # the functions nothing called, splitting each function's time between its callers by how much each contributed
+
+    # Function -> [(callee, cumulative time spent in the callee when called from the function)]
+    callees = {function: [] for function in stats.stats}
+    for callee, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, caller_cumulative_time) in callers.items():
+            if caller in callees:
+                callees[caller].append((callee, caller_cumulative_time))
+
+    folded = {}
+
+    def walk(function, stack, share):
+        # `share` is the fraction of the function's time spent on this stack
+
+        _, _, self_time, cumulative_time, _ = stats.stats[function]
+        stack = stack + (function,)
+        folded[stack] = folded.get(stack, 0) + self_time * share
+
+        for callee, edge_time in callees[function]:
+            callee_cumulative_time = stats.stats[callee][3]
+            callee_time = edge_time * share
+            # Recursion is folded into the outermost call, and tiny contributions are dropped, to keep the walk finite
+            if callee in stack or callee_cumulative_time <= 0 or callee_time * 1e6 < min_microseconds:
+                continue
+            walk(callee, stack, callee_time / callee_cumulative_time)
+
+    # The roots are the functions called from outside the profile (or only by themselves, if recursive)
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if all(caller == function or caller not in stats.stats for caller in callers):
+            walk(function, (), 1)
+
+    for stack, seconds in folded.items():
+        microseconds = round(seconds * 1e6)
+        if microseconds >= min_microseconds:
+            file.write('%s %d\n' % (';'.join(function_label(function) for function in stack), microseconds))
+
+
+def check_import_budget(budget_ms=IMPORT_TIME_BUDGET_MS):
+    # Import the game's main module in a fresh interpreter, exactly as `python main.py` would, and return how long it
+    # took and a list of budget violations. (Importing it here would cost nothing if it had already been imported)
+
+    import subprocess
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+
+    # Each line of the report is 'import time: <self us> | <cumulative us> | <module, indented by import depth>'
+    cumulative_us = {}
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[1].strip().isdigit():
+            cumulative_us[fields[2].strip()] = int(fields[1])
+
+    violations = []
+
+    import_time_ms = cumulative_us['main'] / 1000
+    if import_time_ms > budget_ms:
+        violations.append('importing main took %.1f ms, over the budget of %d ms' % (import_time_ms, budget_ms))
+
+    for module in LAZY_MODULES:
+        if module in cumulative_us:
+            violations.append('%s was imported at start up, but should only be imported where needed' % module)
+
+    return import_time_ms, violations
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Check the import time of the game stays within budget')
+    parser.add_argument('--budget-ms', type=int, default=IMPORT_TIME_BUDGET_MS)
+    args = parser.parse_args()
+
+    import_time_ms, violations = check_import_budget(args.budget_ms)
+
+    for violation in violations:
+        print('FAIL: %s' % violation)
+    if violations:
+        sys.exit(1)
+
+    print('OK: importing main took %.1f ms (budget %d ms)' % (import_time_ms, args.budget_ms))
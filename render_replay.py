@@ -0,0 +1,180 @@
+import os
+import sys
+import random
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Rendering runs headless, so must be set before pygame is imported (including by the game's modules)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+import numpy as np
+from main import Game
+from settings import *
+from replay import Recording
+from capture import FrameCapture
+
+
+# Renders a recorded session to frames, as fast as the machine allows rather than in real time
+# A first pass plays the session without drawing anything, taking a snapshot of the game every so often. The session
+# is then split into chunks at those snapshots, and each chunk is rendered in its own process, which restores the
+# snapshot and plays on from there, drawing every tick exactly as the game would (the level's camera & UI included)
+#
+# Output formats:
+#  - png: a directory of numbered PNG images, one per tick
+#  - raw: a directory of numbered files of raw RGB bytes (row by row), one per tick
+#  - y4m: a single YUV4MPEG2 video file (4:4:4), which e.g. ffmpeg can read directly
+
+
+class PngWriter:
+
+    def __init__(self, directory, first_frame):
+
+        self.directory = directory
+        self.frame_number = first_frame
+
+    def __call__(self, frame):
+
+        surface = pygame.surfarray.make_surface(frame.transpose(1, 0, 2))
+        pygame.image.save(surface, os.path.join(self.directory, 'frame_%06d.png' % self.frame_number))
+        self.frame_number += 1
+
+    def close(self):
+
+        pass
+
+
+class RawWriter(PngWriter):
+
+    def __call__(self, frame):
+
+        with open(os.path.join(self.directory, 'frame_%06d.rgb' % self.frame_number), 'wb') as file:
+            file.write(frame.tobytes())
+        self.frame_number += 1
+
+
+class Y4mWriter:
+    # Writes this chunk's frames to a part file, which are joined together (after the header) once all are rendered
+
+    def __init__(self, path, first_frame):
+
+        self.file = open(part_path(path, first_frame), 'wb')
+
+    def __call__(self, frame):
+
+        # BT.601 RGB -> YCbCr (limited range)
+        rgb = frame.astype(np.float32)
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        y = 16 + (65.738 * r + 129.057 * g + 25.064 * b) / 256
+        cb = 128 + (-37.945 * r - 74.494 * g + 112.439 * b) / 256
+        cr = 128 + (112.439 * r - 94.154 * g - 18.285 * b) / 256
+
+        self.file.write(b'FRAME\n')
+        for plane in (y, cb, cr):
+            self.file.write(np.clip(np.rint(plane), 0, 255).astype(np.uint8).tobytes())
+
+    def close(self):
+
+        self.file.close()
+
+
+FRAME_WRITERS = {'png': PngWriter, 'raw': RawWriter, 'y4m': Y4mWriter}
+
+
+def part_path(path, first_frame):
+
+    return '%s.part%06d' % (path, first_frame)
+
+
+def split_into_chunks(recording, chunk_seconds):
+    # Play the session without drawing, snapshotting the game at the start of each chunk
+    # Chunks can only start while in a level (not e.g. on the intro screen), so some may run longer
+    # Returns the chunks as (first tick, tick after the last, snapshot to start from or None to start from scratch)
+
+    game = Game(replay=recording)
+    chunk_ticks = int(chunk_seconds * TICKS_PER_SECOND)
+
+    starts = [(0, None)]
+    tick = 0
+    while not game.replay_input.finished:
+        if tick - starts[-1][0] >= chunk_ticks:
+            try:
+                starts.append((tick, game.snapshot()))
+            except ValueError:
+                pass
+        game.step(game.fixed_dt)
+        tick += 1
+
+    ends = [start for start, _ in starts[1:]] + [tick]
+    return [(start, end, snapshot) for (start, snapshot), end in zip(starts, ends)]
+
+
+def render_chunk(recording_path, start, end, snapshot, output, output_format):
+
+    recording = Recording.load(recording_path)
+    game = Game(replay=recording)
+    if snapshot is not None:
+        game.restore(snapshot)
+        game.replay_input.seek(start)
+
+    writer = FRAME_WRITERS[output_format](output, start)
+    capture = FrameCapture()
+    capture.add_consumer(writer, 'display')
+    capture.activate()
+
+    try:
+        for tick in range(start, end):
+            game.step(game.fixed_dt)
+            # Only drawing uses the global random module (e.g. the lightening effect), which we seed per tick so the
+            # frames are the same however the session is split into chunks
+            random.seed('%s:%s' % (recording.seed, tick))
+            game.draw()
+    finally:
+        writer.close()
+        capture.deactivate()
+
+    return end - start
+
+
+def render_replay(recording_path, output, output_format='png', chunk_seconds=10, workers=None):
+    # Returns the number of frames rendered
+
+    recording = Recording.load(recording_path)
+    chunks = split_into_chunks(recording, chunk_seconds)
+
+    if output_format != 'y4m':
+        os.makedirs(output, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(render_chunk, recording_path, start, end, snapshot, output, output_format)
+            for start, end, snapshot in chunks
+        ]
+        frame_count = sum(future.result() for future in futures)
+
+    if output_format == 'y4m':
+        with open(output, 'wb') as file:
+            file.write(b'YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C444\n' % (SCREEN_WIDTH, SCREEN_HEIGHT, recording.ticks_per_second))
+            for start, _, _ in chunks:
+                with open(part_path(output, start), 'rb') as part:
+                    shutil.copyfileobj(part, file)
+                os.remove(part_path(output, start))
+
+    return frame_count
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Render a recorded session to frames or a video, using all cores')
+    parser.add_argument('recording', help='a recording made with `python main.py --record`')
+    parser.add_argument('output', help='directory for png/raw frames, or file for a y4m video')
+    parser.add_argument('--format', choices=FRAME_WRITERS, default='png')
+    parser.add_argument('--chunk-seconds', type=float, default=10, help='length of game time each process renders at once')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    frame_count = render_replay(args.recording, args.output, args.format, args.chunk_seconds, args.workers)
+    print('Rendered %d frames to %s' % (frame_count, args.output), file=sys.stderr)
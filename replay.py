@@ -0,0 +1,179 @@
+import bisect
+import struct
+from settings import *
+from controls import InputProvider
+
+
+# A recording is everything needed to play a session again exactly: the seed for the random streams, the fixed time
+# step, and the input bitmask for every tick. As inputs rarely change from one tick to the next, they are stored
+# delta-encoded: only the ticks where the bitmask changes, each as (ticks since the last change, new bitmask) varints
+# Keyframes every so often store the decoder's state, so a replay can seek without decoding from the start
+
+MAGIC = b'PKRP'
+VERSION = 1
+HEADER = struct.Struct('<4sBQ?HIII')  # magic, version, seed, easy mode, ticks per second, ticks, keyframes, change bytes
+KEYFRAME = struct.Struct('<IIIH')     # tick, offset into changes, tick of the last change before it, bitmask at tick
+
+
+def write_varint(buffer, value):
+
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(buffer, offset):
+    # Returns the value and the offset after it
+
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Recording:
+
+    KEYFRAME_INTERVAL = 10 * TICKS_PER_SECOND
+
+    def __init__(self, seed, easy_mode=True, ticks_per_second=TICKS_PER_SECOND):
+
+        self.seed = seed
+        self.easy_mode = easy_mode
+        self.ticks_per_second = ticks_per_second
+
+        self.tick_count = 0
+        self.changes = bytearray()
+        self.keyframes = []  # (tick, offset, last change tick, mask), with the state after that tick's input
+
+        # Encoder state
+        self.mask = 0
+        self.last_change_tick = 0
+
+    def append(self, mask):
+        # Add the input for the next tick
+
+        tick = self.tick_count
+
+        if mask != self.mask:
+            write_varint(self.changes, tick - self.last_change_tick)
+            write_varint(self.changes, mask)
+            self.mask = mask
+            self.last_change_tick = tick
+
+        if tick % self.KEYFRAME_INTERVAL == 0:
+            self.keyframes.append((tick, len(self.changes), self.last_change_tick, self.mask))
+
+        self.tick_count += 1
+
+    def keyframe_before(self, tick):
+        # The latest keyframe at or before `tick`, or None if there isn't one
+
+        index = bisect.bisect_right(self.keyframes, tick, key=lambda keyframe: keyframe[0]) - 1
+        return self.keyframes[index] if index >= 0 else None
+
+    def save(self, path):
+
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(
+                MAGIC, VERSION, self.seed, self.easy_mode, self.ticks_per_second,
+                self.tick_count, len(self.keyframes), len(self.changes)
+            ))
+            for keyframe in self.keyframes:
+                file.write(KEYFRAME.pack(*keyframe))
+            file.write(self.changes)
+
+    @classmethod
+    def load(cls, path):
+
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        magic, version, seed, easy_mode, ticks_per_second, tick_count, keyframe_count, changes_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a recording this version of the game can play' % path)
+
+        recording = cls(seed, easy_mode, ticks_per_second)
+        recording.tick_count = tick_count
+
+        offset = HEADER.size
+        for _ in range(keyframe_count):
+            recording.keyframes.append(KEYFRAME.unpack_from(data, offset))
+            offset += KEYFRAME.size
+        recording.changes = bytearray(data[offset:offset + changes_length])
+
+        return recording
+
+
+class InputRecorder(InputProvider):
+    # Passes through the inputs of another provider, adding each tick's input to a recording
+
+    def __init__(self, provider, recording):
+
+        super().__init__()
+        self.provider = provider
+        self.recording = recording
+
+    def poll(self):
+
+        self.provider.poll()
+        self.keys = self.provider.get_pressed()
+        self.recording.append(self.keys.mask)
+
+
+class ReplayInput(InputProvider):
+    # Plays back the inputs of a recording, one tick per poll
+
+    def __init__(self, recording):
+
+        super().__init__()
+        self.recording = recording
+        self.seek(0)
+
+    @property
+    def finished(self):
+
+        return self.next_tick >= self.recording.tick_count
+
+    def read_next_change(self):
+
+        if self.offset >= len(self.recording.changes):
+            self.next_change = None
+        else:
+            delta, self.offset = read_varint(self.recording.changes, self.offset)
+            mask, self.offset = read_varint(self.recording.changes, self.offset)
+            self.last_change_tick += delta
+            self.next_change = (self.last_change_tick, mask)
+
+    def seek(self, tick):
+        # Set up so the next poll gives the input for `tick`
+        # We start decoding from the nearest keyframe before it, which holds the state after its tick's input
+
+        keyframe = self.recording.keyframe_before(tick - 1)
+        if keyframe is None:
+            self.offset, self.last_change_tick, self.keys.mask = 0, 0, 0
+        else:
+            _, self.offset, self.last_change_tick, self.keys.mask = keyframe
+
+        self.read_next_change()
+        while self.next_change is not None and self.next_change[0] < tick:
+            self.keys.mask = self.next_change[1]
+            self.read_next_change()
+
+        self.next_tick = tick
+
+    def poll(self):
+
+        if self.finished:
+            return
+
+        if self.next_change is not None and self.next_change[0] == self.next_tick:
+            self.keys.mask = self.next_change[1]
+            self.read_next_change()
+
+        self.next_tick += 1
@@ -0,0 +1,368 @@
+import os
+import sys
+import time
+import random
+import struct
+import asyncio
+import argparse
+
+# The server runs headless, so must be set before pygame is imported (including by the game's modules)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from settings import *
+from boss import Cowboy
+from sprites import Coin
+from controls import InputProvider
+from game_data import GameData, LEVEL_DATA
+from util import GameClock, RandomStreams
+from simulate import build_level, headless_game
+from enemies import Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
+
+
+# Hosts many game sessions at once, each played by a client connected over a local socket
+# Every session is ticked at the same fixed rate by one scheduler, with the game time advancing by exactly one tick
+# each time, so a session plays the same whether the server is busy or not (it just runs slower than real time)
+# Levels are built by the scheduler too, between ticks (with the time left before the next is due), rather than when
+# a client joins or leaves a level, so loading one session's level doesn't hold up every other session's ticks
+#
+# Messages are framed with a 2 byte length, then a 1 byte type:
+#  - client -> server: JOIN (seed, or -1 for a random one, and easy mode), then INPUT (the input bitmask, see controls)
+#    whenever the keys pressed change
+#  - server -> client: WELCOME (session id & seed) or BUSY, then a STATE every tick, and OVER once the game is over
+#
+# Backpressure:
+#  - If ticking all the sessions takes longer than a tick, the scheduler runs the next tick straight away to catch
+#    up, but if it falls more than `max_lag_ticks` behind it gives up on catching up (those ticks are dropped)
+#  - While the server is loaded (ticks taking most of their time), new sessions are turned away as BUSY
+#  - STATE messages aren't queued up for clients that aren't reading them: a tick's state is skipped for a client
+#    with too much unsent, as each state replaces the last
+
+LENGTH = struct.Struct('<H')
+JOIN, INPUT, WELCOME, BUSY, STATE, OVER = b'J', b'I', b'W', b'B', b'S', b'O'
+JOIN_MESSAGE = struct.Struct('<q?')     # seed, easy mode
+INPUT_MESSAGE = struct.Struct('<H')     # input bitmask
+WELCOME_MESSAGE = struct.Struct('<IQ')  # session id, seed
+OVER_MESSAGE = struct.Struct('<?HH')    # finished every level, coins, deaths
+
+# A state is a header, then each sprite's type & position
+STATE_HEADER = struct.Struct('<IbbHhhBH')  # tick, level, lives, coins, player x, y, level time left (/255), sprites
+STATE_SPRITE = struct.Struct('<Bhh')
+
+SPRITE_TYPES = {enemy_type: index for index, enemy_type in enumerate([Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball, Cowboy], start=1)}
+PLAYER_BULLET, ENEMY_BULLET, COIN, POWERUP = range(len(SPRITE_TYPES) + 1, len(SPRITE_TYPES) + 5)
+
+BUSY_LOAD = 0.9  # Fraction of each tick spent ticking sessions, over which new sessions are turned away
+WRITE_BUFFER_LIMIT = 64 * 1024
+
+
+def encode_message(message_type, payload=b''):
+
+    return LENGTH.pack(len(message_type) + len(payload)) + message_type + payload
+
+
+async def read_message(reader):
+    # Returns (type, payload). Raises asyncio.IncompleteReadError if the connection closes
+
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    message = await reader.readexactly(length)
+    return message[:1], message[1:]
+
+
+class RemoteInput(InputProvider):
+    # Keys pressed by a client, which stay pressed until the client sends another input
+
+    def set_mask(self, mask):
+
+        self.keys.mask = mask
+
+
+class Session:
+    # A game played by one client: its game data, the level it's on, and its own clock & inputs
+    # Unlike the game, there are no intro screen or transitions: the next level starts as soon as the server's built it
+
+    def __init__(self, session_id, seed, easy_mode, writer):
+
+        self.session_id = session_id
+        self.writer = writer
+
+        self.clock = GameClock()
+        self.input = RemoteInput()
+        self.game_data = GameData(old_easy_mode=easy_mode, old_volume=0, random_streams=RandomStreams(seed))
+
+        self.level = None
+        self.level_pending = True  # The next level is to be built (by the server, between ticks) before it's stepped
+        self.finished = False
+        self.tick_count = 0
+
+        # Accounting
+        self.cpu_time = 0.0
+        self.skipped_states = 0
+
+    def transition_to_next_level(self):
+
+        self.level_pending = True
+
+    def next_level(self):
+
+        self.game_data.current_level += 1
+        self.level_pending = False
+
+        if self.game_data.current_level in LEVEL_DATA:
+            self.level = build_level(
+                self.game_data.current_level, {}, self.game_data, self.input, self.clock,
+                transition_to_next_level=self.transition_to_next_level
+            )
+        else:
+            self.finished = True
+
+    def step(self, dt):
+
+        self.level.step(dt)
+        self.tick_count += 1
+
+        if self.level.game_over:
+            self.finished = True
+
+    def encode_state(self):
+
+        level = self.level
+        sprites = []
+
+        for enemy in level.enemy_sprites:
+            sprites.append(STATE_SPRITE.pack(SPRITE_TYPES[type(enemy)], *enemy.rect.center))
+        for bullet in level.bullet_sprites:
+            bullet_type = PLAYER_BULLET if bullet.enemy_sprites is level.enemy_sprites else ENEMY_BULLET
+            sprites.append(STATE_SPRITE.pack(bullet_type, *bullet.rect.center))
+        for drop in level.coin_sprites.sprites() + level.powerup_sprites.sprites():
+            sprites.append(STATE_SPRITE.pack(COIN if isinstance(drop, Coin) else POWERUP, *drop.rect.center))
+
+        level_timer = level.level_timer_group.sprite
+        header = STATE_HEADER.pack(
+            self.tick_count, self.game_data.current_level, self.game_data.lives, self.game_data.coins,
+            *level.player.rect.center,
+            int(255 * level_timer.level_timer.percent_left()) if level_timer is not None else 0,
+            len(sprites)
+        )
+        return header + b''.join(sprites)
+
+    def send(self, message):
+        # Returns False (without sending) if the client already has too much unsent, or has gone
+
+        if self.writer.is_closing() or self.writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+            return False
+        self.writer.write(message)
+        return True
+
+
+class GameServer:
+
+    def __init__(self, max_sessions=64, tick_rate=TICKS_PER_SECOND, max_lag_ticks=5):
+
+        self.max_sessions = max_sessions
+        self.tick_rate = tick_rate
+        self.max_lag_ticks = max_lag_ticks
+
+        self.sessions = {}
+        self.next_session_id = 1
+
+        # Accounting
+        self.tick_count = 0
+        self.overruns = 0       # Ticks that took longer than a tick
+        self.dropped_ticks = 0  # Ticks given up on, when too far behind to catch up
+        self.load = 0.0         # Moving average of the fraction of each tick spent ticking sessions
+
+    async def handle_client(self, reader, writer):
+
+        session = None
+        try:
+            message_type, payload = await read_message(reader)
+            if message_type != JOIN:
+                return
+
+            if len(self.sessions) >= self.max_sessions or self.load > BUSY_LOAD:
+                writer.write(encode_message(BUSY))
+                await writer.drain()
+                return
+
+            seed, easy_mode = JOIN_MESSAGE.unpack(payload)
+            session = Session(self.next_session_id, seed if seed >= 0 else None, easy_mode, writer)
+            self.sessions[session.session_id] = session
+            self.next_session_id += 1
+            writer.write(encode_message(WELCOME, WELCOME_MESSAGE.pack(session.session_id, session.game_data.random_streams.seed)))
+
+            while True:
+                message_type, payload = await read_message(reader)
+                if message_type == INPUT:
+                    session.input.set_mask(INPUT_MESSAGE.unpack(payload)[0])
+
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+
+        finally:
+            if session is not None:
+                self.sessions.pop(session.session_id, None)
+            writer.close()
+
+    def finish(self, session):
+        # Ends the session, as the client's handler sees the connection close
+
+        self.sessions.pop(session.session_id)
+        if not session.writer.is_closing():
+            session.writer.write(encode_message(OVER, OVER_MESSAGE.pack(
+                session.game_data.current_level not in LEVEL_DATA, session.game_data.coins, session.game_data.deaths
+            )))
+            session.writer.close()
+
+    def tick(self):
+
+        dt = 1 / self.tick_rate
+
+        for session in list(self.sessions.values()):
+
+            # Waiting for its level to be built
+            if session.level_pending:
+                continue
+
+            cpu_start = time.thread_time()
+            session.step(dt)
+            message = None if session.finished else encode_message(STATE, session.encode_state())
+            session.cpu_time += time.thread_time() - cpu_start
+
+            if session.finished:
+                self.finish(session)
+            elif not session.send(message):
+                session.skipped_states += 1
+
+        self.tick_count += 1
+
+    def build_levels(self, deadline):
+        # Builds the levels sessions are waiting for, until `deadline` (in perf_counter time). At least one is always
+        # built, so sessions aren't kept waiting forever when the server can't keep up
+
+        for session in [session for session in self.sessions.values() if session.level_pending]:
+
+            cpu_start = time.thread_time()
+            session.next_level()
+            session.cpu_time += time.thread_time() - cpu_start
+
+            if session.finished:
+                self.finish(session)
+            if time.perf_counter() >= deadline:
+                return
+
+    async def run_ticks(self):
+
+        loop = asyncio.get_running_loop()
+        period = 1 / self.tick_rate
+        next_tick = loop.time()
+
+        while True:
+
+            start_time = time.perf_counter()
+            self.tick()
+            next_tick += period
+            # Building levels can use the rest of the time until the next tick, bar a little for reading inputs
+            self.build_levels(time.perf_counter() + (next_tick - loop.time()) - period * (1 - BUSY_LOAD))
+            self.load = 0.95 * self.load + 0.05 * ((time.perf_counter() - start_time) / period)
+
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.overruns += 1
+                ticks_behind = int(-delay / period)
+                if ticks_behind > self.max_lag_ticks:
+                    self.dropped_ticks += ticks_behind
+                    next_tick = loop.time()
+            # Always yield, even when behind, so clients' inputs still get read
+            await asyncio.sleep(max(0, delay))
+
+    def stats(self):
+
+        lines = ['%d sessions, load %.0f%%, %d ticks, %d overruns, %d dropped ticks' % (
+            len(self.sessions), self.load * 100, self.tick_count, self.overruns, self.dropped_ticks
+        )]
+        busiest = sorted(self.sessions.values(), key=lambda session: -session.cpu_time / max(1, session.tick_count))[:5]
+        for session in busiest:
+            lines.append('  session %d: level %d, %.2f ms CPU per tick, %d states skipped' % (
+                session.session_id, session.game_data.current_level,
+                1000 * session.cpu_time / max(1, session.tick_count), session.skipped_states
+            ))
+        return '\n'.join(lines)
+
+    async def report_stats(self, interval):
+
+        while True:
+            await asyncio.sleep(interval)
+            print(self.stats(), file=sys.stderr)
+
+
+async def run_bot(connect, seed):
+    # A client that presses random keys, for trying out the server under load
+    # Returns the OVER message's values, or None if turned away
+
+    reader, writer = await connect()
+    random_keys = random.Random(seed)
+    writer.write(encode_message(JOIN, JOIN_MESSAGE.pack(seed, True)))
+
+    try:
+        message_type, _ = await read_message(reader)
+        if message_type != WELCOME:
+            return None
+
+        while True:
+            message_type, payload = await read_message(reader)
+            if message_type == OVER:
+                return OVER_MESSAGE.unpack(payload)
+            if message_type == STATE and random_keys.random() < 0.05:
+                writer.write(encode_message(INPUT, INPUT_MESSAGE.pack(random_keys.getrandbits(9))))
+
+    except (asyncio.IncompleteReadError, OSError):
+        return None
+
+    finally:
+        writer.close()
+
+
+async def main(args):
+
+    # Load the assets before serving, rather than when the first client joins
+    headless_game()
+
+    server = GameServer(args.max_sessions)
+    if args.port is not None:
+        listener = await asyncio.start_server(server.handle_client, '127.0.0.1', args.port)
+        connect = lambda: asyncio.open_connection('127.0.0.1', args.port)
+    else:
+        listener = await asyncio.start_unix_server(server.handle_client, args.socket)
+        connect = lambda: asyncio.open_unix_connection(args.socket)
+
+    tasks = [asyncio.create_task(server.run_ticks())]
+    if args.stats_seconds > 0:
+        tasks.append(asyncio.create_task(server.report_stats(args.stats_seconds)))
+
+    async with listener:
+        if args.bots:
+            results = await asyncio.gather(*(run_bot(connect, seed) for seed in range(args.bots)))
+            print('%d bots finished: %s' % (args.bots, results), file=sys.stderr)
+            print(server.stats(), file=sys.stderr)
+        else:
+            await listener.serve_forever()
+
+    for task in tasks:
+        task.cancel()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Host many game sessions, played by clients over local sockets')
+    parser.add_argument('--socket', default='/tmp/prairie_king.sock', help='unix socket to listen on')
+    parser.add_argument('--port', type=int, help='listen on this localhost TCP port instead of a unix socket')
+    parser.add_argument('--max-sessions', type=int, default=64)
+    parser.add_argument('--stats-seconds', type=float, default=5, help='how often to print stats (0 for never)')
+    parser.add_argument('--bots', type=int, default=0, help='play this many random bot clients, then exit')
+    args = parser.parse_args()
+
+    if args.port is None and os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    asyncio.run(main(args))
@@ -17,3 +17,6 @@ Z_LAYERS = {
     'bullets': 6
 }
 
+
+# Fixed time step used when the game needs to be reproducible (e.g. recording & replaying a session)
+TICKS_PER_SECOND = 60
@@ -1,5 +1,6 @@
 import pygame
 from util import Timer
+from gameplay_events import log_event, PURCHASE, UPGRADE_TYPE_INDEXES
 from settings import *
 
 
@@ -56,7 +57,7 @@ class ShopKeeper(pygame.sprite.Sprite):
 
 class Shop(pygame.sprite.Sprite):
 
-    def __init__(self, box_surf, upgrade_surfs, coin_cost_surf, shop_keeper, player, game_data, groups):
+    def __init__(self, box_surf, upgrade_surfs, coin_cost_surf, shop_keeper, player, game_data, input_provider, groups):
 
         super().__init__(groups)
 
@@ -66,6 +67,7 @@ class Shop(pygame.sprite.Sprite):
         self.coin_cost_surf = coin_cost_surf
         self.game_data = game_data
         self.player = player
+        self.input_provider = input_provider
 
         # Fonts (two different sizes)
         self.font_unselected = pygame.font.Font('font/Stardew_Valley.ttf', int(5 * ZOOM_FACTOR))
@@ -112,6 +114,21 @@ class Shop(pygame.sprite.Sprite):
         # Timer
         self.purchase_timer = Timer(500)
 
+    def get_state(self):
+
+        return self.active, self.purchase_timer.get_state()
+
+    def set_state(self, state):
+
+        self.active, purchase_timer = state
+        self.purchase_timer.set_state(purchase_timer)
+
+    def reset(self):
+
+        self.active = False
+        self.image = self.box_surf.copy()
+        self.purchase_timer.reset()
+
     def update_image(self):
         # Whenever the shop is active, we re-create the image of the sprite
         # This means, starting with a base image of just the box surface
@@ -151,7 +168,7 @@ class Shop(pygame.sprite.Sprite):
 
         if not self.purchase_timer.active:
 
-            keys = pygame.key.get_pressed()
+            keys = self.input_provider.get_pressed()
             if keys[pygame.K_RETURN]:
 
                 for upgrade_type in ['boots', 'gun', 'ammo']:
@@ -172,6 +189,7 @@ class Shop(pygame.sprite.Sprite):
                             self.game_data.coins -= cost
                             self.game_data.upgrades[upgrade_type] += 1
                             self.player.calculate_base_stats()
+                            log_event(PURCHASE, UPGRADE_TYPE_INDEXES[upgrade_type], self.game_data.upgrades[upgrade_type], self.player.rect.center)
 
     def update(self):
 
@@ -4,9 +4,9 @@ from base_level import BaseLevel
 
 class ShopLevel(BaseLevel):
 
-    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart):
+    def __init__(self, level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface=None, clock=None, partner_input_provider=None):
 
-        super().__init__(level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart)
+        super().__init__(level_data, game_data, audio, assets, font, transition_to_next_level, transition_to_restart, input_provider, display_surface, clock, partner_input_provider)
 
         self.level_completed = True
         self.setup_shop()
@@ -20,9 +20,16 @@ class ShopLevel(BaseLevel):
             shop_keeper=self.shop_keeper,
             player=self.player,
             game_data=self.game_data,
+            input_provider=self.input_provider,
             groups=self.shop_group
         )
 
+    def reset(self):
+
+        super().reset()
+
+        self.shop_group.sprite.reset()
+
     def check_level_completed(self):
         # We've always completed a shop level. Implement as all level sub-classes need to implement this function
 
@@ -0,0 +1,351 @@
+import os
+import sys
+import math
+import random
+import argparse
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+# Simulations run headless, so must be set before pygame is imported (including by the game's modules)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from settings import *
+from util import GameClock, RandomStreams
+from controls import InputProvider, KEY_BITS
+from autopilot import Autopilot
+from heatmaps import HeatmapRecorder
+from game_data import GameData, LEVEL_DATA, level_class
+from enemies import Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball
+
+
+# Runs many headless playthroughs of levels, played by random or scripted agents, to see how hard each level is
+# Levels can be played with some of their data changed (see SWEEP_PARAMETERS), and with every combination of the
+# values given for each, so we can see how e.g. changing the spawn rates changes how often the level is cleared
+# Every combination is played with the same seeds, so differences between them come from the change, not the luck
+
+ENEMY_TYPES = [Orc, Ogre, Butterfly, Mushroom, Mummy, Imp, Spikeball]
+COIN_AND_NOTHING_DROPS = ['one', 'five', 'none']
+
+
+def parse_distribution(value):
+    # e.g. '0.5/0.3/0.2', the chances of spawning 1, 2 or 3 orcs/mummies at a time
+
+    return [float(p) for p in value.split('/')]
+
+
+# Name -> (how to parse a value from the command line, description)
+SWEEP_PARAMETERS = {
+    'spawn_rate': (float, 'multiplies the spawn rate (ms between spawns) of every enemy type'),
+    'p': (parse_distribution, 'the orc/mummy distribution of how many spawn at once, e.g. 0.5/0.3/0.2'),
+    'duration': (int, 'how long normal levels last (ms)'),
+    'boss_health': (int, 'the boss\'s health on boss levels'),
+    'drop_rate': (float, 'multiplies the chance of every enemy type dropping each powerup')
+}
+
+
+def apply_overrides(level_data, overrides):
+    # A copy of the level's data, with the swept parameters that apply to it changed
+
+    level_data = dict(level_data)
+    level_data['enemies'] = [dict(enemy) for enemy in level_data['enemies']]
+
+    for enemy in level_data['enemies']:
+        if 'spawn_rate' in overrides:
+            enemy['spawn_rate'] = max(1, round(enemy['spawn_rate'] * overrides['spawn_rate']))
+        if 'p' in overrides and 'p' in enemy:
+            enemy['p'] = overrides['p']
+
+    if 'duration' in overrides and 'duration' in level_data:
+        level_data['duration'] = overrides['duration']
+    if 'boss_health' in overrides and 'boss_health' in level_data:
+        level_data['boss_health'] = overrides['boss_health']
+
+    return level_data
+
+
+@contextlib.contextmanager
+def powerup_drop_rates(scale):
+    # Scale the chance of each enemy type dropping each powerup (but not coins) while inside the block
+    # The drop rates are class attributes, so this changes them for every enemy in the process
+
+    original_rates = {enemy_type: enemy_type.POWERUP_DROP_RATES for enemy_type in ENEMY_TYPES}
+    for enemy_type, rates in original_rates.items():
+        enemy_type.POWERUP_DROP_RATES = {
+            drop: rate if drop in COIN_AND_NOTHING_DROPS else rate * scale
+            for drop, rate in rates.items()
+        }
+
+    try:
+        yield
+    finally:
+        for enemy_type, rates in original_rates.items():
+            enemy_type.POWERUP_DROP_RATES = rates
+
+
+class Agent(InputProvider):
+    # Plays a level in place of the keyboard. Attached to the level before it's played, so it can look at it
+
+    def __init__(self, seed):
+
+        super().__init__()
+        self.random = random.Random(seed)
+        self.level = None
+
+    def attach(self, level):
+
+        self.level = level
+
+
+class RandomAgent(Agent):
+    # Holds down a random set of keys for a random amount of time, over and over
+
+    def __init__(self, seed):
+
+        super().__init__(seed)
+        self.hold_ticks = 0
+
+    def poll(self):
+
+        if self.hold_ticks <= 0:
+            self.keys.mask = self.random.getrandbits(len(KEY_BITS)) & ~KEY_BITS[pygame.K_RETURN]
+            self.hold_ticks = self.random.randint(1, TICKS_PER_SECOND)
+        self.hold_ticks -= 1
+
+
+class ScriptedAgent(Agent):
+    # Shoots at the nearest enemy, backs away from enemies that get too close,
+    # and otherwise goes after drops (or wanders back towards the middle of the map)
+
+    FLEE_RADIUS = 40 * ZOOM_FACTOR
+
+    def poll(self):
+
+        player_pos = pygame.math.Vector2(self.level.player.rect.center)
+        mask = 0
+
+        enemies = self.level.enemy_sprites.sprites()
+        nearest_enemy = min(enemies, key=lambda enemy: player_pos.distance_to(enemy.rect.center), default=None)
+
+        if nearest_enemy is not None:
+
+            # Shoot towards it, in whichever of the 8 directions is closest
+            to_enemy = pygame.math.Vector2(nearest_enemy.rect.center) - player_pos
+            mask |= self.direction_mask(to_enemy, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN)
+
+            # Use any stored powerup when it's getting close
+            if to_enemy.magnitude() < 2 * self.FLEE_RADIUS:
+                mask |= KEY_BITS[pygame.K_SPACE]
+
+        if nearest_enemy is not None and player_pos.distance_to(nearest_enemy.rect.center) < self.FLEE_RADIUS:
+            target = player_pos - (pygame.math.Vector2(nearest_enemy.rect.center) - player_pos)
+        else:
+            drops = self.level.coin_sprites.sprites() + self.level.powerup_sprites.sprites()
+            nearest_drop = min(drops, key=lambda drop: player_pos.distance_to(drop.rect.center), default=None)
+            target = pygame.math.Vector2(nearest_drop.rect.center if nearest_drop is not None else (GAME_WIDTH / 2, GAME_HEIGHT / 2))
+
+        # Move towards the target, with a little jitter so we don't get stuck against the same wall forever
+        to_target = target - player_pos
+        if self.random.random() < 0.1:
+            to_target = to_target.rotate(self.random.uniform(-90, 90))
+        mask |= self.direction_mask(to_target, pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s, dead_zone=4 * ZOOM_FACTOR)
+
+        self.keys.mask = mask
+
+    @staticmethod
+    def direction_mask(vector, left, right, up, down, dead_zone=0):
+        # The keys to press to go in (roughly) the direction of the vector, allowing diagonals
+
+        mask = 0
+        if abs(vector.x) > max(dead_zone, abs(vector.y) / 2):
+            mask |= KEY_BITS[right] if vector.x > 0 else KEY_BITS[left]
+        if abs(vector.y) > max(dead_zone, abs(vector.x) / 2):
+            mask |= KEY_BITS[down] if vector.y > 0 else KEY_BITS[up]
+        return mask
+
+
+AGENTS = {'random': RandomAgent, 'scripted': ScriptedAgent, 'autopilot': Autopilot}
+
+
+# Each process creates its own headless game, just to load the assets, audio & font once
+worker_game = None
+
+
+def headless_game():
+
+    global worker_game
+
+    if worker_game is None:
+        from main import Game
+        worker_game = Game()
+        worker_game.game_data.volume = 0
+        worker_game.update_volume()
+
+    return worker_game
+
+
+def init_worker():
+
+    headless_game()
+
+
+def build_level(level_index, overrides, game_data, input_provider, clock=None, display_surface=None,
+                transition_to_next_level=None, transition_to_restart=None):
+    # Build a level outside of a game, with the swept parameters in `overrides` applied to its data
+    # Each level should have its own clock (one is created if not given), so that many can be run side by side
+    # Unless functions are given for when the player leaves the level or the game is over, nothing happens then,
+    # and it's up to the caller to check for those
+
+    game = headless_game()
+    level_data = apply_overrides(LEVEL_DATA[level_index], overrides)
+
+    return level_class(level_data)(
+        level_data, game_data, game.audio, game.assets, game.font,
+        transition_to_next_level if transition_to_next_level is not None else lambda: None,
+        transition_to_restart if transition_to_restart is not None else lambda: None,
+        input_provider, display_surface=display_surface, clock=clock if clock is not None else GameClock()
+    )
+
+
+def run_episode(episode):
+    # Play one level until it's cleared, the game is over, or we run out of time, and return what happened
+
+    level_index, overrides, agent_name, seed, lives, easy_mode, max_seconds, heatmap_cells = episode
+
+    # The level is stepped on its own clock, with a fixed time step, so each episode is reproducible from its seed
+    game_data = GameData(old_easy_mode=easy_mode, old_volume=0, random_streams=RandomStreams(seed))
+    game_data.lives = lives
+    game_data.current_level = level_index
+
+    # Heatmaps (with `heatmap_cells` cells per tile, if any) are sent back with the results, to be added together
+    heatmaps = HeatmapRecorder(heatmap_cells) if heatmap_cells else None
+    if heatmaps is not None:
+        heatmaps.start()
+
+    agent = AGENTS[agent_name](seed)
+    level = build_level(level_index, overrides, game_data, agent)
+    agent.attach(level)
+
+    dt = 1 / TICKS_PER_SECOND
+    ticks = 0
+    try:
+        with powerup_drop_rates(overrides.get('drop_rate', 1)):
+            for _ in range(int(max_seconds * TICKS_PER_SECOND)):
+                agent.poll()
+                level.step(dt)
+                ticks += 1
+                if heatmaps is not None:
+                    heatmaps.add_tick(level)
+                if level.level_completed or level.game_over:
+                    break
+    finally:
+        if heatmaps is not None:
+            heatmaps.stop()
+
+    return {
+        'cleared': level.level_completed,
+        'deaths': game_data.deaths,
+        'coins': game_data.coins,
+        'seconds': ticks * dt,
+        'heatmaps': list(heatmaps.heatmaps.values()) if heatmaps is not None else []
+    }
+
+
+def summarise(results):
+
+    cleared = [result for result in results if result['cleared']]
+    return {
+        'runs': len(results),
+        'clear_rate': len(cleared) / len(results),
+        'deaths': sum(result['deaths'] for result in results) / len(results),
+        'coins': sum(result['coins'] for result in results) / len(results),
+        'time_to_clear': sum(result['seconds'] for result in cleared) / len(cleared) if cleared else math.nan
+    }
+
+
+def format_overrides(overrides):
+
+    if not overrides:
+        return '(defaults)'
+    return ' '.join(
+        '%s=%s' % (name, '/'.join('%g' % p for p in value) if isinstance(value, list) else '%g' % value)
+        for name, value in overrides.items()
+    )
+
+
+def print_table(rows, file=sys.stdout):
+
+    print('%5s | %-40s | %5s | %6s | %6s | %6s | %8s' % ('level', 'parameters', 'runs', 'clear', 'deaths', 'coins', 'clear s'), file=file)
+    print('-' * 95, file=file)
+    for level_index, overrides, summary in rows:
+        print('%5d | %-40s | %5d | %5.0f%% | %6.2f | %6.1f | %8.1f' % (
+            level_index, format_overrides(overrides), summary['runs'], summary['clear_rate'] * 100,
+            summary['deaths'], summary['coins'], summary['time_to_clear']
+        ), file=file)
+
+
+def parse_sweep(sweeps):
+    # ['spawn_rate=0.8,1,1.2', 'duration=30000,40000'] -> every combination of the values, as a list of dicts
+
+    parameters = []
+    for sweep in sweeps:
+        name, _, values = sweep.partition('=')
+        if name not in SWEEP_PARAMETERS or not values:
+            raise ValueError('can\'t sweep %r, expected NAME=V1,V2,... with NAME one of %s' % (sweep, ', '.join(SWEEP_PARAMETERS)))
+        parameters.append([(name, SWEEP_PARAMETERS[name][0](value)) for value in values.split(',')])
+
+    return [dict(combination) for combination in itertools.product(*parameters)]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Play levels headless many times over, across all cores, to see how hard they are',
+        epilog='Parameters that can be swept: ' + '; '.join('%s: %s' % (name, help) for name, (_, help) in SWEEP_PARAMETERS.items())
+    )
+    parser.add_argument('--levels', type=int, nargs='+', default=[0], help='indexes into LEVEL_DATA (normal & boss levels)')
+    parser.add_argument('--runs', type=int, default=20, help='playthroughs of each level for each combination of parameters')
+    parser.add_argument('--agent', choices=AGENTS, default='scripted')
+    parser.add_argument('--sweep', action='append', default=[], metavar='NAME=V1,V2,...', help='values of a parameter to try (can repeat)')
+    parser.add_argument('--lives', type=int, default=2, help='extra lives at the start of each playthrough')
+    parser.add_argument('--hard', action='store_true', help='play in hard mode rather than easy mode')
+    parser.add_argument('--max-seconds', type=float, default=180, help='give up on a playthrough after this much game time')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first playthrough (the rest use the ones after)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--heatmaps', metavar='DIR', help='save heatmaps of every level played (all runs added together) to DIR')
+    parser.add_argument('--heatmap-cells', type=int, default=1, help='heatmap cells per tile, in each direction')
+    args = parser.parse_args()
+
+    for level_index in args.levels:
+        if level_index not in LEVEL_DATA or LEVEL_DATA[level_index]['level_type'] == 'shop':
+            parser.error('level %d is not a normal or boss level' % level_index)
+    try:
+        combinations = parse_sweep(args.sweep)
+    except ValueError as error:
+        parser.error(str(error))
+
+    episodes = [
+        (level_index, overrides, args.agent, args.seed + run, args.lives, not args.hard, args.max_seconds,
+         args.heatmap_cells if args.heatmaps is not None else 0)
+        for level_index in args.levels
+        for overrides in combinations
+        for run in range(args.runs)
+    ]
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+        results = list(executor.map(run_episode, episodes, chunksize=max(1, len(episodes) // (4 * args.workers))))
+
+    rows = []
+    for index in range(0, len(episodes), args.runs):
+        level_index, overrides = episodes[index][:2]
+        rows.append((level_index, overrides, summarise(results[index:index + args.runs])))
+
+    print_table(rows)
+
+    if args.heatmaps is not None:
+        heatmaps = HeatmapRecorder(args.heatmap_cells)
+        for result in results:
+            heatmaps.merge(result['heatmaps'])
+        heatmaps.save(args.heatmaps)
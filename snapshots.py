@@ -0,0 +1,72 @@
+import zlib
+import struct
+import collections
+from settings import *
+
+
+# A checkpoint file is a level's snapshot (see `BaseLevel.snapshot`) compressed, with a header saying which level
+# it's for and at what tick. Snapshots are made with `marshal`, so a checkpoint can only be loaded by the same
+# version of Python that saved it
+MAGIC = b'PKCP'
+VERSION = 2
+HEADER = struct.Struct('<4sBBI')  # magic, version, level index, tick
+
+
+class SnapshotBuffer:
+    # Keeps the snapshots of the last `seconds` of a level, taking one every `interval` ticks,
+    # so we can rewind the level by up to that many seconds (e.g. to retry from just before dying)
+    # Once full, each new snapshot replaces the oldest
+
+    def __init__(self, seconds=10, interval=TICKS_PER_SECOND // 4):
+
+        self.interval = interval
+        self.snapshots = collections.deque(maxlen=(seconds * TICKS_PER_SECOND) // interval)  # (tick, snapshot)
+
+    def __len__(self):
+
+        return len(self.snapshots)
+
+    def clear(self):
+
+        self.snapshots.clear()
+
+    def record(self, level, tick):
+        # Call once per tick, after the level has been stepped
+
+        if tick % self.interval == 0:
+            self.snapshots.append((tick, level.snapshot()))
+
+    def rewind(self, level, seconds):
+        # Restore the latest snapshot at least `seconds` before the newest one, dropping those after it
+        # Returns the tick of the snapshot restored, or None if the buffer is empty
+
+        if not self.snapshots:
+            return None
+
+        target_tick = self.snapshots[-1][0] - (seconds * TICKS_PER_SECOND)
+        while len(self.snapshots) > 1 and self.snapshots[-1][0] > target_tick:
+            self.snapshots.pop()
+
+        tick, snapshot = self.snapshots[-1]
+        level.restore(snapshot)
+        return tick
+
+
+def save_checkpoint(path, level, level_index, tick):
+
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, level_index, tick))
+        file.write(zlib.compress(level.snapshot()))
+
+
+def load_checkpoint(path):
+    # Returns (level index, tick, snapshot); restore the snapshot into a level built for that index
+
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, version, level_index, tick = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('%s is not a checkpoint this version of the game can load' % path)
+
+    return level_index, tick, zlib.decompress(data[HEADER.size:])
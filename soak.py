@@ -0,0 +1,183 @@
+import os
+import gc
+import sys
+import time
+import argparse
+import faulthandler
+import tracemalloc
+
+# Soak tests run headless, so must be set before pygame is imported (including by the game's modules)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from settings import *
+from util import Timer, RandomStreams
+from game_data import GameData, LEVEL_DATA
+from base_level import BaseLevel
+from sprites import Bullet, Drop
+from particles import ParticleEffect
+from autopilot import Autopilot
+from simulate import build_level, headless_game
+
+
+# Plays the same levels over and over (headless, played by the autopilot), to find memory that's never given back,
+# e.g. sprites or timers kept alive by a callback (a bound method) that outlives its level
+#
+# Each cycle plays every level once (until the players leave it, the game is over, or a time limit in game time), with
+# the same seeds every cycle, so every cycle should end up with exactly the same objects alive. At the end of each
+# level, we collect garbage, then take a tracemalloc snapshot and count the live objects of the kinds most likely to
+# leak. Once the first few (warm up) cycles have filled any caches, each level's counts must never go above what they
+# were at the end of it in the first cycle after warming up, and the memory allocated can't grow by more than a small
+# allowance. Otherwise the soak test fails, showing where the memory went
+#
+# A level that takes too long in real time (e.g. the autopilot is stuck in a loop) fails the soak test too. If a single
+# tick never returns, faulthandler stops the process once it's taken twice that long, showing where it was stuck
+
+# The kinds of object counted, by name. Subclasses count as their base (e.g. a Coin is a Drop)
+TRACKED_TYPES = {
+    'BaseLevel': BaseLevel,
+    'Bullet': Bullet,
+    'Drop': Drop,
+    'ParticleEffect': ParticleEffect,
+    'Timer': Timer,
+    'Surface': pygame.Surface
+}
+
+
+def count_live_objects():
+    # Count the live objects of each tracked type (after collecting garbage)
+    # Surfaces aren't tracked by the garbage collector, so they're found through the tracked objects that refer to them
+
+    gc.collect()
+
+    counts = {name: 0 for name in TRACKED_TYPES}
+    python_types = [(name, kind) for name, kind in TRACKED_TYPES.items() if kind is not pygame.Surface]
+    surface_ids = set()
+
+    for obj in gc.get_objects():
+        for name, kind in python_types:
+            if isinstance(obj, kind):
+                counts[name] += 1
+        for referent in gc.get_referents(obj):
+            if isinstance(referent, pygame.Surface):
+                surface_ids.add(id(referent))
+
+    counts['Surface'] = len(surface_ids)
+    return counts
+
+
+def play_level(level_index, seed, agent, max_seconds, max_wall_seconds):
+    # Returns how the level ended ('left', 'game over' or 'out of time'), or None if it took over `max_wall_seconds`
+
+    game_data = GameData(old_easy_mode=True, old_volume=0, random_streams=RandomStreams(seed))
+    game_data.lives = 99  # So the game is rarely over part way through
+    game_data.current_level = level_index
+
+    left = []
+    level = build_level(level_index, {}, game_data, agent, transition_to_next_level=lambda: left.append(True))
+    agent.attach(level)
+
+    faulthandler.dump_traceback_later(2 * max_wall_seconds, exit=True)
+    deadline = time.perf_counter() + max_wall_seconds
+    outcome = 'out of time'
+
+    dt = 1 / TICKS_PER_SECOND
+    for _ in range(int(max_seconds * TICKS_PER_SECOND)):
+        agent.poll()
+        level.step(dt)
+        if left or level.game_over:
+            outcome = 'left' if left else 'game over'
+            break
+        if time.perf_counter() > deadline:
+            outcome = None
+            break
+
+    faulthandler.cancel_dump_traceback_later()
+
+    # Nothing of the level should be left once the agent lets go of it
+    agent.attach(None)
+    return outcome
+
+
+def soak(levels, cycles, warmup_cycles, seed, max_seconds, max_wall_seconds, memory_allowance, traceback_frames=1, file=sys.stdout):
+    # Returns a list of failures (empty if the soak test passed)
+    # Each frame tracemalloc keeps of where memory was allocated slows the game down a lot, so by default it's only one
+
+    headless_game()  # Load the assets etc. before we start measuring
+    tracemalloc.start(traceback_frames)
+
+    baselines = {}  # Level index -> (counts, tracemalloc snapshot) at the end of it, in the first measured cycle
+    failures = []
+
+    for cycle in range(cycles):
+        for level_index in levels:
+
+            # Every cycle plays each level with the same seeds, so should end up in the same place
+            outcome = play_level(level_index, seed + level_index, Autopilot(seed + level_index), max_seconds, max_wall_seconds)
+            if outcome is None:
+                # Levels after it wouldn't be comparable with their baselines, so there's no point going on
+                failures.append('cycle %d, level %d: still playing after %g s of real time' % (cycle, level_index, max_wall_seconds))
+                tracemalloc.stop()
+                return failures
+
+            counts = count_live_objects()
+            # Snapshots (including the baselines we keep) are allocated by tracemalloc itself, so aren't counted
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            memory = sum(stat.size for stat in snapshot.statistics('filename'))
+
+            print('cycle %d, level %d (%s): %.1f KiB allocated, %s' % (
+                cycle, level_index, outcome, memory / 1024, ', '.join('%s %d' % count for count in counts.items())
+            ), file=file)
+
+            if cycle < warmup_cycles:
+                continue
+            if level_index not in baselines:
+                baselines[level_index] = (counts, snapshot, memory)
+                continue
+
+            baseline_counts, baseline_snapshot, baseline_memory = baselines[level_index]
+            for name, count in counts.items():
+                if count > baseline_counts[name]:
+                    failures.append('cycle %d, level %d: %d %s objects alive, up from %d' % (
+                        cycle, level_index, count, name, baseline_counts[name]
+                    ))
+
+            if memory - baseline_memory > memory_allowance:
+                failures.append('cycle %d, level %d: %.1f KiB more allocated than in cycle %d' % (
+                    cycle, level_index, (memory - baseline_memory) / 1024, warmup_cycles
+                ))
+                for stat in snapshot.compare_to(baseline_snapshot, 'traceback')[:5]:
+                    failures.append('  %+.1f KiB (%+d blocks) allocated at:\n    %s' % (
+                        stat.size_diff / 1024, stat.count_diff, '\n    '.join(stat.traceback.format()[-4:])
+                    ))
+
+    tracemalloc.stop()
+    return failures
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Play levels over and over, failing if memory or live objects grow')
+    parser.add_argument('--levels', type=int, nargs='+', default=sorted(LEVEL_DATA), help='LEVEL_DATA indexes to play each cycle')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--warmup-cycles', type=int, default=1, help='cycles played before measuring, to fill any caches')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-seconds', type=float, default=120, help='game seconds to play a level for, if not left sooner')
+    parser.add_argument('--max-wall-seconds', type=float, default=120, help='real seconds a level can take before the soak test fails')
+    parser.add_argument('--memory-allowance-kib', type=float, default=64, help='how much memory can grow by without failing')
+    parser.add_argument('--traceback-frames', type=int, default=1, help='frames of where memory was allocated to show')
+    args = parser.parse_args()
+
+    if args.cycles <= args.warmup_cycles + 1:
+        parser.error('need at least two cycles after warming up to compare')
+
+    failures = soak(args.levels, args.cycles, args.warmup_cycles, args.seed, args.max_seconds, args.max_wall_seconds,
+                    args.memory_allowance_kib * 1024, args.traceback_frames)
+
+    for failure in failures:
+        print('FAIL: %s' % failure)
+    if failures:
+        sys.exit(1)
+
+    print('OK: live objects & memory stayed level over %d cycles' % args.cycles)
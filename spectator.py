@@ -0,0 +1,563 @@
+import socket
+import struct
+import argparse
+import pygame
+from settings import *
+from cameras import Camera
+from sprites import Coin, Powerup
+from enemies import Enemy, Spikeball
+from particles import ParticleEffect
+from instruments import Instrument
+
+
+# Streams a game to spectators as the state of its sprites, rather than as frames, over a local TCP socket
+# Each tick is a few bytes of HUD values, then the sprites that changed since the last tick (a delta), or every sprite
+# (a keyframe). Keyframes are sent every so often, to viewers that just joined, and to viewers that fell behind
+# A viewer builds the same level itself, so it has the same images, and draws the sprites with the level's own camera
+# & UI. Sprites' images are sent as an index into a list of every image the level can use, which the game and the
+# viewer each make in the same order from the assets & level (see `image_registry`)
+#
+# Messages are framed with a 4 byte length, then a 1 byte type:
+#  - LEVEL: a new level has started (its index & how many images it has), and a keyframe follows
+#  - KEYFRAME: tick, HUD, number of sprites, then each sprite's id & fields
+#  - DELTA: tick, HUD, number of sprites removed & their ids, number of sprites added or changed, then for each its
+#    id, a bitmask of the fields that changed, and just those fields
+#
+# A viewer that isn't reading fast enough has its unsent ticks dropped, and is sent a keyframe to catch up from
+
+LENGTH = struct.Struct('<I')
+LEVEL, KEYFRAME, DELTA = b'L', b'K', b'D'
+LEVEL_MESSAGE = struct.Struct('<bH')  # level, number of images
+TICK = struct.Struct('<I')
+HUD = struct.Struct('<bHBbbbBBBH')  # lives, coins, stored powerup, boots, gun & ammo upgrades, level time left (/255), boss health left (/255), flags, player's sprite id
+COUNT = struct.Struct('<H')
+SPRITE_ID = struct.Struct('<H')
+SPRITE = struct.Struct('<HHhhBB')   # id, then the fields below
+CHANGED = struct.Struct('<HB')      # id, bitmask of fields
+
+# A sprite's fields (image index, top left position, z layer, flags), with the bit for each in a delta
+FIELDS = [('image', struct.Struct('<H')), ('x', struct.Struct('<h')), ('y', struct.Struct('<h')), ('z', struct.Struct('<B')), ('flags', struct.Struct('<B'))]
+ALL_FIELDS = (1 << len(FIELDS)) - 1
+
+# Sprite flags
+VISIBLE, ENEMY = 1, 2
+
+# HUD flags
+HAS_LEVEL_TIMER, HAS_BOSS, LIGHTENING, SMOKE_BOMB, LEVEL_COMPLETED, GAME_OVER = (1 << bit for bit in range(6))
+NO_POWERUP = 255
+
+UPGRADE_TYPES = ['boots', 'gun', 'ammo']
+WRITE_BUFFER_LIMIT = 256 * 1024
+
+
+def encode_message(message_type, payload=b''):
+
+    return LENGTH.pack(len(message_type) + len(payload)) + message_type + payload
+
+
+def image_registry(level):
+    # Every image the level's sprites can be drawn with, in an order that's the same for any level built from the same
+    # level data: the assets, then the player's animations, then the images of the sprites the level was built with
+
+    images = []
+    seen = set()
+
+    def add(value):
+        if isinstance(value, pygame.Surface):
+            if id(value) not in seen:
+                seen.add(id(value))
+                images.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                add(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                add(item)
+
+    add(level.assets)
+    add(level.player.animations)
+    for sprite in level.build_order:
+        add(sprite.image)
+
+    return images
+
+
+def encode_hud(level, player_id, powerup_names):
+
+    game_data = level.game_data
+    level_timer = level.level_timer_group.sprite
+    boss = level.boss_group.sprite
+
+    flags = 0
+    flags |= HAS_LEVEL_TIMER if level_timer is not None else 0
+    flags |= HAS_BOSS if boss is not None else 0
+    flags |= LIGHTENING if level.lightening_timer.active else 0
+    flags |= SMOKE_BOMB if level.smoke_bomb_timer.active else 0
+    flags |= LEVEL_COMPLETED if level.level_completed else 0
+    flags |= GAME_OVER if level.game_over else 0
+
+    return HUD.pack(
+        game_data.lives, game_data.coins,
+        NO_POWERUP if game_data.stored_powerup is None else powerup_names.index(game_data.stored_powerup),
+        *(game_data.upgrades[upgrade_type] for upgrade_type in UPGRADE_TYPES),
+        int(255 * level_timer.level_timer.percent_left()) if level_timer is not None else 0,
+        int(255 * boss.percent_health_left()) if boss is not None else 0,
+        flags, player_id
+    )
+
+
+def encode_sprite_fields(mask, fields):
+
+    return b''.join(struct_.pack(fields[index]) for index, (_, struct_) in enumerate(FIELDS) if mask & (1 << index))
+
+
+class Viewer:
+    # A connected spectator, and the messages not yet sent to it
+
+    def __init__(self, connection, address):
+
+        self.connection = connection
+        self.address = address
+        self.pending = []            # Messages, the first of which may be partly sent
+        self.sent = 0                # How much of the first pending message has been sent
+        self.needs_level = True      # Send the level & a keyframe for the next tick
+        self.needs_keyframe = False  # Send a keyframe rather than a delta for the next tick
+
+    def buffered(self):
+
+        return sum(len(message) for message in self.pending) - self.sent
+
+    def queue(self, message):
+
+        self.pending.append(message)
+
+    def drop_unsent(self):
+        # Drop whole messages only, so the stream stays framed. A dropped level message has to be sent again (the caller
+        # sends a keyframe after dropping anything, as the viewer's missed ticks)
+
+        kept = 1 if self.sent else 0
+        if any(message[LENGTH.size:LENGTH.size + 1] == LEVEL for message in self.pending[kept:]):
+            self.needs_level = True
+        self.pending = self.pending[:kept]
+
+    def flush(self):
+        # Returns False once the viewer has gone
+
+        while self.pending:
+            try:
+                sent = self.connection.send(memoryview(self.pending[0])[self.sent:])
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
+
+            self.sent += sent
+            if self.sent < len(self.pending[0]):
+                return True
+            self.pending.pop(0)
+            self.sent = 0
+
+        return True
+
+
+class SpectatorBroadcaster(Instrument):
+    # Listens for spectators on a localhost port, and sends them the level's state each time `broadcast` is called
+    # (once a tick, after the game has stepped). Sockets are non-blocking, so a slow viewer never holds up the game
+    # As one of the game's instruments, it broadcasts every tick the game steps by
+
+    def __init__(self, port, host='127.0.0.1', keyframe_seconds=2):
+
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        self.keyframe_ticks = max(1, int(keyframe_seconds * TICKS_PER_SECOND))
+
+        self.viewers = []
+
+        # The level being streamed
+        self.level = None
+        self.level_message = b''
+        self.image_indexes = {}
+        self.powerup_names = []
+        self.sprite_ids = {}    # sprite -> id, for the sprites sent so far
+        self.next_sprite_id = 0
+        self.sprites = {}       # id -> fields, as of the last tick sent
+        self.tick = 0
+
+        # Accounting
+        self.bytes_sent = 0
+        self.ticks_sent = 0
+        self.keyframes_sent = 0
+
+    def close(self):
+
+        for viewer in self.viewers:
+            viewer.connection.close()
+        self.viewers = []
+        self.listener.close()
+
+    def accept_viewers(self):
+
+        while True:
+            try:
+                connection, address = self.listener.accept()
+            except BlockingIOError:
+                return
+            connection.setblocking(False)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.viewers.append(Viewer(connection, address))
+
+    def start_level(self, level):
+
+        self.level = level
+        images = image_registry(level)
+        self.image_indexes = {id(image): index for index, image in enumerate(images)}
+        self.powerup_names = list(level.assets['powerup_drops'])
+        self.level_message = encode_message(LEVEL, LEVEL_MESSAGE.pack(level.game_data.current_level, len(images)))
+        self.sprite_ids = {}
+        self.next_sprite_id = 0
+        self.sprites = {}
+
+        for viewer in self.viewers:
+            viewer.needs_level = True
+
+    def image_index(self, sprite):
+        # Particle effects & drops draw copies of their images (so they can fade them), so use the images copied
+
+        index = self.image_indexes.get(id(sprite.image))
+        if index is not None:
+            return index
+
+        if isinstance(sprite, ParticleEffect):
+            image = sprite.source_frames[min(int(sprite.frame_index), len(sprite.source_frames) - 1)]
+        elif isinstance(sprite, Coin):
+            image = self.level.assets['coin_drops']['one' if sprite.value == 1 else 'five']
+        elif isinstance(sprite, Powerup):
+            image = self.level.assets['powerup_drops'][sprite.powerup_name]
+        else:
+            return None
+        return self.image_indexes.get(id(image))
+
+    def read_sprites(self):
+        # Returns id -> fields for every sprite the camera would draw (that has an image viewers can draw)
+
+        sprites = {}
+        sprite_ids = {}
+        for sprite in self.level.all_sprites.sprites():
+
+            image_index = self.image_index(sprite)
+            if image_index is None:
+                continue
+
+            sprite_id = self.sprite_ids.get(sprite)
+            if sprite_id is None:
+                # Ids wrap around in a long level, so skip any still used by a sprite sent last tick
+                while self.next_sprite_id in self.sprites:
+                    self.next_sprite_id = (self.next_sprite_id + 1) % 0x10000
+                sprite_id = self.next_sprite_id
+                self.next_sprite_id = (self.next_sprite_id + 1) % 0x10000
+            sprite_ids[sprite] = sprite_id
+
+            alpha = sprite.image.get_alpha()
+            flags = VISIBLE if alpha is None or alpha > 0 else 0
+            flags |= ENEMY if isinstance(sprite, (Enemy, Spikeball)) else 0
+            sprites[sprite_id] = (image_index, sprite.rect.left, sprite.rect.top, sprite.z, flags)
+
+        self.sprite_ids = sprite_ids
+        return sprites
+
+    def encode_keyframe(self, hud, sprites):
+
+        records = [SPRITE.pack(sprite_id, *fields) for sprite_id, fields in sprites.items()]
+        return encode_message(KEYFRAME, TICK.pack(self.tick) + hud + COUNT.pack(len(records)) + b''.join(records))
+
+    def encode_delta(self, hud, sprites):
+
+        removed = [SPRITE_ID.pack(sprite_id) for sprite_id in self.sprites if sprite_id not in sprites]
+
+        changed = []
+        for sprite_id, fields in sprites.items():
+            old_fields = self.sprites.get(sprite_id)
+            if old_fields is None:
+                mask = ALL_FIELDS
+            else:
+                mask = 0
+                for index in range(len(FIELDS)):
+                    if fields[index] != old_fields[index]:
+                        mask |= 1 << index
+                if not mask:
+                    continue
+            changed.append(CHANGED.pack(sprite_id, mask) + encode_sprite_fields(mask, fields))
+
+        return encode_message(DELTA, b''.join([
+            TICK.pack(self.tick), hud, COUNT.pack(len(removed)), *removed, COUNT.pack(len(changed)), *changed
+        ]))
+
+    def broadcast(self, level):
+        # `level` is None when not in a level (e.g. on the intro screen), when viewers are just kept waiting
+
+        self.accept_viewers()
+
+        if level is not None:
+
+            if level is not self.level:
+                self.start_level(level)
+
+            sprites = self.read_sprites()
+            hud = encode_hud(level, self.sprite_ids.get(level.player, 0), self.powerup_names)
+
+            keyframe = None
+            if self.tick % self.keyframe_ticks == 0:
+                keyframe = self.encode_keyframe(hud, sprites)
+            delta = self.encode_delta(hud, sprites) if keyframe is None else None
+
+            for viewer in self.viewers:
+
+                # Drop what a slow viewer hasn't read yet, and catch it up with a keyframe instead
+                if viewer.buffered() > WRITE_BUFFER_LIMIT:
+                    viewer.drop_unsent()
+                    viewer.needs_keyframe = True
+
+                if viewer.needs_level or viewer.needs_keyframe or keyframe is not None:
+                    if keyframe is None:
+                        keyframe = self.encode_keyframe(hud, sprites)
+                    if viewer.needs_level:
+                        viewer.queue(self.level_message)
+                        viewer.needs_level = False
+                    viewer.needs_keyframe = False
+                    viewer.queue(keyframe)
+                    self.bytes_sent += len(keyframe)
+                    self.keyframes_sent += 1
+                else:
+                    viewer.queue(delta)
+                    self.bytes_sent += len(delta)
+
+            self.sprites = sprites
+            self.tick += 1
+            self.ticks_sent += len(self.viewers)
+
+        for viewer in list(self.viewers):
+            if not viewer.flush():
+                viewer.connection.close()
+                self.viewers.remove(viewer)
+
+    def tick_ended(self, game, level):
+
+        self.broadcast(level)
+
+    def stats(self):
+
+        return '%d viewers, %.0f bytes per tick sent (vs %d for a frame), %d keyframes' % (
+            len(self.viewers), self.bytes_sent / max(1, self.ticks_sent), SCREEN_WIDTH * SCREEN_HEIGHT * 3, self.keyframes_sent
+        )
+
+
+class SpriteView(pygame.sprite.Sprite):
+    # A sprite as a viewer knows it, for the level's camera to draw
+
+    def __init__(self):
+
+        super().__init__()
+        self.fields = [0] * len(FIELDS)
+        self.image = None
+        self.rect = None
+        self.z = 0
+
+    def apply(self, mask, payload, offset, images):
+        # Reads the fields in `mask` from `payload` at `offset`, and returns the offset after them
+
+        for index, (_, struct_) in enumerate(FIELDS):
+            if mask & (1 << index):
+                self.fields[index], = struct_.unpack_from(payload, offset)
+                offset += struct_.size
+
+        image_index, x, y, self.z, _ = self.fields
+        self.image = images[image_index]
+        self.rect = self.image.get_rect(topleft=(x, y))
+        return offset
+
+    def has_flag(self, flag):
+
+        return self.fields[-1] & flag != 0
+
+
+class SpectatorCamera(Camera):
+    # The level's camera, drawing the sprites received
+
+    def question_marked_sprites(self):
+
+        return filter(lambda s: s.has_flag(ENEMY), self.sprites())
+
+
+class SpectatorView:
+    # Builds each level the stream is of, and draws it from the sprites & HUD values received
+
+    def __init__(self, game):
+
+        self.game = game
+        self.level = None
+        self.camera = None
+        self.images = []
+        self.powerup_names = list(game.assets['powerup_drops'])
+        self.sprites = {}
+        self.hud = None
+        self.tick = None
+
+    def start_level(self, payload):
+
+        from util import GameClock
+        from controls import InputProvider
+        from game_data import GameData, LEVEL_DATA, level_class
+
+        level_index, image_count = LEVEL_MESSAGE.unpack(payload)
+        game = self.game
+        game_data = GameData()
+        game_data.current_level = level_index
+        level_data = LEVEL_DATA[level_index]
+
+        self.level = level_class(level_data)(
+            level_data, game_data, game.audio, game.assets, game.font, lambda: None, lambda: None, InputProvider(),
+            game.display_surface, GameClock()
+        )
+        self.camera = SpectatorCamera(level_data['bg'], game.assets, game.display_surface)
+        self.images = image_registry(self.level)
+        if len(self.images) != image_count:
+            raise ValueError('level %d has %d images, but the game streaming it has %d' % (level_index, len(self.images), image_count))
+
+        self.sprites = {}
+
+    def apply_keyframe(self, payload):
+
+        offset = self.read_hud(payload)
+        count, = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+
+        self.sprites = {}
+        for _ in range(count):
+            sprite_id, = SPRITE_ID.unpack_from(payload, offset)
+            sprite = self.sprites[sprite_id] = SpriteView()
+            offset = sprite.apply(ALL_FIELDS, payload, offset + SPRITE_ID.size, self.images)
+
+    def apply_delta(self, payload):
+
+        offset = self.read_hud(payload)
+
+        removed, = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        for _ in range(removed):
+            sprite_id, = SPRITE_ID.unpack_from(payload, offset)
+            offset += SPRITE_ID.size
+            self.sprites.pop(sprite_id, None)
+
+        changed, = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        for _ in range(changed):
+            sprite_id, mask = CHANGED.unpack_from(payload, offset)
+            sprite = self.sprites.get(sprite_id)
+            if sprite is None:
+                sprite = self.sprites[sprite_id] = SpriteView()
+            offset = sprite.apply(mask, payload, offset + CHANGED.size, self.images)
+
+    def read_hud(self, payload):
+
+        self.tick, = TICK.unpack_from(payload)
+        self.hud = HUD.unpack_from(payload, TICK.size)
+        return TICK.size + HUD.size
+
+    def handle_message(self, message_type, payload):
+
+        if message_type == LEVEL:
+            self.start_level(payload)
+        elif message_type == KEYFRAME:
+            self.apply_keyframe(payload)
+        elif message_type == DELTA:
+            self.apply_delta(payload)
+
+    def draw(self):
+
+        if self.level is None or self.hud is None:
+            return
+
+        level = self.level
+        lives, coins, stored_powerup, *upgrades, level_time_left, boss_health_left, flags, player_id = self.hud
+
+        # The HUD values go into the level's own game data, level timer & boss, for its UI to draw
+        level.clock.activate()
+        level.game_data.lives = lives
+        level.game_data.coins = coins
+        level.game_data.stored_powerup = None if stored_powerup == NO_POWERUP else self.powerup_names[stored_powerup]
+        level.game_data.upgrades = dict(zip(UPGRADE_TYPES, upgrades))
+
+        level_timer = level.level_timer_group.sprite
+        if level_timer is not None:
+            # Paused with the time left that was sent
+            level_timer.delay_timer.set_state((level_timer.delay_timer.duration, False, None, None))
+            level_timer.level_timer.set_state((255, flags & HAS_LEVEL_TIMER != 0, 0, 255 - level_time_left))
+            level_timer.update()
+
+        if flags & HAS_BOSS and level.boss_group.sprite is not None:
+            boss = level.boss_group.sprite
+            boss.current_health = boss.full_health * boss_health_left / 255
+        elif not flags & HAS_BOSS:
+            level.boss_group.empty()
+
+        self.camera.empty()
+        self.camera.add(sprite for sprite in self.sprites.values() if sprite.has_flag(VISIBLE))
+
+        self.game.display_surface.fill('black')
+        self.camera.custom_draw(
+            flags & LIGHTENING, flags & SMOKE_BOMB, [self.sprites.get(player_id, level.player)], flags & LEVEL_COMPLETED, level.shop_group
+        )
+        if not flags & GAME_OVER:
+            level.ui.display(level.level_timer_group, level.boss_group)
+
+
+def run_viewer(host, port):
+
+    from main import Game
+
+    game = Game()
+    view = SpectatorView(game)
+
+    connection = socket.create_connection((host, port))
+    connection.setblocking(False)
+    buffer = bytearray()
+
+    while True:
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                connection.close()
+                return
+
+        # Apply everything received since the last frame, then draw the latest tick
+        try:
+            data = connection.recv(1 << 16)
+            if not data:
+                break
+            buffer += data
+        except BlockingIOError:
+            pass
+
+        while len(buffer) >= LENGTH.size:
+            length, = LENGTH.unpack_from(buffer)
+            if len(buffer) < LENGTH.size + length:
+                break
+            message = bytes(buffer[LENGTH.size:LENGTH.size + length])
+            del buffer[:LENGTH.size + length]
+            view.handle_message(message[:1], message[1:])
+
+        view.draw()
+        pygame.display.update()
+        game.clock.tick(60)
+
+    connection.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Watch a game streamed with `python main.py --spectate PORT`')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--host', default='127.0.0.1')
+    args = parser.parse_args()
+
+    run_viewer(args.host, args.port)
@@ -1,7 +1,8 @@
 import math
 import pygame
 from settings import *
-from util import Timer, import_image
+from util import Timer, import_image, get_ticks, nearest_sprite
+from gameplay_events import log_event, KILL, ENEMY_TYPE_INDEXES, KILL_CAUSE_INDEXES
 
 
 class Bullet(pygame.sprite.Sprite):
@@ -28,6 +29,15 @@ class Bullet(pygame.sprite.Sprite):
         # Audio
         self.monster_hit_sound = monster_hit_sound
 
+    def get_state(self):
+
+        return tuple(self.pos), self.rect.center
+
+    def set_state(self, state):
+
+        pos, self.rect.center = state
+        self.pos = pygame.math.Vector2(pos)
+
     def update(self, dt):
 
         # Move the bullet
@@ -43,6 +53,8 @@ class Bullet(pygame.sprite.Sprite):
         for enemy in self.enemy_sprites.sprites():
             if enemy.hitbox.colliderect(self.rect):
                 enemy.damage(self.damage)
+                if not enemy.alive() and type(enemy).__name__ in ENEMY_TYPE_INDEXES:
+                    log_event(KILL, ENEMY_TYPE_INDEXES[type(enemy).__name__], KILL_CAUSE_INDEXES['bullet'], enemy.rect.center)
                 self.monster_hit_sound.play()
                 self.kill()
                 break
@@ -56,7 +68,7 @@ class Bullet(pygame.sprite.Sprite):
 
 class Drop(pygame.sprite.Sprite):
 
-    def __init__(self, pos, surf, player, groups):
+    def __init__(self, pos, surf, players, groups):
 
         super().__init__(groups)
 
@@ -82,7 +94,7 @@ class Drop(pygame.sprite.Sprite):
         # Magnet effect that moves it towards player if within a certain radius
         self.pos = pygame.math.Vector2(self.rect.center)
         self.magnet_radius = 30 * ZOOM_FACTOR
-        self.player = player
+        self.players = players
 
         # Destructs after a certain time
         self.destruct_timer = Timer(8000, auto_start=True, func=self.kill)
@@ -95,13 +107,24 @@ class Drop(pygame.sprite.Sprite):
 
         self.collectable = True
 
+    def get_state(self):
+
+        return tuple(self.pos), self.rect.center, self.collectable, self.destruct_timer.get_state(), self.collectable_timer.get_state()
+
+    def set_state(self, state):
+
+        pos, self.rect.center, self.collectable, destruct_timer, collectable_timer = state
+        self.pos = pygame.math.Vector2(pos)
+        self.destruct_timer.set_state(destruct_timer)
+        self.collectable_timer.set_state(collectable_timer)
+
     def animate(self):
         # Flicker for last 10%
 
         percent_left = self.destruct_timer.percent_left()
 
         if percent_left <= 0.1:
-            if math.sin(pygame.time.get_ticks() * 0.05) >= 0:
+            if math.sin(get_ticks() * 0.05) >= 0:
                 self.image.set_alpha(0)
             else:
                 self.image.set_alpha(255)
@@ -109,10 +132,11 @@ class Drop(pygame.sprite.Sprite):
             self.image.set_alpha(255)
 
     def move(self, dt):
-        # If we're within a certain radius of the player, move in the player's direction
+        # If we're within a certain radius of the (nearest) player, move in the player's direction
         # at a speed relative to the gap between the two
 
-        vector_to_player = pygame.math.Vector2(self.player.rect.center) - pygame.math.Vector2(self.rect.center)
+        player = nearest_sprite(self.rect.center, self.players)
+        vector_to_player = pygame.math.Vector2(player.rect.center) - pygame.math.Vector2(self.rect.center)
 
         if 0 < vector_to_player.magnitude() < self.magnet_radius:
 
@@ -133,17 +157,17 @@ class Drop(pygame.sprite.Sprite):
 
 class Coin(Drop):
 
-    def __init__(self, pos, surf, value, player, groups):
+    def __init__(self, pos, surf, value, players, groups):
 
-        super().__init__(pos, surf, player, groups)
+        super().__init__(pos, surf, players, groups)
         self.value = value
 
 
 class Powerup(Drop):
 
-    def __init__(self, pos, surf, powerup_name, player, groups):
+    def __init__(self, pos, surf, powerup_name, players, groups):
 
-        super().__init__(pos, surf, player, groups)
+        super().__init__(pos, surf, players, groups)
         self.powerup_name = powerup_name
 
 
@@ -176,6 +200,23 @@ class LevelTimer(pygame.sprite.Sprite):
 
         return not self.level_timer.active and not self.delay_timer.active
 
+    def get_state(self):
+
+        return self.level_timer.get_state(), self.delay_timer.get_state()
+
+    def set_state(self, state):
+
+        level_timer, delay_timer = state
+        self.level_timer.set_state(level_timer)
+        self.delay_timer.set_state(delay_timer)
+
+    def reset(self):
+        # Back to the start of the level, i.e. the level timer not running and the delay timer starting again
+
+        self.level_timer.reset()
+        self.delay_timer.reset()
+        self.delay_timer.activate()
+
     def extend_level_duration(self, proportion=0.25):
         # Extend level by proportion of its duration, called when player dies
 
@@ -0,0 +1,192 @@
+import os
+import sys
+import zlib
+import array
+import marshal
+import argparse
+from instruments import Instrument
+
+
+# Hashes the whole state of the simulation every tick, to check that runs which should be the same really are (a
+# replay and the game it recorded, the two peers of a netplay game, a recording played before & after a change to the
+# code) and to find where they first differ. Positions are hashed as the exact floats they are, so a `dt` dependent
+# path (e.g. in `Enemy.move` or `Bullet.update`) that rounds differently shows up on the tick it happens
+#
+# A level's state (see `BaseLevel.get_state`) is hashed in sections, one per entity or part of it: the clock, the game
+# data, each random stream, each player, the boss, each sprite created while playing, and the rest of the level.
+# Each section's hash is a CRC-32 of its values, and the tick's hash is a CRC-32 of the sections' hashes, so that two
+# hash logs can tell which entity differs, not just on which tick
+# Random streams are most of the state by size, but rarely change between ticks, so their hashes are kept until they do
+#
+# A hash log is a text file with a line per tick: the tick, its hash (or '-' when not in a level), and with sections
+# logged, each section as name=hash. Netplay peers also send each other the hash of every tick once it's confirmed, so a
+# desync is caught as it happens (see netplay.py)
+
+NOT_IN_A_LEVEL = '-'
+
+# Values are serialized with marshal to be hashed, but with version 2, as from version 3 objects used more than once
+# are written as references, which depends on how Python happened to share them, not just on their values
+MARSHAL_VERSION = 2
+
+
+class StateHasher:
+
+    def __init__(self):
+
+        self.stream_hashes = {}  # Random stream name -> (packed state, hash), reused while the packed state is the same
+
+    def stream_hash(self, name, stream_state):
+
+        version, packed_state, gauss_next = stream_state
+        cached = self.stream_hashes.get(name)
+        if cached is None or cached[0] is not packed_state:
+            cached = self.stream_hashes[name] = (packed_state, zlib.crc32(packed_state))
+        return zlib.crc32(marshal.dumps((version, gauss_next), MARSHAL_VERSION), cached[1])
+
+    def sections(self, state):
+        # A level's state (from `BaseLevel.get_state`) as a list of (section name, hash)
+
+        clock, game_data, players, boss, dynamic_sprites, *rest = state
+        *game_values, (seed, stream_states) = game_data
+
+        sections = [('clock', value_hash(clock)), ('game_data', value_hash((game_values, seed)))]
+        for name, stream_state in stream_states.items():
+            sections.append(('random:%s' % name, self.stream_hash(name, stream_state)))
+        for index, player in enumerate(players):
+            sections.append(('player%d' % index, value_hash(player)))
+        sections.append(('boss', value_hash(boss)))
+
+        # Sprites are named by their place in the update order and what they are, e.g. 'sprite3:enemy:Orc'
+        for index, sprite_state in enumerate(dynamic_sprites):
+            kind = sprite_state[0] if sprite_state[0] not in ('enemy', 'drop', 'particle') else '%s:%s' % sprite_state[:2]
+            sections.append(('sprite%d:%s' % (index, kind), value_hash(sprite_state)))
+
+        sections.append(('level', value_hash(rest)))
+        return sections
+
+    def hash(self, state):
+
+        return combine_hashes(section_hash for _, section_hash in self.sections(state))
+
+
+def value_hash(value):
+
+    return zlib.crc32(marshal.dumps(value, MARSHAL_VERSION))
+
+
+def combine_hashes(hashes):
+
+    return zlib.crc32(array.array('I', hashes).tobytes())
+
+
+class StateHashLog(Instrument):
+    # Writes the hash of every tick to a hash log (see above), optionally with each section's hash
+    # As one of the game's instruments, it logs every tick the game steps by
+
+    def __init__(self, path, sections=False):
+
+        self.file = open(path, 'w')
+        self.with_sections = sections
+        self.hasher = StateHasher()
+        self.tick = 0
+
+    def log(self, level):
+        # Logs the next tick. `level` is None when not in a level (e.g. on the intro screen)
+
+        self.log_sections(self.tick, None if level is None else self.hasher.sections(level.get_state()))
+
+    def log_sections(self, tick, sections):
+        # Logs a tick whose sections have already been hashed (or None when not in a level)
+
+        if sections is None:
+            self.file.write('%d %s\n' % (tick, NOT_IN_A_LEVEL))
+        else:
+            line = '%d %08x' % (tick, combine_hashes(section_hash for _, section_hash in sections))
+            if self.with_sections:
+                line += ''.join(' %s=%08x' % section for section in sections)
+            self.file.write(line + '\n')
+        self.tick = tick + 1
+
+    def tick_ended(self, game, level):
+
+        self.log(level)
+
+    def close(self):
+
+        self.file.close()
+
+
+def read_hash_log(path):
+    # Returns {tick: (tick hash, {section name: hash})}
+    # Ticks aren't always consecutive, or from 0 (e.g. a netplay peer's log only has the ticks it's confirmed)
+
+    ticks = {}
+    with open(path) as file:
+        for line in file:
+            tick, tick_hash, *sections = line.split()
+            ticks[int(tick)] = (tick_hash, dict(section.split('=', 1) for section in sections))
+    return ticks
+
+
+def first_divergence(log_a, log_b):
+    # Compares the ticks both logs have, and returns None if they're the same, or (tick, the sections that differ)
+    # Sections only one log has are included, and the sections are empty if they weren't logged
+
+    for tick in sorted(log_a.keys() & log_b.keys()):
+        (hash_a, sections_a), (hash_b, sections_b) = log_a[tick], log_b[tick]
+        if hash_a != hash_b:
+            names = list(sections_a) + [name for name in sections_b if name not in sections_a]
+            return tick, [name for name in names if sections_a.get(name) != sections_b.get(name)]
+    return None
+
+
+def log_recording(recording_path, log_path, sections=False):
+    # Plays a recording headless, logging the hash of every tick. Returns the number of ticks
+
+    from main import Game
+    from replay import Recording
+
+    hash_log = StateHashLog(log_path, sections)
+    game = Game(replay=Recording.load(recording_path), instruments=[hash_log])
+    try:
+        while not game.replay_input.finished:
+            game.step(game.fixed_dt)
+    finally:
+        hash_log.close()
+    return hash_log.tick
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Log the state hash of every tick of a recording, or diff two hash logs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    log_parser = commands.add_parser('log', help='play a recording headless, logging the hash of every tick')
+    log_parser.add_argument('recording')
+    log_parser.add_argument('log')
+    log_parser.add_argument('--sections', action='store_true', help='log each section\'s hash too, to diff by entity')
+    diff_parser = commands.add_parser('diff', help='report the first tick (and entities) two hash logs differ on')
+    diff_parser.add_argument('log_a')
+    diff_parser.add_argument('log_b')
+    args = parser.parse_args()
+
+    if args.command == 'log':
+        # Logging runs headless, so must be set before pygame is imported (by the game's modules)
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        tick_count = log_recording(args.recording, args.log, args.sections)
+        print('Logged %d ticks to %s' % (tick_count, args.log), file=sys.stderr)
+
+    else:
+        log_a, log_b = read_hash_log(args.log_a), read_hash_log(args.log_b)
+        common_ticks = len(log_a.keys() & log_b.keys())
+        divergence = first_divergence(log_a, log_b)
+        if divergence is None:
+            print('Identical on all %d ticks both logged (%d and %d ticks logged)' % (common_ticks, len(log_a), len(log_b)))
+            sys.exit(0)
+
+        tick, sections = divergence
+        if sections:
+            print('First differ on tick %d, in: %s' % (tick, ', '.join(sections)))
+        else:
+            print('First differ on tick %d (log with --sections to see which entities differ)' % tick)
+        sys.exit(1)
@@ -0,0 +1,176 @@
+import json
+import array
+import struct
+import threading
+from collections import deque
+from instruments import Instrument
+
+
+# Records a compact record per frame (how long it took, the time step, how many of each kind of sprite there were,
+# which powerups were active, and which level it was in), to find performance regressions across many machines
+#
+# The game hands each record to a bounded buffer, and a background thread writes the buffer out every so often, so the
+# game never waits on the disk. If the disk falls behind and the buffer fills up, new records are dropped (and counted)
+# rather than the game blocking
+#
+# Records are written as JSON lines (an object per frame), or in a binary columnar format: a header with the field
+# names & types, then blocks of records, each a record count followed by each field's values for those records as a
+# packed array. `read_telemetry` reads either back as columns
+
+# (field name, array typecode for the columnar format), in the order of a record's values
+FIELDS = [
+    ('frame', 'I'),             # Frames since the game started
+    ('frame_ms', 'f'),          # Real time since the last frame
+    ('dt_ms', 'f'),             # Time step the game was stepped by (differs from frame_ms if fixed, e.g. replaying)
+    ('level', 'b'),             # Index in LEVEL_DATA, or -1 when not in a level
+    ('sprites', 'H'),
+    ('enemies', 'H'),
+    ('bullets', 'H'),
+    ('coins', 'H'),
+    ('powerup_drops', 'H'),
+    ('particles', 'H'),
+    ('active_powerups', 'H'),   # Bit mask, with a bit per entry in ACTIVE_POWERUPS
+    ('gc_ms', 'f')              # Time spent in garbage collection (see gcstats.py)
+]
+FIELD_NAMES = [name for name, _ in FIELDS]
+
+# The timers that are running while each powerup is in effect, on the player or the level
+PLAYER_POWERUP_TIMERS = ['coffee_timer', 'sheriff_timer', 'machine_gun_timer', 'shotgun_timer', 'wagon_wheel_timer']
+LEVEL_POWERUP_TIMERS = ['smoke_bomb_timer', 'tombstone_timer']
+ACTIVE_POWERUPS = ['coffee', 'sheriff', 'machine_gun', 'shotgun', 'wagon_wheel', 'smoke_bomb', 'tombstone']
+
+MAGIC = b'JPKT'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')   # Magic, version, length of the field spec that follows
+BLOCK = struct.Struct('<I')       # Number of records in the block
+
+
+def active_powerups(level):
+
+    mask = 0
+    for player in level.players:
+        for bit, timer_name in enumerate(PLAYER_POWERUP_TIMERS):
+            if getattr(player, timer_name).active:
+                mask |= 1 << bit
+    for bit, timer_name in enumerate(LEVEL_POWERUP_TIMERS, len(PLAYER_POWERUP_TIMERS)):
+        if getattr(level, timer_name).active:
+            mask |= 1 << bit
+    return mask
+
+
+def frame_record(frame, frame_time, dt, level_index, level, gc_ms=0):
+    # A record for a frame of `frame_time` seconds, stepped by `dt` seconds. `level` is None when not in a level
+
+    if level is None:
+        return frame, frame_time * 1000, dt * 1000, -1, 0, 0, 0, 0, 0, 0, 0, gc_ms
+
+    return (
+        frame, frame_time * 1000, dt * 1000, level_index,
+        len(level.all_sprites), len(level.enemy_sprites), len(level.bullet_sprites), len(level.coin_sprites),
+        len(level.powerup_sprites), len(level.particle_sprites), active_powerups(level), gc_ms
+    )
+
+
+class TelemetrySink(Instrument):
+    # As one of the game's instruments, it records every frame, with the time spent collecting garbage if given a
+    # GCMonitor
+
+    def __init__(self, path, format='jsonl', capacity=4096, flush_interval=0.5, gc_monitor=None):
+        # `format` is 'jsonl' or 'columnar'. `capacity` is how many records can wait to be written before they're dropped
+
+        self.format = format
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = deque()  # Appended to by the game & popped from by the writer, which deques can do across threads
+        self.recorded = 0
+        self.dropped = 0
+        self.gc_monitor = gc_monitor
+
+        self.file = open(path, 'w' if format == 'jsonl' else 'wb')
+        if format == 'columnar':
+            field_spec = ','.join('%s:%s' % field for field in FIELDS).encode()
+            self.file.write(HEADER.pack(MAGIC, VERSION, len(field_spec)) + field_spec)
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.write_loop, name='TelemetrySink', daemon=True)
+        self.thread.start()
+
+    def record(self, values):
+        # Called by the game every frame, with a record from `frame_record`. Never blocks
+
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self.buffer.append(values)
+        self.recorded += 1
+
+    def frame_ended(self, game, frame_time, dt, work_time):
+
+        gc_ms = self.gc_monitor.take_frame_ms() if self.gc_monitor is not None else 0
+        self.record(frame_record(game.frame, frame_time, dt, game.game_data.current_level, game.playing_level(), gc_ms))
+
+    def write_loop(self):
+
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+
+        records = []
+        while self.buffer:
+            records.append(self.buffer.popleft())
+        if not records:
+            return
+
+        if self.format == 'jsonl':
+            self.file.write(''.join(json.dumps(dict(zip(FIELD_NAMES, record)), separators=(',', ':')) + '\n' for record in records))
+        else:
+            self.file.write(BLOCK.pack(len(records)))
+            for index, (_, typecode) in enumerate(FIELDS):
+                self.file.write(array.array(typecode, [record[index] for record in records]).tobytes())
+        self.file.flush()
+
+    def close(self):
+
+        self.stop_event.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+    def stats(self):
+
+        return 'Telemetry: %d frames recorded, %d dropped' % (self.recorded, self.dropped)
+
+
+def read_telemetry(path):
+    # Read a telemetry file (of either format) back as {field name: list of values}
+
+    columns = {name: [] for name in FIELD_NAMES}
+
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    if not data.startswith(MAGIC):
+        for line in data.decode().splitlines():
+            record = json.loads(line)
+            for name in FIELD_NAMES:
+                columns[name].append(record[name])
+        return columns
+
+    magic, version, spec_length = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError('unsupported telemetry version %d' % version)
+    offset = HEADER.size
+    fields = [field.split(':') for field in data[offset:offset + spec_length].decode().split(',')]
+    offset += spec_length
+
+    columns = {name: [] for name, _ in fields}
+    while offset < len(data):
+        (count,) = BLOCK.unpack_from(data, offset)
+        offset += BLOCK.size
+        for name, typecode in fields:
+            values = array.array(typecode)
+            values.frombytes(data[offset:offset + count * values.itemsize])
+            offset += count * values.itemsize
+            columns[name].extend(values)
+    return columns
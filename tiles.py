@@ -26,6 +26,12 @@ class AnimatedTile(pygame.sprite.Sprite):
 
         self.rect = self.image.get_rect(topleft=pos)
 
+    def reset(self):
+        # Back to the first frame, as when created
+
+        self.frame_index = 0
+        self.image = self.frames[self.frame_index]
+
     def animate(self, dt):
 
         self.frame_index += self.animation_speed * dt
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+# Records spans of time (e.g. each phase of a frame, building a level, a spikeball's A* search) as Chrome trace events,
+# so they can be seen on a timeline in Perfetto (ui.perfetto.dev) or chrome://tracing, where a hitch can be lined up
+# with whatever else was happening at the time (e.g. enemies spawning, or a level being built)
+#
+# Code is instrumented with `with span('name'):`, which records nothing (and costs next to nothing) unless a tracer
+# is active. Spans are written as complete ('X') events, with their start & duration in microseconds
+
+NO_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+
+    active = None  # The tracer spans are recorded to, if any
+
+    def __init__(self, path, max_events=1_000_000):
+        # Events after the first `max_events` are dropped, so a long session can't use up all the memory
+
+        self.path = path
+        self.max_events = max_events
+        self.events = []
+        self.dropped_events = 0
+        self.pid = os.getpid()
+        self.start_time = time.perf_counter_ns()
+
+    def activate(self):
+
+        Tracer.active = self
+
+    def deactivate(self):
+
+        if Tracer.active is self:
+            Tracer.active = None
+
+    def add_span(self, name, category, start_time, end_time, args):
+
+        if len(self.events) >= self.max_events:
+            self.dropped_events += 1
+            return
+
+        event = {
+            'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid, 'tid': threading.get_ident(),
+            'ts': (start_time - self.start_time) / 1000, 'dur': (end_time - start_time) / 1000
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def save(self):
+
+        with open(self.path, 'w') as file:
+            json.dump({
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'dropped_events': self.dropped_events}
+            }, file)
+
+
+class Span:
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start_time')
+
+    def __init__(self, tracer, name, category, args):
+
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+
+        self.start_time = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.tracer.add_span(self.name, self.category, self.start_time, time.perf_counter_ns(), self.args)
+
+
+def span(name, category='frame', **args):
+    # A context manager that records the time spent inside it to the active tracer (if any) as a span named `name`
+    # Any keyword arguments are shown with the span (e.g. which level was built)
+
+    tracer = Tracer.active
+    if tracer is None:
+        return NO_SPAN
+    return Span(tracer, name, category, args)
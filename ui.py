@@ -1,14 +1,15 @@
 import pygame
 from settings import *
 from util import import_image, import_folder_dict
+from instruments import Instrument
 
 
 class UI:
 
-    def __init__(self, font, game_data, powerup_assets):
+    def __init__(self, font, game_data, powerup_assets, display_surface=None):
 
         # Basic setup
-        self.display_surface = pygame.display.get_surface()
+        self.display_surface = display_surface if display_surface is not None else pygame.display.get_surface()
         self.font = font
         self.game_data = game_data
         self.powerup_assets = powerup_assets
@@ -109,3 +110,27 @@ class UI:
 
         if boss.sprite is not None:
             self.display_surface.blit(self.boss_health_strip, (0, GAME_HEIGHT))
+
+
+class DebugHUD(Instrument):
+    # Lines of debugging text drawn over the top left of the screen: the frame rate, and garbage collection timings if
+    # given a GCMonitor. As one of the game's instruments, it's drawn over every frame
+
+    def __init__(self, gc_monitor=None):
+
+        self.gc_monitor = gc_monitor
+
+    def frame_drawn(self, game):
+
+        lines = ['%.0f FPS' % game.clock.get_fps()]
+        if self.gc_monitor is not None:
+            lines.append(self.gc_monitor.hud_text())
+        self.display(lines, game.font, game.display_surface)
+
+    def display(self, lines, font, display_surface):
+
+        y = 0
+        for line in lines:
+            text_surf = font.render(line, False, 'white', 'black')
+            display_surface.blit(text_surf, (0, y))
+            y += text_surf.get_height()
@@ -1,6 +1,8 @@
 import os
 import math
+import array
 import pygame
+import random
 from settings import *
 
 
@@ -14,6 +16,16 @@ def rotate_vector(vector, angle):
     )
 
 
+def nearest_sprite(pos, sprites):
+    # The sprite whose centre is nearest to `pos`, or the first of those equally near (e.g. the player an enemy chases)
+
+    if len(sprites) == 1:
+        return sprites[0]
+
+    x, y = pos
+    return min(sprites, key=lambda s: (s.rect.centerx - x) ** 2 + (s.rect.centery - y) ** 2)
+
+
 def import_image(path_to_image, scale=ZOOM_FACTOR):
 
     return pygame.transform.scale_by(pygame.image.load(path_to_image).convert_alpha(), scale)
@@ -36,15 +48,99 @@ def import_folder_dict(path_to_folder, scale=ZOOM_FACTOR):
     }
 
 
+class GameClock:
+    # Game time in milliseconds, which everything in the game reads (through `get_ticks`) instead of the real time
+    # It only moves forward when the game is stepped, so stepping with the same time steps always gives the same
+    # times (needed to replay a run exactly), and no time passes while the game isn't being stepped
+
+    active = None  # The clock `get_ticks` reads from
+
+    def __init__(self):
+
+        self.ticks = 0
+        self.remainder = 0.0  # Fraction of a millisecond carried over between steps
+
+    def advance(self, dt):
+
+        self.remainder += dt * 1000
+        elapsed = int(self.remainder)
+        self.ticks += elapsed
+        self.remainder -= elapsed
+
+    def activate(self):
+
+        GameClock.active = self
+
+    def get_state(self):
+
+        return self.ticks, self.remainder
+
+    def set_state(self, state):
+
+        self.ticks, self.remainder = state
+
+
+GameClock.active = GameClock()
+
+
+def get_ticks():
+
+    return GameClock.active.ticks
+
+
+class RandomStreams:
+    # Named random number generators, all seeded from a single seed for the session
+    # Each part of the game draws from its own stream (e.g. drops, spawns), so the same seed and inputs always give
+    # the same run, and e.g. drawing an extra random number in one part of the game can't change what happens in another
+
+    def __init__(self, seed=None):
+
+        self.seed = seed if seed is not None else random.randrange(2 ** 63)
+        self.streams = {}
+        self.packed_states = {}  # name -> (internal state, packed), as most streams aren't drawn from between snapshots
+
+    def __getitem__(self, name):
+
+        if name not in self.streams:
+            self.streams[name] = random.Random('%s:%s' % (self.seed, name))
+        return self.streams[name]
+
+    def get_state(self):
+        # The generators' internal states are 625 32-bit integers, which we pack as bytes to keep snapshots small
+
+        stream_states = {}
+        for name, stream in self.streams.items():
+            version, internal_state, gauss_next = stream.getstate()
+            packed_state = self.packed_states.get(name)
+            if packed_state is None or packed_state[0] != internal_state:
+                packed_state = self.packed_states[name] = (internal_state, array.array('I', internal_state).tobytes())
+            stream_states[name] = (version, packed_state[1], gauss_next)
+
+        return self.seed, stream_states
+
+    def set_state(self, state):
+
+        # Streams are restored in place, as sprites can hold on to the stream they draw from (e.g. the boss)
+        self.seed, stream_states = state
+        for name in list(self.streams):
+            if name not in stream_states:
+                del self.streams[name]
+        for name, (version, internal_state, gauss_next) in stream_states.items():
+            self.streams.setdefault(name, random.Random()).setstate((version, tuple(array.array('I', internal_state)), gauss_next))
+
+
 class Timer:
+    # Calls `func` (if given) when the duration has passed since activated
+    # A repeating timer re-activates itself each time it runs out, like an interval
 
-    def __init__(self, duration, auto_start=False, func=None):
+    def __init__(self, duration, auto_start=False, func=None, repeat=False):
 
         self.duration = duration
         self.active = False
         self.start_time = None
         self.paused_time = None
         self.func = func
+        self.repeat = repeat
 
         if auto_start:
             self.activate()
@@ -52,7 +148,7 @@ class Timer:
     def percent_left(self):
 
         if self.active:
-            current_time = pygame.time.get_ticks() if self.paused_time is None else self.paused_time
+            current_time = get_ticks() if self.paused_time is None else self.paused_time
             # Could be a frame when hadn't updated and current time is past duration, so just cap at 0
             return max(0, 1 - ((current_time - self.start_time) / self.duration))
         else:
@@ -63,19 +159,19 @@ class Timer:
         assert self.paused_time is None
 
         self.active = True
-        self.start_time = pygame.time.get_ticks()
+        self.start_time = get_ticks()
 
     def pause(self):
 
         assert self.active
 
-        self.paused_time = pygame.time.get_ticks()
+        self.paused_time = get_ticks()
 
     def un_pause(self):
 
         assert self.active and self.paused_time is not None
 
-        paused_for = pygame.time.get_ticks() - self.paused_time
+        paused_for = get_ticks() - self.paused_time
         self.paused_time = None
         self.extend_timer(paused_for)
 
@@ -86,11 +182,11 @@ class Timer:
         assert self.paused_time is None
 
         if self.active:
-            current_time = pygame.time.get_ticks()
+            current_time = get_ticks()
             self.start_time += min(extension, current_time - self.start_time)
         else:
             self.active = True
-            self.start_time = pygame.time.get_ticks() - self.duration + extension
+            self.start_time = get_ticks() - self.duration + extension
 
     def deactivate(self):
 
@@ -99,11 +195,28 @@ class Timer:
         self.active = False
         self.start_time = None
 
+    def get_state(self):
+
+        return self.duration, self.active, self.start_time, self.paused_time
+
+    def set_state(self, state):
+
+        self.duration, self.active, self.start_time, self.paused_time = state
+
+    def reset(self):
+        # Put back to the state when created (not active & not paused), whatever state we're currently in
+
+        self.active = False
+        self.start_time = None
+        self.paused_time = None
+
     def update(self):
 
         if self.active and self.paused_time is None:
-            current_time = pygame.time.get_ticks()
+            current_time = get_ticks()
             if current_time - self.start_time >= self.duration:
                 self.deactivate()
+                if self.repeat:
+                    self.activate()
                 if self.func is not None:
                     self.func()